@@ -1,7 +1,10 @@
+import argparse
 import os
+import time
 from datetime import datetime
 from login_helper import login
 from order_status_map import STATUS_MAP
+from own_orders import OwnOrderBook
 from fubon_neo.constant import BSAction
 
 # 設定輸出目錄
@@ -109,8 +112,28 @@ def get_statistics(data):
     return total, filled, unfilled, cancelled, partial
 
 
+def print_event(event, order):
+    """監看模式：即時顯示委託與成交回報"""
+    now = datetime.now().strftime("%H:%M:%S")
+    if event == "fill":
+        fill = order.last_fill
+        print(
+            f"[{now}] 💰 成交 {order.stock_no}｜{fill.filled_qty:,} 股 @ {fill.filled_price}｜"
+            f"累計 {order.filled_qty:,}/{order.quantity:,}｜委託書號 {order.order_no}"
+        )
+    elif event in ("order", "changed"):
+        status_text = STATUS_MAP.get(order.status, f"未知狀態碼 {order.status}")
+        print(f"[{now}] 📝 委託 {order.stock_no}｜{status_text}｜{get_remark(order)}｜委託書號 {order.order_no}")
+
+
 def main():
     """主程式"""
+    parser = argparse.ArgumentParser(description="今日委託單報表")
+    parser.add_argument(
+        "-w", "--watch", action="store_true", help="報表後持續顯示委託與成交回報（Ctrl+C 結束）"
+    )
+    args = parser.parse_args()
+
     print("🔍 正在查詢今日委託單...")
 
     # 登入
@@ -122,28 +145,30 @@ def main():
         return
 
     try:
-        # 查詢委託結果
-        result = sdk.stock.get_order_results(account)
-
-        if not (result.is_success and result.data):
-            print(
-                "❌ 查詢失敗：",
-                result.message if hasattr(result, "message") else "無資料",
-            )
+        # 委託簿：一次查詢載入今日委託，之後由委託/成交回報即時更新
+        book = OwnOrderBook(sdk, account)
+        if not book.start():
+            print("❌ 查詢失敗：", book.error)
             return
 
+        data = book.orders()
+        if not data:
+            print("❌ 查詢失敗：無資料")
+            if not args.watch:
+                return
+
         # 顯示統計摘要
-        total, filled, unfilled, cancelled, partial = get_statistics(result.data)
+        total, filled, unfilled, cancelled, partial = get_statistics(data)
         print(
             f"\n📊 委託統計：總計 {total} 筆 | 成交 {filled} 筆 | 未成交 {unfilled} 筆 | 取消 {cancelled} 筆"
         )
 
         # 顯示完整委託報表
-        text = format_orders(result.data)
+        text = format_orders(data)
         print(f"\n{text}")
 
         # 顯示成交摘要
-        show_filled_summary(result.data)
+        show_filled_summary(data)
 
         # 輸出到檔案
         now = datetime.now().strftime("%Y%m%d_%H%M")
@@ -152,6 +177,19 @@ def main():
             f.write(text)
         print(f"\n✅ 檔案已輸出至 {file_path}")
 
+        if args.watch:
+            book.add_listener(print_event)
+            print("\n👀 監看委託與成交回報中（Ctrl+C 結束）...")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                book.remove_listener(print_event)
+                total, filled, unfilled, cancelled, partial = get_statistics(book.orders())
+                print(
+                    f"\n📊 結束時委託統計：總計 {total} 筆 | 成交 {filled} 筆 | 未成交 {unfilled} 筆 | 取消 {cancelled} 筆"
+                )
+
     except Exception as e:
         print(f"❌ 執行過程發生錯誤：{e}")
 
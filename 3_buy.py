@@ -5,6 +5,8 @@ from fubon_neo.constant import BSAction, MarketType, OrderType, PriceType, TimeI
 from fubon_neo.sdk import Order
 from order_status_map import STATUS_MAP
 from login_helper import login
+from order_latency import LatencyRecorder
+from pretrade import confirm_order_price
 
 # 全域變數
 sdk = None
@@ -74,7 +76,16 @@ def main():
 
     print(f"✅ 登入成功，帳號：{account.account}")
 
-    # 建立委託單
+    # 送單前檢查漲跌停與跳動單位
+    price = confirm_order_price(sdk, symbol, price)
+    if price is None:
+        sdk.logout()
+        return
+
+    # 建立委託單 (記錄建立、送出、回應到第一次狀態回報的延遲)
+    recorder = LatencyRecorder("3_buy")
+    recorder.attach(sdk)
+    timer = recorder.start(symbol, MarketType.IntradayOdd, "CLI")
     order = Order(
         buy_sell=action,
         symbol=symbol,
@@ -88,7 +99,14 @@ def main():
     )
 
     # 發送下單請求（同步模式）
-    result = sdk.stock.place_order(account, order, unblock=False)
+    timer.mark("submit")
+    try:
+        result = sdk.stock.place_order(account, order, unblock=False)
+    except Exception as e:
+        timer.fail(e)
+        recorder.flush(wait=0)
+        raise
+    timer.ack(result)
 
     if result.is_success and result.data:
         print("\n✅ 下單成功")
@@ -98,6 +116,9 @@ def main():
     else:
         print("\n❌ 下單失敗：", result.message)
 
+    recorder.flush()
+    print(timer.describe())
+
     # 登出
     if sdk.logout():
         print("\n✅ 已登出")
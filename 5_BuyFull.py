@@ -2,6 +2,8 @@ from fubon_neo.constant import BSAction, MarketType, OrderType, PriceType, TimeI
 from fubon_neo.sdk import Order
 from order_status_map import STATUS_MAP
 from login_helper import login
+from order_latency import LatencyRecorder
+from pretrade import confirm_order_price
 
 
 def print_order_result(order):
@@ -49,7 +51,16 @@ def main():
         print("❌ 請輸入有效的價格（數字）")
         return
 
-    # ==== 建立整股委託單 ====
+    # 送單前檢查漲跌停與跳動單位
+    price = confirm_order_price(sdk, symbol, price)
+    if price is None:
+        sdk.logout()
+        return
+
+    # ==== 建立整股委託單 (記錄建立、送出、回應到第一次狀態回報的延遲) ====
+    recorder = LatencyRecorder("5_BuyFull")
+    recorder.attach(sdk)
+    timer = recorder.start(symbol, MarketType.Common, "FullLot")
     order = Order(
         buy_sell=action,
         symbol=symbol,
@@ -62,7 +73,14 @@ def main():
         user_def="FullLot",
     )
 
-    result = sdk.stock.place_order(account, order, unblock=False)
+    timer.mark("submit")
+    try:
+        result = sdk.stock.place_order(account, order, unblock=False)
+    except Exception as e:
+        timer.fail(e)
+        recorder.flush(wait=0)
+        raise
+    timer.ack(result)
 
     if result.is_success and result.data:
         print_order_result(result.data)
@@ -71,6 +89,9 @@ def main():
     else:
         print("\n🔴 下單失敗：", result.message)
 
+    recorder.flush()
+    print(timer.describe())
+
     if sdk.logout():
         print("✅ 已登出")
     else:
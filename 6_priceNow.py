@@ -1,16 +1,32 @@
 import os
+import argparse
+import asyncio
 import glob
+import random
 import shutil
+import tempfile
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import twstock
-from queue import Queue
+from queue import Queue, Empty
+import ohlc_cache
+from security_master import get_shared_master
+from quote_provider import INTRADAY, close_router, get_router, parse_realtime_quote
 
 # === 設定路徑 ===
 BASE_DIR = "/home/botuser/FAngel/CatCage"
 OLD_DIR = os.path.join(BASE_DIR, "old")
 
+# 每次多檔即時報價請求的股票數
+QUOTE_CHUNK_SIZE = 50
+
+# 逐檔查詢：每個報價來源的同時連線數、重試次數與整體期限
+PER_PROVIDER_LIMIT = 3
+QUOTE_RETRIES = 2
+QUOTE_DEADLINE = 60
+
 
 def ensure_dirs():
     os.makedirs(OLD_DIR, exist_ok=True)
@@ -37,59 +53,171 @@ def read_symbols(path):
         return [line.strip() for line in f if line.strip()]
 
 
+def fetch_quote(stock_id):
+    """查詢單一股票報價（由報價路由器選擇最快且正常的來源，失敗時自動切換）
+
+    查無資料回傳 None，所有來源都錯誤時拋出例外供呼叫端重試。
+    """
+    return get_router().get(stock_id)
+
+
 def query_quote(stock_id):
-    """查詢單一股票報價（使用原本可運行的邏輯）"""
+    """查詢單一股票報價，發生錯誤時回傳 None"""
     try:
-        stock = twstock.Stock(stock_id)
-        latest = stock.data[-1] if stock.data else None
-        if not latest:
-            return None
-
-        # 使用原本的方式取得股票名稱
-        stock_name = "未知"
-        try:
-            if stock_id in twstock.codes:
-                stock_name = twstock.codes[stock_id].name
-        except (KeyError, AttributeError):
-            stock_name = "未知股票"
-
-        return {
-            "id": stock.sid,
-            "name": stock_name,
-            "date": latest.date,
-            "open": latest.open,
-            "high": latest.high,
-            "low": latest.low,
-            "close": latest.close,
-            "capacity": latest.capacity,
-        }
+        return fetch_quote(stock_id)
     except Exception as e:
         print(f"⚠️ 查詢 {stock_id} 發生錯誤：{e}")
         return None
 
 
+def query_quotes_cached(stock_ids):
+    """先取用已是最新盤後資料的本地日K快取 (不連線)
+
+    Returns:
+        (報價列表, 快取沒有的股票代號列表)
+    """
+    router = get_router()
+    quotes = []
+    missing = []
+    for stock_id in stock_ids:
+        quote = router.peek(stock_id)
+        if quote:
+            quotes.append(quote)
+        else:
+            missing.append(stock_id)
+    print(f"💾 本地快取命中 {len(quotes)} 檔，{len(missing)} 檔需要連線查詢")
+    return quotes, missing
+
+
+async def fetch_quote_async(stock_id, executor, retries=QUOTE_RETRIES):
+    """查詢單檔，連線錯誤時以指數退避加隨機抖動重試 (各來源的連線數由報價路由器限制)"""
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        try:
+            return await loop.run_in_executor(executor, fetch_quote, stock_id)
+        except Exception as e:
+            error = e
+        if attempt < retries:
+            await asyncio.sleep(0.5 * 2**attempt + random.uniform(0, 0.5))
+    print(f"⚠️ 查詢 {stock_id} 失敗（已重試 {retries} 次）：{error}")
+    return None
+
+
+async def _query_quotes_async(stock_ids, retries, deadline, executor):
+    tasks = [
+        asyncio.create_task(fetch_quote_async(stock_id, executor, retries))
+        for stock_id in stock_ids
+    ]
+
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f"⏰ 超過 {deadline} 秒期限，{len(pending)} 檔未完成")
+
+    # 依輸入順序回傳
+    return [
+        task.result() if task in done and not task.cancelled() else None
+        for task in tasks
+    ]
+
+
+def query_quotes_async(
+    stock_ids, per_provider=PER_PROVIDER_LIMIT, retries=QUOTE_RETRIES, deadline=QUOTE_DEADLINE
+):
+    """以 asyncio 逐檔查詢：每個報價來源限制同時連線數、單檔重試、整體期限
+
+    Returns:
+        依輸入順序排列的報價列表 (不含失敗的股票)
+    """
+    if not stock_ids:
+        return []
+
+    start_time = time.time()
+    print(f"📊 開始非同步查詢 {len(stock_ids)} 檔股票（每來源 {per_provider} 個連線）...")
+
+    # 請求實際送往哪個來源由路由器決定，連線數限制也設在路由器的各來源上
+    router = get_router()
+    router.set_concurrency(per_provider)
+
+    # 使用自己的執行緒池 (各來源 per_provider 個)：期限到時不等待仍在進行的查詢，
+    # asyncio.run 結束時只會等待預設執行緒池
+    executor = ThreadPoolExecutor(
+        max_workers=per_provider * len(router.providers), thread_name_prefix="quote"
+    )
+    try:
+        results = asyncio.run(_query_quotes_async(stock_ids, retries, deadline, executor))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    quotes = [quote for quote in results if quote]
+
+    elapsed = time.time() - start_time
+    print(f"⚡ 非同步查詢完成，成功 {len(quotes)} 檔，耗時 {elapsed:.1f} 秒")
+    return quotes
+
+
+def query_quotes_batch(stock_ids, chunk_size=QUOTE_CHUNK_SIZE):
+    """以多檔即時報價請求批次查詢 (每批 chunk_size 檔)
+
+    Returns:
+        (報價列表, 未取得報價的股票代號列表)
+    """
+    quotes = {}
+    start_time = time.time()
+    chunks = [stock_ids[i : i + chunk_size] for i in range(0, len(stock_ids), chunk_size)]
+
+    print(f"📊 開始批次查詢 {len(stock_ids)} 檔股票（{len(chunks)} 次請求）...")
+
+    for chunk in chunks:
+        try:
+            data = twstock.realtime.get(chunk)
+        except Exception as e:
+            print(f"⚠️ 批次查詢 {chunk[0]}~{chunk[-1]} 發生錯誤：{e}")
+            continue
+        if not data or not data.get("success"):
+            print(f"⚠️ 批次查詢 {chunk[0]}~{chunk[-1]} 失敗：{(data or {}).get('rtmessage', '無回應')}")
+            continue
+
+        for stock_id in chunk:
+            if stock_id in data:
+                quote = parse_realtime_quote(stock_id, data[stock_id])
+                if quote:
+                    quotes[stock_id] = quote
+
+    missing = [stock_id for stock_id in stock_ids if stock_id not in quotes]
+    elapsed = time.time() - start_time
+    print(f"⚡ 批次查詢完成，成功 {len(quotes)} 檔，耗時 {elapsed:.1f} 秒")
+
+    return [quotes[stock_id] for stock_id in stock_ids if stock_id in quotes], missing
+
+
+def merge_quotes(stock_ids, quotes):
+    """依股票代號合併多種查詢的結果，維持持股清單順序"""
+    by_id = {quote["id"]: quote for quote in quotes}
+    return [by_id[stock_id] for stock_id in stock_ids if stock_id in by_id]
+
+
 def query_quote_worker(stock_queue, result_queue):
     """工作執行緒：查詢股價"""
     while True:
         try:
             stock_id = stock_queue.get(timeout=1)
-            if stock_id is None:  # 結束信號
-                break
-
-            result = query_quote(stock_id)
-            if result:
-                result_queue.put(("success", stock_id, result))
-            else:
-                result_queue.put(("error", stock_id, "查詢失敗"))
+        except Empty:
+            break
+        if stock_id is None:  # 結束信號
+            break
 
-            stock_queue.task_done()
+        result = query_quote(stock_id)
+        if result:
+            result_queue.put(("success", stock_id, result))
+        else:
+            result_queue.put(("error", stock_id, "查詢失敗"))
 
-        except:  # Queue timeout
-            break
+        stock_queue.task_done()
 
 
 def query_quotes_concurrent(stock_ids, max_workers=3):
-    """併發查詢股價"""
+    """併發查詢股價（舊版執行緒佇列，保留供 --bench 比較）"""
     if not stock_ids:
         return []
 
@@ -131,7 +259,7 @@ def query_quotes_concurrent(stock_ids, max_workers=3):
             else:
                 print(f"❌ [{completed_count}/{len(stock_ids)}] {stock_id} - {data}")
 
-        except:  # Timeout
+        except Empty:
             print(f"⏰ 查詢超時，已完成 {completed_count}/{len(stock_ids)}")
             break
 
@@ -150,7 +278,7 @@ def query_quotes_concurrent(stock_ids, max_workers=3):
 
 
 def query_quotes_sequential(stock_ids):
-    """順序查詢股價（原本的方式，作為備案）"""
+    """順序查詢股價（原本的方式，保留供 --bench 比較）"""
     quotes = []
     total = len(stock_ids)
 
@@ -199,8 +327,54 @@ def format_quote_table(quotes):
     return "\n".join(lines)
 
 
+def run_benchmark(count):
+    """比較非同步、舊版併發與順序查詢的耗時
+
+    每種模式各使用一個空的日K快取目錄，避免後跑的模式直接命中快取。
+    """
+    master = get_shared_master()
+    if master is not None:
+        pool = [s for s, r in master.records.items() if r["category"] == "COMMONSTOCK"]
+    else:
+        pool = [s for s, c in twstock.codes.items() if c.type == "股票"]
+    symbols = sorted(pool)[:count]
+    print(f"🏁 基準測試：{len(symbols)} 檔股票\n")
+
+    modes = [
+        ("async", query_quotes_async),
+        ("concurrent", lambda ids: query_quotes_concurrent(ids, max_workers=3)),
+        ("sequential", query_quotes_sequential),
+    ]
+    original_dir = ohlc_cache.CACHE_DIR
+    rows = []
+    try:
+        for name, query in modes:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                ohlc_cache.CACHE_DIR = cache_dir
+                start_time = time.time()
+                quotes = query(symbols)
+                rows.append((name, len(quotes), time.time() - start_time))
+            print()
+    finally:
+        ohlc_cache.CACHE_DIR = original_dir
+
+    print(f"{'模式':<12}{'成功':>8}{'耗時(秒)':>10}{'檔/秒':>8}")
+    for name, success, elapsed in rows:
+        rate = len(symbols) / elapsed if elapsed else 0
+        print(f"{name:<12}{success:>6}/{len(symbols):<3}{elapsed:>8.1f}{rate:>8.1f}")
+
+
 # === 主程式 ===
 def main():
+    parser = argparse.ArgumentParser(description="持股報價查詢")
+    parser.add_argument(
+        "--bench", type=int, metavar="N", help="以 N 檔股票比較各查詢模式的耗時"
+    )
+    args = parser.parse_args()
+    if args.bench:
+        run_benchmark(args.bench)
+        return
+
     ensure_dirs()
     archive_old_quotes()
 
@@ -210,12 +384,18 @@ def main():
         print(f"✔️ 使用持股清單：{symbols_file}")
         print(f"📊 準備查詢 {len(symbols)} 檔股票")
 
-        # 嘗試併發查詢，失敗則使用順序查詢
-        try:
-            quotes = query_quotes_concurrent(symbols, max_workers=3)
-        except Exception as e:
-            print(f"⚠️ 併發查詢失敗（{e}），改用順序查詢...")
-            quotes = query_quotes_sequential(symbols)
+        # 不需要盤中價格時先用本地快取；其餘以多檔即時報價批次查詢，查不到的再逐檔查詢
+        if INTRADAY:
+            quotes, pending = [], symbols
+        else:
+            quotes, pending = query_quotes_cached(symbols)
+        if pending:
+            batch, missing = query_quotes_batch(pending)
+            quotes += batch
+            if missing:
+                print(f"🔁 {len(missing)} 檔改用逐檔查詢：{', '.join(missing)}")
+                quotes += query_quotes_async(missing)
+        quotes = merge_quotes(symbols, quotes)
 
         if quotes:
             # 生成並顯示報告
@@ -235,6 +415,9 @@ def main():
     except Exception as e:
         print(f"❌ 程式執行失敗：{e}")
 
+    finally:
+        close_router()
+
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,17 @@
-import twstock
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import unicodedata
+from security_master import get_shared_master, lookup_name
+from quote_provider import close_router, get_router
+
+# 互動模式：記憶體中報價的有效秒數與並行查詢數
+REPL_TTL = 60
+REPL_WORKERS = 5
+
+HEADER = "股票代號｜名稱　　　　｜日期　　　｜開盤　｜最高　｜最低　｜收盤　｜成交張數"
 
 # 中文名稱對齊
 
@@ -21,34 +32,89 @@ def pad_name(name, total_width=10):
 
 
 def query_quote(stock_id):
+    """由報價路由器查詢 (自動選擇最快且正常的來源)"""
     try:
-        stock = twstock.Stock(stock_id)
-        latest = stock.data[-1] if stock.data else None
-        if not latest:
-            return None
-
-        return {
-            "id": stock.sid,
-            "name": (
-                twstock.codes.get(stock.sid).name
-                if stock.sid in twstock.codes
-                else "未知"
-            ),
-            "date": latest.date,
-            "open": latest.open,
-            "high": latest.high,
-            "low": latest.low,
-            "close": latest.close,
-            "capacity": latest.capacity,
-        }
+        return get_router().get(stock_id)
     except Exception:
         return None
 
 
+def format_row(result):
+    return "{:<8}｜{}｜{}｜{:>6.2f}｜{:>6.2f}｜{:>6.2f}｜{:>6.2f}｜{:>10}".format(
+        result["id"],
+        pad_name(result["name"], 10),
+        result["date"].strftime("%Y-%m-%d"),
+        result["open"],
+        result["high"],
+        result["low"],
+        result["close"],
+        int(result["capacity"] / 1000),
+    )
+
+
+# 互動模式
+
+
+class QuoteRepl:
+    """常駐查詢：保留名稱表與最近查過的報價，一行可輸入多個代號並行查詢"""
+
+    def __init__(self, ttl=REPL_TTL, workers=REPL_WORKERS):
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.memo = {}  # stock_id -> (報價, 查詢時間)
+
+    def warm_up(self):
+        """預先載入商品主檔與 twstock 名稱表"""
+        get_shared_master()
+        lookup_name("2330")
+
+    def lookup(self, stock_ids):
+        """查詢多檔，記憶體中未過期的直接使用，其餘並行查詢；回傳依輸入順序的結果"""
+        now = time.monotonic()
+        misses = [
+            s
+            for s in dict.fromkeys(stock_ids)
+            if s not in self.memo or now - self.memo[s][1] > self.ttl
+        ]
+        for stock_id, result in zip(misses, self.executor.map(query_quote, misses)):
+            if result:
+                self.memo[stock_id] = (result, time.monotonic())
+        return [(s, self.memo[s][0] if s in self.memo else None) for s in stock_ids]
+
+    def run(self):
+        self.warm_up()
+        print("輸入股票代號查詢，可一次輸入多個（以空白或逗號分隔），q 離開")
+        while True:
+            try:
+                line = input("> ").strip()
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            if line.lower() in ("q", "quit", "exit"):
+                break
+            stock_ids = [s.upper() for s in re.split(r"[\s,]+", line) if s]
+            if not stock_ids:
+                continue
+
+            start = time.perf_counter()
+            results = self.lookup(stock_ids)
+            elapsed = (time.perf_counter() - start) * 1000
+
+            print(HEADER)
+            print("---------------------------------------------------------------")
+            for stock_id, result in results:
+                print(format_row(result) if result else f"{stock_id:<8}｜❌ 查無資料")
+            sources = sorted({r["source"] for _, r in results if r and "source" in r})
+            print(f"（{elapsed:.0f} ms，來源：{'、'.join(sources) or '無'}）\n")
+
+        self.executor.shutdown(wait=False)
+
+
 # 主互動邏輯
 
 
-def main():
+def check_once():
+    """單次查詢"""
     stock_id = input("請輸入股票代號（例如 2330）：").strip()
 
     print(f"\n查詢 {stock_id} 中...\n")
@@ -56,27 +122,26 @@ def main():
     result = query_quote(stock_id)
 
     if result:
-        name_fixed = pad_name(result["name"], 10)
-        print(
-            "股票代號｜名稱　　　　｜日期　　　｜開盤　｜最高　｜最低　｜收盤　｜成交張數"
-        )
+        print(HEADER)
         print("---------------------------------------------------------------")
-        print(
-            "{:<8}｜{}｜{}｜{:>6.2f}｜{:>6.2f}｜{:>6.2f}｜{:>6.2f}｜{:>10}".format(
-                result["id"],
-                name_fixed,
-                result["date"].strftime("%Y-%m-%d"),
-                result["open"],
-                result["high"],
-                result["low"],
-                result["close"],
-                int(result["capacity"] / 1000),
-            )
-        )
+        print(format_row(result))
         print("\n查詢時間：", datetime.now().strftime("%Y-%m-%d %H:%M"))
     else:
         print("❌ 查無資料，請確認股票代號是否正確。")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="個股報價查詢")
+    parser.add_argument("-i", "--repl", action="store_true", help="常駐互動模式")
+    args = parser.parse_args()
+    try:
+        if args.repl:
+            QuoteRepl().run()
+        else:
+            check_once()
+    finally:
+        close_router()
+
+
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 from login_helper import login
 from order_status_map import STATUS_MAP
+from own_orders import OwnOrderBook
 
 # 登入
 sdk, account = login()
@@ -8,17 +9,11 @@ print(f"✅ 登入成功，帳號：{account.account}")
 # 輸入股票代號
 stock_id = input("請輸入要取消的股票代號（如 2897）：").strip()
 
-# 查詢委託單
-result = sdk.stock.get_order_results(account)
+# 委託簿：一次查詢載入今日委託，依股票代號索引取出可刪單的委託
+book = OwnOrderBook(sdk, account)
 
-if result.is_success and result.data:
-    to_cancel = [
-        o
-        for o in result.data
-        if o.stock_no == stock_id
-        and o.filled_qty < o.quantity
-        and o.status not in [30, 40, 50]
-    ]
+if book.start():
+    to_cancel = book.open_orders(stock_id)
 
     if to_cancel:
         print(f"\n🔍 找到 {len(to_cancel)} 筆待取消的 {stock_id} 委託單：")
@@ -28,7 +23,7 @@ if result.is_success and result.data:
                 f"▶️ 委託書號 {order.order_no}｜數量 {order.quantity}｜成交 {order.filled_qty}｜價格 {order.price}｜時間 {order.last_time}｜狀態 {status_text}"
             )
 
-            cancel_result = sdk.stock.cancel_order(account, order)
+            cancel_result = sdk.stock.cancel_order(account, order.raw)
             if cancel_result.is_success:
                 print(f"✅ 取消成功：{order.order_no}")
             else:
@@ -36,7 +31,7 @@ if result.is_success and result.data:
     else:
         print(f"\n📭 沒有可取消的 {stock_id} 委託單")
 else:
-    print("❌ 查詢失敗：", result.message)
+    print("❌ 查詢失敗：", book.error)
 
 # 登出
 if sdk.logout():
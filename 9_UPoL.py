@@ -1,7 +1,10 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from login_helper import login
-from twstock import Stock, codes
+from security_master import lookup_name
+from quote_provider import close_router, get_router
 
 # 確保輸出目錄存在
 EXPORT_DIR = "/home/botuser/FAngel/CatCage/"
@@ -11,22 +14,45 @@ os.makedirs(EXPORT_DIR, exist_ok=True)
 def get_stock_name(stock_id):
     """查詢股票中文名稱"""
     try:
-        return codes[stock_id].name if stock_id in codes else "未知股票"
+        return lookup_name(stock_id, "未知股票")
     except Exception:
         return "查詢失敗"
 
 
 def get_current_price(stock_id):
-    """查詢當前股價"""
+    """查詢當前股價 (報價路由器會在來源異常時自動改用其他來源)"""
     try:
-        stock = Stock(stock_id)
-        if stock.data:
-            return stock.data[-1].close
-        return None
+        quote = get_router().get(stock_id)
+        return quote["close"] if quote else None
     except Exception:
         return None
 
 
+def take_price_snapshot(stock_ids, max_workers=5):
+    """一次並行查詢所有持股的名稱與現價，供畫面、詳細報告與總結共用
+
+    Returns:
+        {股票代號: {"name": 名稱, "price": 現價或 None}}
+    """
+    unique_ids = list(dict.fromkeys(stock_ids))
+    if not unique_ids:
+        return {}
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_ids))) as executor:
+        prices = list(executor.map(get_current_price, unique_ids))
+
+    snapshot = {
+        stock_id: {"name": get_stock_name(stock_id), "price": price}
+        for stock_id, price in zip(unique_ids, prices)
+    }
+    failed = sum(1 for price in prices if price is None)
+    print(
+        f"⚡ 股價快照：查詢 {len(unique_ids)} 檔（失敗 {failed} 檔），耗時 {time.time() - start_time:.1f} 秒"
+    )
+    return snapshot
+
+
 def calculate_profit_rate(cost_price, current_price):
     """計算獲利率"""
     if cost_price and current_price:
@@ -77,8 +103,11 @@ def generate_summary_report(data):
     }
 
 
-def create_detailed_report(data):
-    """建立詳細報告文字"""
+def create_detailed_report(data, snapshot=None):
+    """建立詳細報告文字，snapshot 為 take_price_snapshot 的結果 (未提供時自行查詢)"""
+    if snapshot is None:
+        snapshot = take_price_snapshot([item.stock_no for item in data])
+
     lines = []
     lines.append("=" * 80)
     lines.append("📊 未實現損益詳細報告")
@@ -94,8 +123,8 @@ def create_detailed_report(data):
     # 每檔股票詳細資訊
     total_unrealized = 0
     for item in data:
-        stock_name = get_stock_name(item.stock_no)
-        current_price = get_current_price(item.stock_no)
+        stock_name = snapshot[item.stock_no]["name"]
+        current_price = snapshot[item.stock_no]["price"]
 
         # 計算獲利率
         profit_rate = calculate_profit_rate(item.cost_price, current_price)
@@ -139,6 +168,8 @@ def main():
     try:
         sdk, account = login()
         print(f"✅ 登入成功，帳號：{account.account}")
+        # 報價的券商來源共用這次登入
+        get_router(sdk)
     except Exception as e:
         print(f"❌ 登入失敗：{e}")
         return
@@ -148,13 +179,16 @@ def main():
         result = sdk.accounting.unrealized_gains_and_loses(account)
 
         if result.is_success and result.data:
+            # 所有持股只查詢一次股價
+            snapshot = take_price_snapshot([item.stock_no for item in result.data])
+
             # 螢幕顯示簡化版
             print("\n📘 持股損益一覽：")
             print("-" * 60)
 
             for item in result.data:
-                stock_name = get_stock_name(item.stock_no)
-                current_price = get_current_price(item.stock_no)
+                stock_name = snapshot[item.stock_no]["name"]
+                current_price = snapshot[item.stock_no]["price"]
                 profit_rate = calculate_profit_rate(item.cost_price, current_price)
                 net_unrealized = (item.unrealized_profit or 0) - (
                     item.unrealized_loss or 0
@@ -171,7 +205,7 @@ def main():
                 print()
 
             # 產生詳細報告並儲存
-            detailed_report = create_detailed_report(result.data)
+            detailed_report = create_detailed_report(result.data, snapshot)
 
             # 儲存到檔案
             timestamp = datetime.now().strftime("%Y%m%d_%H%M")
@@ -202,6 +236,8 @@ def main():
         print(f"❌ 執行過程發生錯誤：{e}")
 
     finally:
+        close_router()
+
         # 登出
         try:
             if sdk.logout():
@@ -1,17 +1,30 @@
 from login_helper import login
+import argparse
 import time
 import threading
 import math
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import queue
+import heapq
+import multiprocessing
 import os
+from rate_limiter import RateLimiter
+from screen_rules import CANDLE_FIELDS, load_rules, score_metrics
+from security_master import ensure_security_master
 
 # 全域變數
 sdk = None
 reststock = None
 login_success = False
 
+# 市場代碼 (snapshot API) 與顯示名稱、備用 tickers 的交易所代碼
+MARKET_NAMES = {"TSE": "上市", "OTC": "上櫃"}
+FALLBACK_EXCHANGES = {"TSE": "TWSE", "OTC": "TPEx"}
+
+# 預設 API 限速 (次/秒)，所有市場與線程共用
+DEFAULT_RATE = 20
+
 
 def load_exclude_list(file_path="etf.list"):
     """讀取排除清單"""
@@ -48,6 +61,25 @@ def load_exclude_list(file_path="etf.list"):
     return exclude_symbols
 
 
+def load_exclusions(reststock):
+    """取得排除依據：etf.list 一律載入，有本地商品主檔時再併入主檔分類為 ETF 的代碼
+
+    Returns:
+        (商品主檔或 None, 排除代碼集合)
+    """
+    exclude_symbols = load_exclude_list("etf.list")
+    master = ensure_security_master(reststock)
+    if master is None:
+        print("無法取得商品主檔，改用排除清單與名稱關鍵字")
+        return None, exclude_symbols
+
+    print(f"使用商品主檔排除非普通股 ({len(master)} 檔，日期 {master.as_of})")
+    exclude_symbols |= {
+        symbol for symbol, record in master.records.items() if record["category"] == "ETF"
+    }
+    return master, exclude_symbols
+
+
 def login_thread():
     """登入線程"""
     global sdk, reststock, login_success
@@ -190,8 +222,15 @@ def analyze_order_book(quote_data):
     return has_signal, " | ".join(signals)
 
 
-def analyze_single_stock(stock_info, reststock):
-    """分析單一股票的函數 (供多線程使用)"""
+def analyze_single_stock(stock_info, reststock, limiter=None, rules=None, cutoff=None):
+    """取得單一股票的篩選指標 (供多線程使用)
+
+    只負責呼叫 API 與計算原始指標，門檻判斷與計分由 screen_rules 對
+    整批候選股一次完成。規則未用到量比時不呼叫 candles API。
+
+    cutoff() 回傳目前第 K 名分數 (或 None)；取得即時報價後分數上限已低於該分數時
+    不再查詢 K 線，回傳的指標帶有 pruned=True。
+    """
     symbol = stock_info.get("symbol", "")
     name = stock_info.get("name", "")
 
@@ -200,20 +239,16 @@ def analyze_single_stock(stock_info, reststock):
 
     try:
         # 取得股票資料
+        if limiter:
+            limiter.acquire()
         quote = reststock.intraday.quote(symbol=symbol)
 
         if not quote:
             return None
 
-        # 第二階段篩選：技術條件
-        required_pass = []  # 必要條件
-        bonus_pass = []  # 加分條件
-
-        # 成交量已在第一階段篩選，這裡只需記錄
         trade_volume = quote.get("total", {}).get("tradeVolume", 0)
-        required_pass.append(f"量{trade_volume:,}張")
 
-        # 必要條件：價格波動篩選
+        # 日內波動
         high_price = quote.get("highPrice", 0)
         low_price = quote.get("lowPrice", 0)
         ref_price = quote.get("referencePrice", 0) or quote.get("previousClose", 0)
@@ -221,267 +256,366 @@ def analyze_single_stock(stock_info, reststock):
         price_range = 0
         if ref_price > 0:
             price_range = ((high_price - low_price) / ref_price) * 100
-            if price_range >= 2.0:  # 日內波動 >= 2%
-                required_pass.append(f"波動{price_range:.1f}%")
-
-        # 如果必要條件未全部通過，返回None
-        if len(required_pass) < 2:
-            return None
 
-        # 加分條件：量比篩選 (簡化版)
-        vol_ratio = 0
-        try:
-            candles_5m = reststock.intraday.candles(symbol=symbol, timeframe="5")
-            if candles_5m and candles_5m.get("data") and len(candles_5m["data"]) >= 2:
-                data = candles_5m["data"]
-                current_vol = data[-1].get("volume", 0)
-                prev_vol = data[-2].get("volume", 1)
-                vol_ratio = current_vol / prev_vol if prev_vol > 0 else 0
-        except:
-            vol_ratio = 0
-
-        if vol_ratio >= 2.0:  # 量比 >= 2.0
-            bonus_pass.append(f"量比{vol_ratio:.1f}")
-
-        # 加分條件：開盤動能篩選 (簡化版)
+        # 開盤動能 (簡化版)
         momentum = 0
+        current_price = quote.get("lastPrice") or quote.get("closePrice", 0)
         try:
             open_price = quote.get("openPrice", 0)
-            current_price = quote.get("lastPrice") or quote.get("closePrice", 0)
             if open_price > 0:
                 momentum = abs((current_price - open_price) / open_price) * 100
         except:
             momentum = 0
 
-        if momentum >= 1.5:  # 開盤動能 >= 1.5%
-            bonus_pass.append(f"動能{momentum:.1f}%")
-
-        # 加分條件：VWAP乖離篩選 (簡化版)
-        current_price = quote.get("lastPrice") or quote.get("closePrice", 0)
+        # VWAP乖離 (簡化版) - 使用當日均價估算
         vwap_dev = 0
-
-        # 簡化VWAP計算 - 使用當日均價估算
         avg_price = quote.get("avgPrice", 0)
         if avg_price > 0 and current_price > 0:
             vwap_dev = abs((current_price - avg_price) / avg_price) * 100
-            if vwap_dev >= 0.7:  # VWAP乖離 >= 0.7%
-                bonus_pass.append(f"VWAP{vwap_dev:.1f}%")
 
         # 型態和掛單分析
         breakthrough, breakthrough_signal = check_price_breakthrough(quote)
         order_signal, order_detail = analyze_order_book(quote)
 
-        # 計算綜合分數
-        base_score = len(required_pass)  # 基礎分數 (2分)
-        bonus_score = len(bonus_pass)  # 加分項目
-        extra_score = 0
-
-        # 額外加分項目
-        if breakthrough:
-            extra_score += 1
-        if order_signal:
-            extra_score += 1
-
-        total_score = base_score + bonus_score + extra_score
-
-        change = quote.get("change", 0)
-        change_pct = quote.get("changePercent", 0)
-
-        # 組合所有通過條件
-        all_conditions = required_pass + bonus_pass
-
-        return {
+        metrics = {
             "symbol": symbol,
             "name": name,
+            "market": stock_info.get("market", ""),
             "price": current_price,
-            "change": change,
-            "change_pct": change_pct,
+            "change": quote.get("change", 0),
+            "change_pct": quote.get("changePercent", 0),
             "volume": trade_volume,
             "price_range": price_range,
-            "vol_ratio": vol_ratio,
+            "vol_ratio": 0,
             "momentum": momentum,
             "vwap_dev": vwap_dev,
-            "required_pass": required_pass,
-            "bonus_pass": bonus_pass,
-            "all_conditions": all_conditions,
-            "breakthrough": breakthrough_signal,
-            "order_signal": order_detail,
-            "base_score": base_score,
-            "bonus_score": bonus_score,
-            "extra_score": extra_score,
-            "total_score": total_score,
+            "breakthrough": breakthrough,
+            "breakthrough_signal": breakthrough_signal,
+            "order_signal": order_signal,
+            "order_detail": order_detail,
         }
 
+        # 量比 (簡化版)
+        if rules is None or rules.uses("vol_ratio"):
+            threshold = cutoff() if cutoff else None
+            if threshold is not None and rules.upper_bound_one(metrics) < threshold:
+                metrics["pruned"] = True
+                return metrics
+            try:
+                if limiter:
+                    limiter.acquire()
+                candles_5m = reststock.intraday.candles(symbol=symbol, timeframe="5")
+                if (
+                    candles_5m
+                    and candles_5m.get("data")
+                    and len(candles_5m["data"]) >= 2
+                ):
+                    data = candles_5m["data"]
+                    current_vol = data[-1].get("volume", 0)
+                    prev_vol = data[-2].get("volume", 1)
+                    metrics["vol_ratio"] = current_vol / prev_vol if prev_vol > 0 else 0
+            except:
+                metrics["vol_ratio"] = 0
+
+        return metrics
+
     except Exception as e:
         return None
 
 
-def screen_stocks(reststock):
-    """股票篩選主程式"""
-    # 載入排除清單
-    exclude_symbols = load_exclude_list("etf.list")
+def filter_snapshot(all_stocks, exclude_symbols, master=None):
+    """第一階段篩選：依商品主檔 (或排除清單、關鍵字) 與成交量過濾快照資料"""
+    filtered_stocks = []
 
-    # 第一階段：建立精確的候選池
-    try:
-        print("第一階段：建立候選池")
-        print("正在取得全市場上市股票資料...")
+    # 排除清單統計
+    exclude_keywords = ["ETF", "ETN", "債", "期"]
+    stats = {
+        "by_master": 0,
+        "by_list": 0,
+        "by_keyword": 0,
+        "no_volume": 0,
+        "low_volume": 0,
+    }
 
-        # 使用 snapshot/quotes 取得全市場上市股票
-        market_snapshot = reststock.snapshot.quotes(market="TSE", type="COMMONSTOCK")
+    for stock in all_stocks:
+        symbol = stock.get("symbol", "")
+        name = stock.get("name", "")
+        volume = stock.get("tradeVolume", 0)
 
-        if not market_snapshot or not market_snapshot.get("data"):
-            print("無法取得市場快照資料")
-            return []
+        if not symbol or not name:
+            continue
 
-        all_stocks = market_snapshot["data"]
-        print(f"取得 {len(all_stocks)} 檔上市股票資料")
+        # 1. 商品主檔標示為非普通股 (O(1) 查詢)
+        if master is not None and master.is_common_stock(symbol) is False:
+            stats["by_master"] += 1
 
-        # 第一階段篩選條件
-        print("正在進行第一階段篩選...")
-        filtered_stocks = []
+        # 排除清單與名稱關鍵字一律檢查，避免主檔分類有誤時放入 ETF 等商品
+        elif symbol in exclude_symbols:
+            stats["by_list"] += 1
 
-        # 排除清單統計
-        exclude_keywords = ["ETF", "ETN", "債", "期"]
-        excluded_by_keyword = 0
-        excluded_by_list = 0
-        excluded_no_volume = 0
-        excluded_low_volume = 0
+        # 2. 檢查名稱是否包含排除關鍵字
+        elif any(keyword in name for keyword in exclude_keywords):
+            stats["by_keyword"] += 1
 
-        for stock in all_stocks:
-            symbol = stock.get("symbol", "")
-            name = stock.get("name", "")
-            volume = stock.get("tradeVolume", 0)
+        # 3. 檢查是否停牌（無成交量）
+        elif volume == 0:
+            stats["no_volume"] += 1
 
-            if not symbol or not name:
-                continue
+        # 4. 檢查成交量是否 >= 2,000張
+        elif volume < 2000:
+            stats["low_volume"] += 1
 
-            # 排除條件檢查
-            should_exclude = False
-            exclude_reason = ""
-
-            # 1. 檢查是否在排除清單中
-            if symbol in exclude_symbols:
-                should_exclude = True
-                exclude_reason = "排除清單"
-                excluded_by_list += 1
-
-            # 2. 檢查名稱是否包含排除關鍵字
-            elif any(keyword in name for keyword in exclude_keywords):
-                should_exclude = True
-                exclude_reason = "關鍵字"
-                excluded_by_keyword += 1
-
-            # 3. 檢查是否停牌（無成交量）
-            elif volume == 0:
-                should_exclude = True
-                exclude_reason = "停牌"
-                excluded_no_volume += 1
-
-            # 4. 檢查成交量是否 >= 2,000張
-            elif volume < 2000:
-                should_exclude = True
-                exclude_reason = "成交量不足"
-                excluded_low_volume += 1
-
-            # 如果通過所有檢查，加入候選池
-            if not should_exclude:
-                filtered_stocks.append(
-                    {
-                        "symbol": symbol,
-                        "name": name,
-                        "volume": volume,
-                        "price": stock.get("closePrice", 0),
-                        "change_pct": stock.get("changePercent", 0),
-                    }
-                )
+        # 通過所有檢查，加入候選池
+        else:
+            close_price = stock.get("closePrice", 0)
+            open_price = stock.get("openPrice", 0)
+            prev_close = close_price - stock.get("change", 0)
+
+            # 快照即可算出的指標，供規則預篩
+            price_range = 0
+            if prev_close > 0:
+                price_range = (
+                    (stock.get("highPrice", 0) - stock.get("lowPrice", 0)) / prev_close
+                ) * 100
+            momentum = 0
+            if open_price > 0:
+                momentum = abs((close_price - open_price) / open_price) * 100
+
+            filtered_stocks.append(
+                {
+                    "symbol": symbol,
+                    "name": name,
+                    "volume": volume,
+                    "price": close_price,
+                    "change_pct": stock.get("changePercent", 0),
+                    "price_range": price_range,
+                    "momentum": momentum,
+                }
+            )
 
-        # 按成交量排序 (大到小)
-        filtered_stocks.sort(key=lambda x: x["volume"], reverse=True)
+    # 按成交量排序 (大到小)
+    filtered_stocks.sort(key=lambda x: x["volume"], reverse=True)
+    return filtered_stocks, stats
 
-        print(f"第一階段篩選完成:")
-        print(f"   原始股票: {len(all_stocks)} 檔")
-        print(
-            f"   篩選條件: 排除清單 + 排除ETF/ETN/債券/期貨 + 排除停牌股 + 成交量>=2,000張"
-        )
-        print(f"   候選池: {len(filtered_stocks)} 檔符合條件")
 
-        if len(filtered_stocks) == 0:
-            print("沒有股票符合第一階段條件！")
-            return []
+def build_candidate_pool(
+    reststock, exclude_symbols, market="TSE", limiter=None, rules=None, master=None
+):
+    """第一階段：取得單一市場快照並建立候選池
 
-        # 顯示詳細篩選統計
-        print(f"排除統計:")
-        print(f"   排除清單: {excluded_by_list} 檔")
-        print(f"   ETF/ETN/債券/期貨關鍵字: {excluded_by_keyword} 檔")
-        print(f"   停牌無交易: {excluded_no_volume} 檔")
-        print(f"   成交量<2,000張: {excluded_low_volume} 檔")
-        print(
-            f"   總排除: {excluded_by_list + excluded_by_keyword + excluded_no_volume + excluded_low_volume} 檔"
-        )
+    rules 若有提供，只需快照欄位即可判斷的必要條件會在此整批預篩，
+    減少第二階段的逐檔 API 呼叫。
 
-        # 顯示候選池前10大
-        print(f"\n候選池成交量前10大:")
-        print(f"{'排名':<4} {'代碼':<8} {'股名':<12} {'成交量(張)':<12} {'漲跌幅':<8}")
-        print("-" * 50)
+    Returns:
+        (候選池, 快照股票數, 排除統計)，無法取得快照時回傳 None
+    """
+    if limiter:
+        limiter.acquire()
 
-        for i, stock in enumerate(filtered_stocks[:10], 1):
-            print(
-                f"{i:<4} {stock['symbol']:<8} {stock['name']:<12} {stock['volume']:>10,} {stock['change_pct']:>+6.2f}%"
-            )
+    # 使用 snapshot/quotes 取得全市場股票
+    market_snapshot = reststock.snapshot.quotes(market=market, type="COMMONSTOCK")
 
-        # 重新組織成原來的格式供後續分析
-        stock_list = [
-            {"symbol": s["symbol"], "name": s["name"]} for s in filtered_stocks
-        ]
+    if not market_snapshot or not market_snapshot.get("data"):
+        return None
 
-        # 分析設定：分析全部符合條件的股票
-        total_candidates = len(stock_list)
-        analyze_count = total_candidates
+    all_stocks = market_snapshot["data"]
+    filtered_stocks, stats = filter_snapshot(all_stocks, exclude_symbols, master)
 
-        print(f"\n第二階段分析設定:")
-        print(f"將對全部 {analyze_count} 檔候選股票進行技術分析")
+    if rules is not None and filtered_stocks:
+        mask = rules.prefilter(filtered_stocks)
+        stats["by_rule"] = int(len(filtered_stocks) - mask.sum())
+        filtered_stocks = [s for s, keep in zip(filtered_stocks, mask) if keep]
 
-    except Exception as e:
-        print(f"第一階段篩選失敗: {e}")
-        print("嘗試使用備用方法...")
+    for stock in filtered_stocks:
+        stock["market"] = market
+    return filtered_stocks, len(all_stocks), stats
 
-        # 備用方法：原來的方式
-        try:
-            tickers = reststock.intraday.tickers(
-                type="EQUITY", exchange="TWSE", isNormal=True
-            )
-            stock_list = tickers.get("data", [])[:100] if tickers else []
-            analyze_count = len(stock_list)
-            print(f"使用備用方法，分析 {analyze_count} 檔股票")
-        except:
-            return []
 
-    # 第二階段：多線程技術分析
-    print("\n第二階段：多線程技術分析")
-    print("=" * 80)
+def print_candidate_pool(market, filtered_stocks, total, stats):
+    """顯示單一市場的第一階段篩選結果"""
+    market_name = MARKET_NAMES.get(market, market)
+    print(f"\n[{market_name}] 取得 {total} 檔股票資料")
+    print(f"第一階段篩選完成:")
+    print(f"   原始股票: {total} 檔")
+    print(
+        f"   篩選條件: 商品主檔/排除清單 + 排除ETF/ETN/債券/期貨 + 排除停牌股 + 成交量>=2,000張"
+    )
+    print(f"   候選池: {len(filtered_stocks)} 檔符合條件")
+
+    if len(filtered_stocks) == 0:
+        print("沒有股票符合第一階段條件！")
+        return
+
+    # 顯示詳細篩選統計
+    print(f"排除統計:")
+    print(f"   商品主檔(非普通股): {stats.get('by_master', 0)} 檔")
+    print(f"   排除清單: {stats['by_list']} 檔")
+    print(f"   ETF/ETN/債券/期貨關鍵字: {stats['by_keyword']} 檔")
+    print(f"   停牌無交易: {stats['no_volume']} 檔")
+    print(f"   成交量<2,000張: {stats['low_volume']} 檔")
+    if "by_rule" in stats:
+        print(f"   規則預篩(快照): {stats['by_rule']} 檔")
+    print(f"   總排除: {sum(stats.values())} 檔")
+
+    # 顯示候選池前10大
+    print(f"\n候選池成交量前10大:")
+    print(f"{'排名':<4} {'代碼':<8} {'股名':<12} {'成交量(張)':<12} {'漲跌幅':<8}")
+    print("-" * 50)
+
+    for i, stock in enumerate(filtered_stocks[:10], 1):
+        print(
+            f"{i:<4} {stock['symbol']:<8} {stock['name']:<12} {stock['volume']:>10,} {stock['change_pct']:>+6.2f}%"
+        )
 
-    # 篩選條件說明
-    print(f"篩選條件:")
-    print(f"成交量 >= 2,000張 (必要) - 第一階段已篩選")
-    print(f"日內波動 >= 2.0% (必要)")
-    print(f"量比 >= 2.0 (加分)")
-    print(f"開盤動能 >= 1.5% (加分)")
-    print(f"VWAP乖離 >= 0.7% (加分)")
-    print("符合越多加分條件，排序越優先!")
-    print("=" * 80)
 
-    # 多線程設定
-    max_workers = min(10, len(stock_list))  # 最多10個線程，避免API限制
+def fetch_market_pools(
+    reststock, exclude_symbols, markets, executor, limiter=None, rules=None, master=None
+):
+    """透過共用線程池並行取得各市場候選池
 
-    qualified_stocks = []
+    Returns:
+        {market: {"pool": 候選池或 None, "total": 快照股票數, "stats": 排除統計,
+                  "snapshot_time": 秒數, "error": 錯誤訊息}}
+    """
+
+    def fetch(market):
+        start = time.time()
+        info = {"pool": None, "total": 0, "stats": {}, "error": ""}
+        try:
+            result = build_candidate_pool(
+                reststock, exclude_symbols, market, limiter, rules, master
+            )
+            if result is None:
+                info["error"] = "無法取得市場快照資料"
+            else:
+                info["pool"], info["total"], info["stats"] = result
+        except Exception as e:
+            info["error"] = str(e)
+        info["snapshot_time"] = time.time() - start
+        return info
+
+    futures = {market: executor.submit(fetch, market) for market in markets}
+    return {market: future.result() for market, future in futures.items()}
+
+
+def fallback_stock_list(reststock, market):
+    """備用方法：以 tickers 取得股票清單"""
+    tickers = reststock.intraday.tickers(
+        type="EQUITY", exchange=FALLBACK_EXCHANGES.get(market, "TWSE"), isNormal=True
+    )
+    stock_list = tickers.get("data", [])[:100] if tickers else []
+    for stock in stock_list:
+        stock["market"] = market
+    return stock_list
+
+
+class TopK:
+    """固定大小的最小堆積，隨結果到達即時維護前 K 名"""
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []  # (rank_key, 序號, 結果)
+        self.seq = 0
+        self.lock = threading.Lock()  # threshold 會由工作線程讀取
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, key, item):
+        """加入一筆結果，回傳前 K 名是否有變動"""
+        with self.lock:
+            self.seq += 1
+            entry = (key, -self.seq, item)
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+                return True
+            if entry[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry)
+                return True
+            return False
+
+    def threshold(self):
+        """目前第 K 名的總分 (未滿 K 名時為 None)"""
+        with self.lock:
+            if len(self.heap) < self.k:
+                return None
+            return self.heap[0][0][0]
+
+    def ranked(self):
+        with self.lock:
+            heap = list(self.heap)
+        return [item for _, _, item in sorted(heap, reverse=True)]
+
+
+def print_leaderboard(board, processed, total, elapsed):
+    """顯示即時排行榜"""
+    print(f"\n即時排行 (已分析 {processed}/{total}，{elapsed:.1f} 秒)")
+    print("-" * 60)
+    for i, stock in enumerate(board.ranked(), 1):
+        print(
+            f"{i:>2}. {stock['symbol']:<8} {stock['name'][:8]:<12} "
+            f"{stock['price']:<8.1f} {stock['change_pct']:+.1f}% {stock['total_score']:g}分"
+        )
+    print("-" * 60)
+
+
+def analyze_candidates(
+    stock_list,
+    reststock,
+    verbose=True,
+    executor=None,
+    limiter=None,
+    market_stats=None,
+    rules=None,
+    top_k=0,
+    early_stop=False,
+    refresh=2.0,
+):
+    """第二階段：多線程取得指標，再以規則集整批評分，回傳符合條件的股票
+
+    executor/limiter 可由呼叫端傳入，讓多個市場共用同一個線程池與限速器；
+    market_stats 若有提供，會累計各市場的分析檔數、合格檔數與完成時間。
+
+    top_k > 0 時結果一到就排入前 K 名堆積並定期顯示即時排行；
+    early_stop 時依快照估計分數由高到低處理 (前 K 名較早確定)，
+    每檔取得即時報價後若分數上限已低於目前第 K 名，就不再查詢 K 線並排除該檔。
+    快照欄位在第二階段會重算，無法在查詢報價前判斷，因此不會略過報價查詢。
+    """
+    analyze_count = len(stock_list)
+    if analyze_count == 0:
+        return []
+
+    if rules is None:
+        rules = load_rules(None)
+
+    board = TopK(top_k) if top_k > 0 else None
+    cutoff = None
+    if board is not None and early_stop:
+        # 快照估計分數高的先處理，第 K 名分數越早拉高，越多股票可略過 K 線查詢；
+        # 是否略過則只依報價後的分數上限 (保證不低於實際分數) 判斷
+        estimate = rules.estimate_scores(stock_list)
+        order = sorted(range(analyze_count), key=lambda i: estimate[i], reverse=True)
+        stock_list = [stock_list[i] for i in order]
+        cutoff = board.threshold
+
+    own_executor = executor is None
+    if own_executor:
+        # 多線程設定
+        max_workers = min(10, analyze_count)  # 最多10個線程，避免API限制
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    metrics = []
     processed = 0
+    skipped = 0
     start_time = time.time()
+    last_refresh = start_time
 
-    # 使用 ThreadPoolExecutor 進行多線程處理
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    try:
         # 提交所有任務到線程池
         future_to_stock = {
-            executor.submit(analyze_single_stock, stock, reststock): stock
+            executor.submit(
+                analyze_single_stock, stock, reststock, limiter, rules, cutoff
+            ): stock
             for stock in stock_list
         }
 
@@ -490,56 +624,434 @@ def screen_stocks(reststock):
             processed += 1
             stock = future_to_stock[future]
 
-            # 顯示進度和速度
-            elapsed = time.time() - start_time
-            rate = processed / elapsed if elapsed > 0 else 0
-            eta = (analyze_count - processed) / rate if rate > 0 else 0
-
-            print(
-                f"分析中... {processed}/{analyze_count} "
-                f"({processed/analyze_count*100:.1f}%) "
-                f"速度:{rate:.1f}檔/秒 預計剩餘:{eta:.0f}秒",
-                end="\r",
-            )
+            if verbose and board is None:
+                # 顯示進度和速度
+                elapsed = time.time() - start_time
+                rate = processed / elapsed if elapsed > 0 else 0
+                eta = (analyze_count - processed) / rate if rate > 0 else 0
+
+                print(
+                    f"分析中... {processed}/{analyze_count} "
+                    f"({processed/analyze_count*100:.1f}%) "
+                    f"速度:{rate:.1f}檔/秒 預計剩餘:{eta:.0f}秒",
+                    end="\r",
+                )
 
             try:
                 result = future.result()
-                if result:  # 如果股票符合條件
-                    qualified_stocks.append(result)
             except Exception as e:
                 # 個別股票分析失敗不影響整體
+                result = None
+
+            if result and result.get("pruned"):
+                # 分數上限已無法進入前 K 名
+                skipped += 1
+                result = None
+
+            if result:
+                metrics.append(result)
+
+            if market_stats is not None:
+                entry = market_stats.setdefault(
+                    stock.get("market", ""), {"analyzed": 0, "qualified": 0}
+                )
+                entry["analyzed"] += 1
+                entry["analysis_time"] = time.time() - start_time
+
+            if board is None:
+                continue
+
+            # 串流排名
+            scores = rules.score_one(result) if result else None
+            changed = False
+            if scores:
+                ranked = dict(result, **scores)
+                changed = board.push(rank_key(ranked), ranked)
+
+            now = time.time()
+            if verbose and changed and now - last_refresh >= refresh:
+                print_leaderboard(board, processed, analyze_count, now - start_time)
+                last_refresh = now
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    # 整批評分 (向量運算)
+    qualified_stocks = score_metrics(rules, metrics)
+
+    if market_stats is not None:
+        for stock in qualified_stocks:
+            market_stats.setdefault(
+                stock.get("market", ""), {"analyzed": 0, "qualified": 0}
+            )["qualified"] += 1
+
+    if verbose:
+        total_time = time.time() - start_time
+        if board is not None:
+            print_leaderboard(board, processed, analyze_count, total_time)
+        print(
+            f"\n第二階段完成！耗時 {total_time:.1f} 秒，平均 {processed/total_time:.1f} 檔/秒"
+        )
+        if skipped:
+            print(f"分數上限無法進入前{top_k}名，略過 {skipped} 檔的K線查詢")
+        print("=" * 80)
+    return qualified_stocks
+
+
+def shard_worker(shard_id, stock_list, rules_path, rate, max_workers, result_queue):
+    """分片工作程序：自行登入、獨立限速，逐檔分析後將結果放入共用佇列
+
+    佇列訊息:
+        ("result", 分片編號, 股票, 指標或 None)
+        ("done", 分片編號, 分片統計)
+    """
+    start = time.time()
+    info = {
+        "shard": shard_id,
+        "count": len(stock_list),
+        "analyzed": 0,
+        "login_time": 0.0,
+        "waited": 0.0,
+        "error": "",
+    }
+    shard_sdk = None
+    try:
+        # 每個分片使用自己的 SDK 連線與限速額度
+        shard_sdk, _ = login()
+        shard_sdk.init_realtime()
+        shard_rest = shard_sdk.marketdata.rest_client.stock
+        info["login_time"] = time.time() - start
+
+        rules = load_rules(rules_path)
+        limiter = RateLimiter(rate)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_stock = {
+                executor.submit(
+                    analyze_single_stock, stock, shard_rest, limiter, rules
+                ): stock
+                for stock in stock_list
+            }
+            for future in as_completed(future_to_stock):
+                try:
+                    result = future.result()
+                except Exception:
+                    result = None
+                info["analyzed"] += 1
+                result_queue.put(("result", shard_id, future_to_stock[future], result))
+
+        info["waited"] = limiter.waited
+    except Exception as e:
+        info["error"] = str(e)
+    finally:
+        if shard_sdk is not None:
+            try:
+                shard_sdk.logout()
+            except Exception:
                 pass
+        info["elapsed"] = time.time() - start
+        result_queue.put(("done", shard_id, info))
+
+
+def partition_candidates(stock_list, shards):
+    """依序輪流分配候選股 (候選池已依成交量排序，各分片負載較平均)"""
+    return [stock_list[i::shards] for i in range(shards)]
+
+
+def print_shard_summary(shard_infos):
+    """顯示各分片耗時"""
+    print(f"\n各分片摘要:")
+    print(
+        f"{'分片':<6} {'檔數':<8} {'已分析':<8} {'登入(秒)':<10} {'總耗時(秒)':<12} {'限速等待(秒)':<12} 狀態"
+    )
+    print("-" * 75)
+    for shard_id in sorted(shard_infos):
+        info = shard_infos[shard_id]
+        print(
+            f"{shard_id:<6} {info.get('count', 0):<8} {info.get('analyzed', 0):<8} "
+            f"{info.get('login_time', 0):<10.1f} {info.get('elapsed', 0):<12.1f} "
+            f"{info.get('waited', 0):<12.1f} {info.get('error') or '完成'}"
+        )
+    print("-" * 75)
+
+
+def analyze_candidates_sharded(
+    stock_list,
+    shards,
+    rules_path=None,
+    rate=DEFAULT_RATE,
+    max_workers=10,
+    verbose=True,
+    market_stats=None,
+    top_k=0,
+    refresh=2.0,
+):
+    """第二階段 (分片模式)：將候選股分給多個工作程序，結果經共用佇列彙整
+
+    每個工作程序各自登入並擁有自己的限速器與線程池，
+    避開單一程序內 Python 評分與解析 JSON 的 GIL 競爭。
+    規則集含編譯後的函數無法跨程序傳遞，因此傳入規則檔路徑由各程序自行載入。
+    """
+    analyze_count = len(stock_list)
+    if analyze_count == 0:
+        return []
+
+    rules = load_rules(rules_path)
+    shards = max(1, min(shards, analyze_count))
+    ctx = multiprocessing.get_context("spawn")
+    result_queue = ctx.Queue()
+
+    start_time = time.time()
+    processes = {}
+    parts = partition_candidates(stock_list, shards)
+    for shard_id, part in enumerate(parts, 1):
+        process = ctx.Process(
+            target=shard_worker,
+            args=(shard_id, part, rules_path, rate, max_workers, result_queue),
+            daemon=True,
+        )
+        process.start()
+        processes[shard_id] = process
+
+    if verbose:
+        print(f"已啟動 {shards} 個分片程序，每片約 {analyze_count // shards} 檔")
+
+    board = TopK(top_k) if top_k > 0 else None
+    metrics = []
+    shard_infos = {}
+    processed = 0
+    last_refresh = start_time
+
+    try:
+        while len(shard_infos) < shards:
+            try:
+                message = result_queue.get(timeout=1)
+            except queue.Empty:
+                # 工作程序異常結束而未回報
+                for shard_id, process in processes.items():
+                    if shard_id not in shard_infos and not process.is_alive():
+                        shard_infos[shard_id] = {
+                            "shard": shard_id,
+                            "count": len(parts[shard_id - 1]),
+                            "error": f"程序異常結束 (exit code {process.exitcode})",
+                        }
+                continue
+
+            if message[0] == "done":
+                _, shard_id, info = message
+                shard_infos[shard_id] = info
+                continue
+
+            _, shard_id, stock, result = message
+            processed += 1
+            if result:
+                metrics.append(result)
+
+            if market_stats is not None:
+                entry = market_stats.setdefault(
+                    stock.get("market", ""), {"analyzed": 0, "qualified": 0}
+                )
+                entry["analyzed"] += 1
+                entry["analysis_time"] = time.time() - start_time
+
+            if board is None:
+                if verbose:
+                    elapsed = time.time() - start_time
+                    rate_now = processed / elapsed if elapsed > 0 else 0
+                    print(
+                        f"分析中... {processed}/{analyze_count} "
+                        f"({processed/analyze_count*100:.1f}%) 速度:{rate_now:.1f}檔/秒",
+                        end="\r",
+                    )
+                continue
+
+            # 串流排名
+            scores = rules.score_one(result) if result else None
+            changed = False
+            if scores:
+                ranked = dict(result, **scores)
+                changed = board.push(rank_key(ranked), ranked)
+
+            now = time.time()
+            if verbose and changed and now - last_refresh >= refresh:
+                print_leaderboard(board, processed, analyze_count, now - start_time)
+                last_refresh = now
+    finally:
+        for process in processes.values():
+            process.join(timeout=5)
+
+    qualified_stocks = score_metrics(rules, metrics)
 
-    total_time = time.time() - start_time
+    if market_stats is not None:
+        for stock in qualified_stocks:
+            market_stats.setdefault(
+                stock.get("market", ""), {"analyzed": 0, "qualified": 0}
+            )["qualified"] += 1
+
+    if verbose:
+        total_time = time.time() - start_time
+        if board is not None:
+            print_leaderboard(board, processed, analyze_count, total_time)
+        print(
+            f"\n第二階段完成！耗時 {total_time:.1f} 秒，平均 {processed/total_time:.1f} 檔/秒"
+        )
+        print_shard_summary(shard_infos)
+        print("=" * 80)
+    return qualified_stocks
+
+
+def print_market_summary(markets, pools, market_stats):
+    """顯示各市場耗時與候選數摘要"""
+    print(f"\n各市場摘要:")
     print(
-        f"\n第二階段完成！耗時 {total_time:.1f} 秒，平均 {len(stock_list)/total_time:.1f} 檔/秒"
+        f"{'市場':<6} {'快照(秒)':<10} {'候選池':<8} {'分析':<8} {'合格':<8} {'分析完成(秒)':<12}"
     )
-    print("=" * 80)
+    print("-" * 60)
+    for market in markets:
+        info = pools.get(market, {})
+        stats = market_stats.get(market, {})
+        pool = info.get("pool")
+        print(
+            f"{MARKET_NAMES.get(market, market):<6} "
+            f"{info.get('snapshot_time', 0):<10.2f} "
+            f"{len(pool) if pool else 0:<8} "
+            f"{stats.get('analyzed', 0):<8} "
+            f"{stats.get('qualified', 0):<8} "
+            f"{stats.get('analysis_time', 0):<12.1f}"
+        )
+    print("-" * 60)
+
+
+def screen_stocks(
+    reststock,
+    markets=("TSE",),
+    rate=DEFAULT_RATE,
+    max_workers=10,
+    rules=None,
+    top_k=20,
+    early_stop=False,
+    shards=0,
+    rules_path=None,
+):
+    """股票篩選主程式 (多市場共用線程池與限速器)
+
+    shards > 1 時第二階段改用多個工作程序分片分析，各分片自行登入與限速；
+    rules_path 為分片程序載入規則用的檔案路徑。
+    """
+    if rules is None:
+        rules = load_rules()
+
+    # 載入商品主檔 (或排除清單)
+    master, exclude_symbols = load_exclusions(reststock)
+
+    limiter = RateLimiter(rate)
+    market_stats = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 第一階段：並行建立各市場候選池
+        print("第一階段：建立候選池")
+        print(f"正在取得 {', '.join(MARKET_NAMES.get(m, m) for m in markets)} 股票資料...")
+
+        pools = fetch_market_pools(
+            reststock, exclude_symbols, markets, executor, limiter, rules, master
+        )
+
+        stock_list = []
+        for market in markets:
+            info = pools[market]
+            if info["pool"] is not None:
+                print_candidate_pool(market, info["pool"], info["total"], info["stats"])
+                # 保留快照指標，供提早結束估計分數上限
+                stock_list.extend(info["pool"])
+                continue
+
+            print(f"[{MARKET_NAMES.get(market, market)}] 第一階段篩選失敗: {info['error']}")
+            print("嘗試使用備用方法...")
+
+            # 備用方法：原來的方式
+            try:
+                fallback = fallback_stock_list(reststock, market)
+                print(f"使用備用方法，分析 {len(fallback)} 檔股票")
+                stock_list.extend(fallback)
+            except Exception:
+                pass
+
+        if not stock_list:
+            return []
+
+        print(f"\n第二階段分析設定:")
+        print(f"將對全部 {len(stock_list)} 檔候選股票進行技術分析")
+
+        # 第二階段：多線程技術分析
+        print("\n第二階段：多線程技術分析")
+        print("=" * 80)
+
+        # 篩選條件說明
+        print(f"篩選條件 (來源: {rules.source}):")
+        for line in rules.describe():
+            print(line)
+        print("符合越多加分條件，排序越優先!")
+        print("=" * 80)
+
+        if early_stop and not rules.fields & CANDLE_FIELDS:
+            print("規則未使用K線欄位，提早結束沒有可略過的查詢")
+        if shards > 1:
+            if early_stop:
+                print("分片模式不支援提早結束，將分析全部候選股")
+            qualified_stocks = analyze_candidates_sharded(
+                stock_list,
+                shards,
+                rules_path=rules_path,
+                rate=rate,
+                max_workers=max_workers,
+                market_stats=market_stats,
+                top_k=top_k,
+            )
+        else:
+            qualified_stocks = analyze_candidates(
+                stock_list,
+                reststock,
+                executor=executor,
+                limiter=limiter,
+                market_stats=market_stats,
+                rules=rules,
+                top_k=top_k,
+                early_stop=early_stop,
+            )
+
+    if len(markets) > 1 or rate:
+        print_market_summary(markets, pools, market_stats)
+        if limiter.waited > 0:
+            print(f"限速等待累計: {limiter.waited:.1f} 秒 (上限 {rate} 次/秒)")
+
     return qualified_stocks
 
 
-def display_results(stocks):
+def rank_key(stock):
+    """排序鍵：總分 > 加分項 > 額外分"""
+    return (stock["total_score"], stock["bonus_score"], stock["extra_score"])
+
+
+def display_results(stocks, rules=None, top=20):
     """顯示篩選結果"""
     if not stocks:
         print("沒有找到符合條件的股票")
         return
 
     # 按分數排序 (總分 > 加分項 > 額外分)
-    stocks.sort(
-        key=lambda x: (x["total_score"], x["bonus_score"], x["extra_score"]),
-        reverse=True,
-    )
+    stocks.sort(key=rank_key, reverse=True)
 
     print(f"\n篩選結果 (共 {len(stocks)} 檔)")
-    print("=" * 110)
+    print("=" * 115)
     print(
-        f"{'代碼':<8} {'股名':<12} {'價格':<8} {'漲跌':<10} {'量(張)':<10} {'必要':<15} {'加分':<25} {'總分':<6}"
+        f"{'代碼':<8} {'市場':<4} {'股名':<12} {'價格':<8} {'漲跌':<10} {'量(張)':<10} {'必要':<15} {'加分':<25} {'總分':<6}"
     )
-    print("-" * 110)
+    print("-" * 115)
 
-    for i, stock in enumerate(stocks[:20], 1):  # 顯示前20檔
+    for i, stock in enumerate(stocks[:top], 1):  # 顯示前N檔
         symbol = stock["symbol"]
         name = stock["name"][:8]  # 截斷股名
+        market = MARKET_NAMES.get(stock.get("market", ""), "")
         price = f"{stock['price']:.1f}"
         change_text = f"{stock['change']:+.1f}({stock['change_pct']:+.1f}%)"
         volume = f"{stock['volume']:,}"
@@ -558,10 +1070,10 @@ def display_results(stocks):
             score_text += "*"
 
         print(
-            f"{symbol:<8} {name:<12} {price:<8} {change_text:<10} {volume:<10} {required_text:<15} {bonus_text:<25} {score_text:<6}"
+            f"{symbol:<8} {market:<4} {name:<12} {price:<8} {change_text:<10} {volume:<10} {required_text:<15} {bonus_text:<25} {score_text:<6}"
         )
 
-    print("=" * 110)
+    print("=" * 115)
 
     # 統計資訊
     if stocks:
@@ -569,8 +1081,16 @@ def display_results(stocks):
         max_score = max(s["total_score"] for s in stocks)
 
         # 分組統計
-        full_bonus = [s for s in stocks if s["bonus_score"] == 3]  # 加分項全滿
-        high_bonus = [s for s in stocks if s["bonus_score"] >= 2]  # 高加分
+        if rules is None:
+            rules = load_rules(None)
+        max_bonus = rules.max_bonus
+
+        full_bonus = [
+            s for s in stocks if max_bonus > 0 and s["bonus_score"] >= max_bonus
+        ]  # 加分項全滿
+        high_bonus = [
+            s for s in stocks if max_bonus > 0 and s["bonus_score"] >= max_bonus * 2 / 3
+        ]  # 高加分
         basic_only = [s for s in stocks if s["bonus_score"] == 0]  # 僅符合基本條件
 
         print(f"\n統計資訊:")
@@ -588,19 +1108,209 @@ def display_results(stocks):
             )
 
         # 各加分條件統計
-        vol_ratio_pass = [s for s in stocks if s["vol_ratio"] >= 2.0]
-        momentum_pass = [s for s in stocks if s["momentum"] >= 1.5]
-        vwap_pass = [s for s in stocks if s["vwap_dev"] >= 0.7]
+        if rules.bonus:
+            counts = [
+                sum(1 for s in stocks if s["bonus_hits"][i])
+                for i in range(len(rules.bonus))
+            ]
+            print(f"\n加分條件統計:")
+            print(
+                " | ".join(
+                    f"{clause.expr}: {count}檔"
+                    for clause, count in zip(rules.bonus, counts)
+                )
+            )
+
 
-        print(f"\n加分條件統計:")
+def snapshot_marks(candidates):
+    """取出候選股的 (價格, 成交量)，作為快照比對依據"""
+    return {s["symbol"]: (s["price"], s["volume"]) for s in candidates}
+
+
+def diff_snapshot(previous_marks, current_marks):
+    """比對前後兩次快照，回傳價格或成交量有變動 (含新進) 的代碼"""
+    return [
+        symbol
+        for symbol, mark in current_marks.items()
+        if previous_marks.get(symbol) != mark
+    ]
+
+
+def print_qualified_changes(entered, exited, results, previous_results):
+    """只輸出進出合格名單的股票"""
+    for symbol in sorted(entered, key=lambda s: rank_key(results[s]), reverse=True):
+        stock = results[symbol]
+        bonus_text = " | ".join(stock["bonus_pass"]) if stock["bonus_pass"] else "無"
         print(
-            f"量比達標: {len(vol_ratio_pass)}檔 | 開盤動能: {len(momentum_pass)}檔 | VWAP乖離: {len(vwap_pass)}檔"
+            f"[+] {symbol:<8} {stock['name'][:8]:<12} {stock['price']:<8.1f} "
+            f"{stock['change_pct']:+.1f}% {stock['total_score']}分 {bonus_text}"
         )
+    for symbol in sorted(exited):
+        stock = previous_results[symbol]
+        print(f"[-] {symbol:<8} {stock['name'][:8]:<12} (原 {stock['total_score']}分)")
+
+
+def run_daemon(
+    reststock,
+    interval=60,
+    rounds=0,
+    markets=("TSE",),
+    rate=DEFAULT_RATE,
+    max_workers=10,
+    rules=None,
+):
+    """常駐模式：定期重新篩選，只重新分析快照有變動的股票
+
+    Args:
+        reststock: 行情 REST client
+        interval: 每輪間隔秒數
+        rounds: 執行輪數，0 表示持續執行直到中斷
+        markets: 要篩選的市場
+        rate: API 限速 (次/秒)
+        max_workers: 共用線程池大小
+        rules: 篩選規則集，預設讀取 screen_rules.json
+    """
+    if rules is None:
+        rules = load_rules()
+    master, exclude_symbols = load_exclusions(reststock)
+    limiter = RateLimiter(rate)
+
+    marks = {}  # 上一輪快照 {symbol: (價格, 成交量)}
+    results = {}  # 目前合格名單 {symbol: 分析結果}
+    round_no = 0
+
+    print(f"常駐篩選模式啟動，每 {interval} 秒重新篩選 (Ctrl+C 結束)")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while rounds <= 0 or round_no < rounds:
+            round_no += 1
+            round_start = time.time()
+
+            pools = fetch_market_pools(
+                reststock, exclude_symbols, markets, executor, limiter, rules, master
+            )
+            failed = [m for m in markets if pools[m]["pool"] is None]
+            for market in failed:
+                print(
+                    f"[{datetime.now().strftime('%H:%M:%S')}] "
+                    f"{MARKET_NAMES.get(market, market)} 取得快照失敗: {pools[market]['error']}"
+                )
+
+            if len(failed) < len(markets):
+                candidates = [
+                    s for m in markets if m not in failed for s in pools[m]["pool"]
+                ]
+                current_marks = snapshot_marks(candidates)
+                stock_map = {s["symbol"]: s for s in candidates}
+
+                # 快照失敗的市場沿用上一輪狀態
+                for symbol, stock in results.items():
+                    if stock.get("market") in failed:
+                        current_marks[symbol] = marks.get(symbol)
+
+                changed = diff_snapshot(marks, current_marks)
+                previous_results = dict(results)
+
+                # 跌出候選池的股票直接移出合格名單
+                for symbol in list(results):
+                    if symbol not in current_marks:
+                        del results[symbol]
+
+                # 只重新分析有變動的股票
+                analyzed = analyze_candidates(
+                    [
+                        {
+                            "symbol": s,
+                            "name": stock_map[s]["name"],
+                            "market": stock_map[s]["market"],
+                        }
+                        for s in changed
+                    ],
+                    reststock,
+                    verbose=False,
+                    executor=executor,
+                    limiter=limiter,
+                    rules=rules,
+                )
+                for symbol in changed:
+                    results.pop(symbol, None)
+                for stock in analyzed:
+                    results[stock["symbol"]] = stock
+
+                marks = current_marks
+
+                entered = set(results) - set(previous_results)
+                exited = set(previous_results) - set(results)
+
+                print(
+                    f"[{datetime.now().strftime('%H:%M:%S')}] 第{round_no}輪 "
+                    f"候選 {len(candidates)} 檔 | 重新分析 {len(changed)} 檔 | "
+                    f"合格 {len(results)} 檔 (+{len(entered)}/-{len(exited)}) | "
+                    f"耗時 {time.time() - round_start:.1f} 秒"
+                )
+                print_qualified_changes(entered, exited, results, previous_results)
+
+            if rounds > 0 and round_no >= rounds:
+                break
+            time.sleep(max(0, interval - (time.time() - round_start)))
+
+    return sorted(results.values(), key=rank_key, reverse=True)
+
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="股票即時篩選系統")
+    parser.add_argument(
+        "--daemon", action="store_true", help="常駐模式，定期重新篩選並輸出進出名單"
+    )
+    parser.add_argument(
+        "--interval", type=int, default=60, help="常駐模式的篩選間隔秒數 (預設 60)"
+    )
+    parser.add_argument(
+        "--markets",
+        default="TSE,OTC",
+        help="要篩選的市場，以逗號分隔 (TSE=上市, OTC=上櫃，預設 TSE,OTC)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"API 限速 次/秒，所有市場共用 (預設 {DEFAULT_RATE}，0 為不限速)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=10, help="共用線程池大小 (預設 10)"
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="即時排行與結果顯示的前 K 名 (預設 20)"
+    )
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="取得即時報價後分數上限已無法進入前 K 名的股票不再查詢K線 (規則需用到K線欄位)",
+    )
+    parser.add_argument(
+        "--rules",
+        default="screen_rules.json",
+        help="篩選規則檔 (預設 screen_rules.json，不存在時使用內建規則)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="第二階段分片程序數，各分片自行登入並各自套用 --rate 限速 (預設 0 不分片)",
+    )
+    args = parser.parse_args()
+    args.markets = tuple(
+        m.strip().upper() for m in args.markets.split(",") if m.strip()
+    )
+    return args
 
 
 def main():
     global sdk, reststock, login_success
 
+    args = parse_args()
+
     print("股票即時篩選系統")
     print("=" * 50)
 
@@ -617,11 +1327,34 @@ def main():
         return
 
     try:
-        # 執行篩選
-        qualified_stocks = screen_stocks(reststock)
+        rules = load_rules(args.rules)
+
+        if args.daemon:
+            # 常駐模式
+            run_daemon(
+                reststock,
+                interval=args.interval,
+                markets=args.markets,
+                rate=args.rate,
+                max_workers=args.workers,
+                rules=rules,
+            )
+        else:
+            # 執行篩選
+            qualified_stocks = screen_stocks(
+                reststock,
+                markets=args.markets,
+                rate=args.rate,
+                max_workers=args.workers,
+                rules=rules,
+                top_k=args.top,
+                early_stop=args.early_stop,
+                shards=args.shards,
+                rules_path=args.rules,
+            )
 
-        # 顯示結果
-        display_results(qualified_stocks)
+            # 顯示結果
+            display_results(qualified_stocks, rules, top=args.top)
 
     except KeyboardInterrupt:
         print("\n使用者中斷程式")
@@ -3,6 +3,8 @@
 # 修正內容: A1-MA排列邏輯矛盾, A2-MACD訊號判定
 
 from login_helper import login
+from price_volume_profile import PriceVolumeProfile
+from stage_metrics import metrics, stage_timer
 import time
 import threading
 import sys
@@ -13,6 +15,11 @@ sdk = None
 reststock = None
 login_success = False
 
+# 即時成交維護的分價量表 {symbol: PriceVolumeProfile}
+# 機器人監控中的股票由 watchlist 的即時成交串流 (attach_trade_stream) 持續更新，
+# 存在且未過期 (PriceVolumeProfile.is_stale) 時不再呼叫 volumes API
+trade_profiles = {}
+
 
 def calculate_vwap(candles_data):
     """計算當日VWAP (成交量加權平均價)"""
@@ -53,43 +60,50 @@ def login_thread():
         login_success = False
 
 
+def close_session(session_sdk, log=print):
+    """關閉即時資料連線並登出指定的 SDK 連線"""
+    if not session_sdk:
+        return True
+
+    start = time.perf_counter()
+    try:
+        # 關閉即時資料連線
+        if hasattr(session_sdk, "close_realtime"):
+            try:
+                session_sdk.close_realtime()
+                log("已關閉即時資料連線")
+            except Exception:
+                pass
+
+        # 登出系統
+        session_sdk.logout()
+        log("已登出富邦系統")
+        return True
+
+    except Exception as e:
+        log(f"登出失敗: {e}")
+        return False
+    finally:
+        metrics.record("logout", time.perf_counter() - start)
+
+
 def logout_system():
     """登出富邦系統 - 加強版"""
     global sdk, reststock, login_success
 
-    try:
-        if sdk:
-            # 關閉即時資料連線
-            if hasattr(sdk, "close_realtime"):
-                try:
-                    sdk.close_realtime()
-                    print("已關閉即時資料連線")
-                except:
-                    pass
-
-            # 登出系統
-            sdk.logout()
-            print("已登出富邦系統")
-
-        # 重置全域變數
-        sdk = None
-        reststock = None
-        login_success = False
+    success = close_session(sdk)
 
-        # 強制垃圾回收
-        import gc
+    # 重置全域變數 (即使登出失敗也要重置)
+    sdk = None
+    reststock = None
+    login_success = False
 
-        gc.collect()
+    # 強制垃圾回收
+    import gc
 
-        return True
+    gc.collect()
 
-    except Exception as e:
-        print(f"登出失敗: {e}")
-        # 即使登出失敗也要重置變數
-        sdk = None
-        reststock = None
-        login_success = False
-        return False
+    return success
 
 
 def analyze_big_orders(trades_data):
@@ -248,7 +262,7 @@ def analyze_order_book_strength(quote_data):
     }
 
 
-def get_market_overview(reststock):
+def get_market_overview(reststock, log=print):
     """取得大盤概況"""
     try:
         # 查詢加權指數
@@ -272,18 +286,18 @@ def get_market_overview(reststock):
             "steel": steel,
         }
     except Exception as e:
-        print(f"取得大盤資料失敗: {e}")
+        log(f"取得大盤資料失敗: {e}")
         return None
 
 
-def draw_simple_chart(candles_data):
-    """繪製簡易1分鐘K線圖"""
-    if not candles_data or not candles_data.get("data"):
-        return
+def render_simple_chart(candles_data):
+    """產生簡易1分鐘K線圖文字 (回傳行列表，資料不足時為空)"""
+    if not candles_data:
+        return []
 
-    data = candles_data["data"][-20:]  # 最近20根K線
+    data = candles_data[-20:]  # 最近20根K線
     if len(data) < 2:
-        return
+        return []
 
     # 取得價格範圍
     prices = []
@@ -291,17 +305,16 @@ def draw_simple_chart(candles_data):
         prices.extend([candle.get("high", 0), candle.get("low", 0)])
 
     if not prices:
-        return
+        return []
 
     max_price = max(prices)
     min_price = min(prices)
     price_range = max_price - min_price
 
     if price_range == 0:
-        return
+        return []
 
-    print("\n簡易1分鐘走勢圖 (最近20根)")
-    print("-" * 40)
+    lines = ["\n簡易1分鐘走勢圖 (最近20根)", "-" * 40]
 
     # 繪製圖表 (10行高度)
     chart_height = 10
@@ -323,20 +336,39 @@ def draw_simple_chart(candles_data):
             else:
                 line += " "
 
-        print(line)
+        lines.append(line)
 
     # 時間軸
-    print("       " + "".join([f"{i%10}" for i in range(len(data))]))
-    print(f"       最近{len(data)}根1分K (每格1分鐘)")
+    lines.append("       " + "".join([f"{i%10}" for i in range(len(data))]))
+    lines.append(f"       最近{len(data)}根1分K (每格1分鐘)")
+    return lines
 
 
-def show_market_sentiment(market_data):
-    """顯示市場情緒"""
-    if not market_data:
+def draw_simple_chart(candles_data):
+    """繪製簡易1分鐘K線圖"""
+    if not candles_data or not candles_data.get("data"):
         return
+    for line in render_simple_chart(candles_data["data"]):
+        print(line)
+
+
+# 市場概況顯示的權值股
+MARKET_OVERVIEW_STOCKS = [
+    ("tsmc", "2330 台積電"),
+    ("mediatek", "2454 聯發科"),
+    ("mega", "2886 兆豐金"),
+    ("fubon", "2887 富邦金"),
+    ("cement", "1101 台泥"),
+    ("steel", "2002 中鋼"),
+]
 
-    print("\n市場概況")
-    print("-" * 30)
+
+def render_market_sentiment(market_data):
+    """產生市場概況文字 (回傳行列表)"""
+    if not market_data:
+        return []
+
+    lines = ["\n市場概況", "-" * 30]
 
     # 大盤
     taiex = market_data.get("taiex")
@@ -344,29 +376,27 @@ def show_market_sentiment(market_data):
         change = taiex.get("change", 0)
         change_pct = taiex.get("changePercent", 0)
         trend = "+" if change > 0 else "-" if change < 0 else "="
-        print(
+        lines.append(
             f"加權指數: {taiex.get('closePrice', 'N/A')} {trend}{change:.0f} ({change_pct:+.2f}%)"
         )
 
     # 權值股
-    stocks = [
-        ("tsmc", "2330 台積電"),
-        ("mediatek", "2454 聯發科"),
-        ("mega", "2886 兆豐金"),
-        ("fubon", "2887 富邦金"),
-        ("cement", "1101 台泥"),
-        ("steel", "2002 中鋼"),
-    ]
-
-    for key, name in stocks:
+    for key, name in MARKET_OVERVIEW_STOCKS:
         stock = market_data.get(key)
         if stock:
             change = stock.get("change", 0)
             change_pct = stock.get("changePercent", 0)
             trend = "+" if change > 0 else "-" if change < 0 else "="
-            print(
+            lines.append(
                 f"{name}: {stock.get('closePrice', 'N/A')} {trend}{change:.1f} ({change_pct:+.2f}%)"
             )
+    return lines
+
+
+def show_market_sentiment(market_data):
+    """顯示市場情緒"""
+    for line in render_market_sentiment(market_data):
+        print(line)
 
 
 def calculate_ema(prices, period):
@@ -693,405 +723,646 @@ def analyze_macd_signal_fixed(dif, macd, osc):
     return signal, detail
 
 
-def analyze_stock_complete(reststock, symbol):
-    """完整股票分析 (整合即時行情 + 技術指標)"""
-    try:
-        # === 取得所有必要資料 ===
+def fetch_daily_candles(reststock, symbol):
+    """取得近 60 日日K"""
+    from_date = time.strftime(
+        "%Y-%m-%d", time.localtime(time.time() - 60 * 24 * 3600)
+    )
+    to_date = time.strftime("%Y-%m-%d")
+    return reststock.historical.candles(
+        **{"symbol": symbol, "from": from_date, "to": to_date, "timeframe": "D"}
+    )
+
+
+def collect_analysis(
+    reststock, symbol, log=print, market_data=None, historical_data=None
+):
+    """取得資料並計算所有分析指標，回傳結構化結果 (找不到股票時回傳 None)
+
+    log 為訊息輸出函數，並行分析時每個請求傳入自己的收集器。
+    market_data/historical_data 可由批次分析預先取得後傳入，為 None 時自行查詢。
+
+    結果為 dict，主要欄位:
+        symbol, name, analyzed_at, price
+        market: 大盤概況 (get_market_overview 原始資料)
+        quote: {change, change_pct, open, high, low, volume}
+        order_book: 五檔力道 (analyze_order_book_strength)
+        ma: {ma5, ma10, ma20, analysis}
+        rsi: {value, status}
+        bollinger: {upper, middle, lower, position, status}
+        macd: {dif, macd, osc, signal, detail}
+        kd: {k, d, status, cross}
+        vwap: {value, diff_pct, status}
+        big_orders: 大單流向 (analyze_big_orders) + trend
+        candles_1m / asks / bids / trades: 走勢圖、五檔、成交明細原始資料
+        profile: {levels, poc, value_area}
+        score: {score, total, pct, rating}
+    無資料的項目為 None。
+    """
+    # === 取得所有必要資料 (各項查詢分別計時) ===
+    with stage_timer("fetch.ticker"):
         ticker = reststock.intraday.ticker(symbol=symbol)
+    with stage_timer("fetch.quote"):
         quote = reststock.intraday.quote(symbol=symbol)
+    with stage_timer("fetch.trades"):
         trades = reststock.intraday.trades(symbol=symbol, limit=50)
-        volumes = reststock.intraday.volumes(symbol=symbol)
+    profile = trade_profiles.get(symbol)
+    if profile is not None:
+        profile = profile.snapshot()
+        # 串流中斷時分價量表不再更新，以報價的最後成交時間判斷是否過期
+        last_trade = ((quote or {}).get("lastTrade") or {}).get("time")
+        if len(profile) == 0 or profile.is_stale(last_trade):
+            profile = None
+    if profile is None:
+        with stage_timer("fetch.volumes"):
+            volumes = reststock.intraday.volumes(symbol=symbol)
+        profile = PriceVolumeProfile.from_volumes(volumes, symbol)
+    with stage_timer("fetch.candles_1m"):
         candles_1m = reststock.intraday.candles(symbol=symbol, timeframe="1")  # 1分K
 
-        # 取得歷史資料
-        from_date = time.strftime(
-            "%Y-%m-%d", time.localtime(time.time() - 60 * 24 * 3600)
-        )
-        to_date = time.strftime("%Y-%m-%d")
-        historical_data = reststock.historical.candles(
-            **{"symbol": symbol, "from": from_date, "to": to_date, "timeframe": "D"}
-        )
+    # 取得歷史資料
+    if historical_data is None:
+        with stage_timer("fetch.daily"):
+            historical_data = fetch_daily_candles(reststock, symbol)
+    if market_data is None:
+        with stage_timer("fetch.market"):
+            market_data = get_market_overview(reststock, log)
 
-        if not ticker:
-            print(f"找不到 {symbol}")
-            return False
+    if not ticker:
+        return None
 
-        # 顯示標題
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        print(f"\n{'='*60}")
-        print(f"{ticker['name']} ({symbol}) 完整分析")
-        print(f"分析時間: {current_time}")
-        print(f"{'='*60}")
+    compute_start = time.perf_counter()
 
-        # === 1. 市場概況 ===
-        market_data = get_market_overview(reststock)
-        show_market_sentiment(market_data)
+    current_price = (
+        quote.get("lastPrice") or quote.get("closePrice") if quote else None
+    )
 
-        # === 2. 個股即時資訊 ===
-        current_price = (
-            quote.get("lastPrice") or quote.get("closePrice") if quote else None
-        )
+    result = {
+        "symbol": symbol,
+        "name": ticker["name"],
+        "analyzed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "price": current_price,
+        "market": market_data,
+        "quote": None,
+        "order_book": analyze_order_book_strength(quote),
+        "ma": None,
+        "rsi": None,
+        "bollinger": None,
+        "macd": None,
+        "kd": None,
+        "vwap": None,
+        "big_orders": None,
+        "candles_1m": (candles_1m or {}).get("data") or [],
+        "asks": quote.get("asks", [])[:5] if quote else [],
+        "bids": quote.get("bids", [])[:5] if quote else [],
+        "trades": (trades or {}).get("data", [])[:5] if trades else [],
+        "profile": None,
+        "score": None,
+    }
 
-        if quote:
-            price = current_price
-            change = quote.get("change", 0)
-            change_pct = quote.get("changePercent", 0)
+    # === 個股即時資訊 ===
+    if quote:
+        result["quote"] = {
+            "change": quote.get("change", 0),
+            "change_pct": quote.get("changePercent", 0),
+            "open": quote.get("openPrice"),
+            "high": quote.get("highPrice"),
+            "low": quote.get("lowPrice"),
+            "volume": quote.get("total", {}).get("tradeVolume", 0),
+        }
 
-            trend = "+" if change > 0 else "-" if change < 0 else "="
-            print(f"\n個股即時資訊")
-            print("-" * 30)
-            print(f"目前價格: {price} {trend} {change:+.1f} ({change_pct:+.2f}%)")
-            print(
-                f"開盤:{quote.get('openPrice')} 最高:{quote.get('highPrice')} 最低:{quote.get('lowPrice')}"
-            )
-            print(f"成交量:{quote.get('total',{}).get('tradeVolume',0):,}張")
-
-        # === 3. 五檔買賣力道分析 ===
-        order_book_analysis = analyze_order_book_strength(quote)
-        if order_book_analysis:
-            print(f"\n五檔買賣力道")
-            print("-" * 30)
-            print(
-                f"買盤力道: {order_book_analysis['bid_ratio']:.1f}% ({order_book_analysis['total_bid_size']:,}張)"
+    # === 技術指標 ===
+    close_prices, high_prices, low_prices = [], [], []
+    if historical_data and historical_data.get("data"):
+        candles = historical_data["data"]
+        close_prices = [candle.get("close", 0) for candle in candles]
+        high_prices = [candle.get("high", 0) for candle in candles]
+        low_prices = [candle.get("low", 0) for candle in candles]
+
+        # 過濾無效價格
+        valid_data = [
+            (h, l, c)
+            for h, l, c in zip(high_prices, low_prices, close_prices)
+            if h > 0 and l > 0 and c > 0
+        ]
+        if valid_data:
+            high_prices, low_prices, close_prices = (
+                list(values) for values in zip(*valid_data)
             )
-            print(
-                f"賣盤力道: {order_book_analysis['ask_ratio']:.1f}% ({order_book_analysis['total_ask_size']:,}張)"
-            )
-            print(f"市場情緒: {order_book_analysis['market_sentiment']}")
-            print(
-                f"買賣價差: {order_book_analysis['spread']:.2f} ({order_book_analysis['spread_pct']:.3f}%)"
+
+    # MA5/MA10/MA20 (MA20 需 20 日資料，評分只需 MA5/MA10)
+    if len(close_prices) >= 10:
+        ma5_values = calculate_ma(close_prices, 5)
+        ma10_values = calculate_ma(close_prices, 10)
+        ma20_values = calculate_ma(close_prices, 20)
+        if ma5_values and ma10_values:
+            ma = {
+                "ma5": ma5_values[-1],
+                "ma10": ma10_values[-1],
+                "ma20": ma20_values[-1] if ma20_values else None,
+                "analysis": None,
+            }
+            if ma["ma20"] is not None and current_price:
+                # A1修正: MA排列分析 (修正版)
+                ma["analysis"] = analyze_ma_arrangement_fixed(
+                    ma["ma5"], ma["ma10"], ma["ma20"], current_price
+                )
+            result["ma"] = ma
+
+    # RSI
+    if len(close_prices) >= 15:
+        rsi_data = calculate_rsi(close_prices)
+        if rsi_data:
+            # 無下跌時 calculate_rsi 直接回傳 100
+            rsi = rsi_data["current"] if isinstance(rsi_data, dict) else rsi_data
+            if rsi > 70:
+                status = "超買"
+            elif rsi < 30:
+                status = "超賣"
+            else:
+                status = "正常"
+            result["rsi"] = {"value": rsi, "status": status}
+
+    # 布林通道
+    if len(close_prices) >= 20 and current_price:
+        bb_data = calculate_bollinger_bands(close_prices)
+        if bb_data:
+            if bb_data["position"] > 0.8:
+                status = "接近上軌"
+            elif bb_data["position"] < 0.2:
+                status = "接近下軌"
+            else:
+                status = "通道中間"
+            result["bollinger"] = dict(bb_data, status=status)
+
+    # A2修正: MACD
+    if len(close_prices) >= 26:
+        macd_data = calculate_macd(close_prices)
+        if macd_data:
+            macd_signal, macd_detail = analyze_macd_signal_fixed(
+                macd_data["dif"], macd_data["macd"], macd_data["osc"]
             )
+            result["macd"] = {
+                "dif": macd_data["dif"],
+                "macd": macd_data["macd"],
+                "osc": macd_data["osc"],
+                "signal": macd_signal,
+                "detail": macd_detail,
+            }
+
+    # KD
+    if len(close_prices) >= 9:
+        kd_data = calculate_kd(high_prices, low_prices, close_prices)
+        if kd_data:
+            k_val = kd_data["k"]
+            d_val = kd_data["d"]
+            if k_val > 80:
+                status = "超買"
+            elif k_val < 20:
+                status = "超賣"
+            else:
+                status = "正常"
+
+            # KD交叉
+            cross = None
+            if len(kd_data["k_history"]) >= 2 and len(kd_data["d_history"]) >= 2:
+                k_prev = kd_data["k_history"][-2]
+                d_prev = kd_data["d_history"][-2]
+                if k_prev <= d_prev and k_val > d_val:
+                    cross = "黃金交叉"
+                elif k_prev >= d_prev and k_val < d_val:
+                    cross = "死亡交叉"
+            result["kd"] = {"k": k_val, "d": d_val, "status": status, "cross": cross}
+
+    # === VWAP ===
+    current_vwap = calculate_vwap(candles_1m)
+    if current_vwap and current_price:
+        vwap_diff = ((current_price - current_vwap) / current_vwap) * 100
+        result["vwap"] = {
+            "value": current_vwap,
+            "diff_pct": vwap_diff,
+            "status": (
+                "股價高於VWAP (偏強)" if vwap_diff > 0 else "股價低於VWAP (偏弱)"
+            ),
+        }
+
+    # === 大單分析 ===
+    big_orders = analyze_big_orders(trades)
+    if big_orders:
+        if big_orders["ask_ratio"] > big_orders["bid_ratio"]:
+            big_orders["trend"] = "積極買進"
+        elif big_orders["bid_ratio"] > big_orders["ask_ratio"]:
+            big_orders["trend"] = "積極賣出"
+        else:
+            big_orders["trend"] = "均衡"
+        result["big_orders"] = big_orders
+
+    # === 分價量表 ===
+    if len(profile) > 0:
+        result["profile"] = {
+            "levels": profile.top_by_price(5),
+            "poc": profile.point_of_control(),
+            "value_area": profile.value_area(),
+        }
 
-        # === 4. 技術指標分析 ===
-        if historical_data and historical_data.get("data"):
-            candles = historical_data["data"]
-            close_prices = [candle.get("close", 0) for candle in candles]
-            high_prices = [candle.get("high", 0) for candle in candles]
-            low_prices = [candle.get("low", 0) for candle in candles]
-
-            # 過濾無效價格
-            valid_data = [
-                (h, l, c)
-                for h, l, c in zip(high_prices, low_prices, close_prices)
-                if h > 0 and l > 0 and c > 0
+    result["score"] = score_analysis(result)
+    metrics.record("compute", time.perf_counter() - compute_start)
+    return result
+
+
+def score_analysis(result):
+    """綜合技術分析評分 (修正版)，沒有任何指標時回傳 None"""
+    current_price = result["price"]
+    score = 0
+    total_indicators = 0
+
+    # MA評分
+    ma = result["ma"]
+    if ma and current_price:
+        if current_price > ma["ma5"]:
+            score += 1
+        if current_price > ma["ma10"]:
+            score += 1
+        if ma["ma5"] > ma["ma10"]:
+            score += 1
+        total_indicators += 3
+
+    # RSI評分
+    rsi = result["rsi"]
+    if rsi:
+        if 30 < rsi["value"] < 70:
+            score += 1  # 正常區間
+        if rsi["value"] > 50:
+            score += 1  # 偏多
+        total_indicators += 2
+
+    # MACD評分 (修正版)
+    macd = result["macd"]
+    if macd:
+        bullish_signals = sum(
+            [
+                macd["dif"] > macd["macd"],  # 快線站上慢線
+                macd["dif"] > 0 and macd["macd"] > 0,  # 雙線位於零軸上方
+                macd["osc"] > 0,  # OSC為正
             ]
-            if valid_data:
-                high_prices, low_prices, close_prices = zip(*valid_data)
-                high_prices, low_prices, close_prices = (
-                    list(high_prices),
-                    list(low_prices),
-                    list(close_prices),
-                )
+        )
+        if bullish_signals >= 2:
+            score += 2  # 多頭
+        elif bullish_signals == 1:
+            score += 1  # 偏多
+        # 空頭不加分
+        total_indicators += 2
+
+    # KD評分
+    kd = result["kd"]
+    if kd:
+        if kd["k"] > kd["d"]:
+            score += 1
+        if 20 < kd["k"] < 80:
+            score += 1  # 正常區間
+        total_indicators += 2
+
+    # VWAP評分
+    if result["vwap"]:
+        if current_price > result["vwap"]["value"]:
+            score += 1
+        total_indicators += 1
+
+    # 五檔力道評分
+    if result["order_book"]:
+        if result["order_book"]["bid_ratio"] > 55:
+            score += 1
+        total_indicators += 1
+
+    if total_indicators == 0:
+        return None
 
-            print(f"\n技術指標分析")
-            print("-" * 30)
-
-            # MA5/MA10/MA20
-            if len(close_prices) >= 20:
-                ma5_values = calculate_ma(close_prices, 5)
-                ma10_values = calculate_ma(close_prices, 10)
-                ma20_values = calculate_ma(close_prices, 20)
-
-                if ma5_values and ma10_values and ma20_values:
-                    current_ma5 = ma5_values[-1]
-                    current_ma10 = ma10_values[-1]
-                    current_ma20 = ma20_values[-1]
-
-                    print(f"MA5:  {current_ma5:.2f}")
-                    print(f"MA10: {current_ma10:.2f}")
-                    print(f"MA20: {current_ma20:.2f}")
-
-                    if current_price:
-                        ma5_diff = ((current_price - current_ma5) / current_ma5) * 100
-                        ma10_diff = (
-                            (current_price - current_ma10) / current_ma10
-                        ) * 100
-                        ma20_diff = (
-                            (current_price - current_ma20) / current_ma20
-                        ) * 100
-                        print(
-                            f"股價 vs MA5:  {ma5_diff:+.2f}% ({'上方' if ma5_diff > 0 else '下方'})"
-                        )
-                        print(
-                            f"股價 vs MA10: {ma10_diff:+.2f}% ({'上方' if ma10_diff > 0 else '下方'})"
-                        )
-                        print(
-                            f"股價 vs MA20: {ma20_diff:+.2f}% ({'上方' if ma20_diff > 0 else '下方'})"
-                        )
-
-                        # A1修正: MA排列分析 (修正版)
-                        ma_result = analyze_ma_arrangement_fixed(
-                            current_ma5, current_ma10, current_ma20, current_price
-                        )
-                        print(f"MA分析: {ma_result}")
-
-            # RSI
-            if len(close_prices) >= 15:
-                rsi_data = calculate_rsi(close_prices)
-                if rsi_data:
-                    rsi = rsi_data["current"]
-                    print(f"\nRSI: {rsi:.1f}")
-                    if rsi > 70:
-                        print("RSI狀態: 超買")
-                    elif rsi < 30:
-                        print("RSI狀態: 超賣")
-                    else:
-                        print("RSI狀態: 正常")
-
-            # 布林通道
-            if len(close_prices) >= 20:
-                bb_data = calculate_bollinger_bands(close_prices)
-                if bb_data and current_price:
-                    print(f"\n布林通道:")
-                    print(f"上軌: {bb_data['upper']:.2f}")
-                    print(f"中軌: {bb_data['middle']:.2f}")
-                    print(f"下軌: {bb_data['lower']:.2f}")
-                    print(
-                        f"位置: {bb_data['position']*100:.1f}% ({'上半部' if bb_data['position'] > 0.5 else '下半部'})"
-                    )
+    final_score = (score / total_indicators) * 100
+    if final_score >= 70:
+        rating = "強勢"
+    elif final_score >= 50:
+        rating = "中性偏多"
+    elif final_score >= 30:
+        rating = "中性偏空"
+    else:
+        rating = "弱勢"
+    return {
+        "score": score,
+        "total": total_indicators,
+        "pct": final_score,
+        "rating": rating,
+    }
 
-                    if bb_data["position"] > 0.8:
-                        print("布林狀態: 接近上軌")
-                    elif bb_data["position"] < 0.2:
-                        print("布林狀態: 接近下軌")
-                    else:
-                        print("布林狀態: 通道中間")
-
-            # A2修正: MACD
-            if len(close_prices) >= 26:
-                macd_data = calculate_macd(close_prices)
-                if macd_data:
-                    print(
-                        f"\nMACD: DIF:{macd_data['dif']:+.3f} MACD:{macd_data['macd']:+.3f} OSC:{macd_data['osc']:+.3f}"
-                    )
 
-                    # 使用修正版MACD訊號判定
-                    macd_signal, macd_detail = analyze_macd_signal_fixed(
-                        macd_data["dif"], macd_data["macd"], macd_data["osc"]
-                    )
-                    print(f"MACD分析: {macd_detail}")
-                    print(f"MACD訊號: {macd_signal}")
-
-            # KD
-            if len(close_prices) >= 9:
-                kd_data = calculate_kd(high_prices, low_prices, close_prices)
-                if kd_data:
-                    k_val = kd_data["k"]
-                    d_val = kd_data["d"]
-                    print(f"\nKD: K:{k_val:.1f} D:{d_val:.1f}")
-
-                    if k_val > 80:
-                        print("KD狀態: 超買")
-                    elif k_val < 20:
-                        print("KD狀態: 超賣")
-                    else:
-                        print("KD狀態: 正常")
-
-                    # KD交叉
-                    if (
-                        len(kd_data["k_history"]) >= 2
-                        and len(kd_data["d_history"]) >= 2
-                    ):
-                        k_prev = kd_data["k_history"][-2]
-                        d_prev = kd_data["d_history"][-2]
-                        if k_prev <= d_prev and k_val > d_val:
-                            print("KD訊號: 黃金交叉")
-                        elif k_prev >= d_prev and k_val < d_val:
-                            print("KD訊號: 死亡交叉")
-
-        # === 5. VWAP ===
-        current_vwap = calculate_vwap(candles_1m)
-        if current_vwap and current_price:
-            vwap_diff = ((current_price - current_vwap) / current_vwap) * 100
-            print(f"\nVWAP: {current_vwap:.2f} (股價{vwap_diff:+.2f}%)")
-            if vwap_diff > 0:
-                print("VWAP狀態: 股價高於VWAP (偏強)")
-            else:
-                print("VWAP狀態: 股價低於VWAP (偏弱)")
-
-        # === 6. 大單分析 ===
-        big_orders = analyze_big_orders(trades)
-        if big_orders:
-            print(f"\n大單流向 (50張以上)")
-            print("-" * 30)
-            print(
-                f"大單: {big_orders['total_orders']}筆 {big_orders['total_volume']:,}張"
-            )
-            if big_orders["bid_volume"] > 0 or big_orders["ask_volume"] > 0:
-                print(
-                    f"內盤大單:{big_orders['bid_volume']:,}張 ({big_orders['bid_ratio']:.1f}%)"
-                )
-                print(
-                    f"外盤大單:{big_orders['ask_volume']:,}張 ({big_orders['ask_ratio']:.1f}%)"
-                )
+def render_analysis_report(result):
+    """將 collect_analysis 的結果產生完整文字報告"""
+    symbol = result["symbol"]
+    current_price = result["price"]
+    lines = [
+        f"\n{'='*60}",
+        f"{result['name']} ({symbol}) 完整分析",
+        f"分析時間: {result['analyzed_at']}",
+        f"{'='*60}",
+    ]
 
-                if big_orders["ask_ratio"] > big_orders["bid_ratio"]:
-                    print("大單趨勢: 積極買進")
-                elif big_orders["bid_ratio"] > big_orders["ask_ratio"]:
-                    print("大單趨勢: 積極賣出")
-                else:
-                    print("大單趨勢: 均衡")
-
-        # === 7. 簡易走勢圖 ===
-        draw_simple_chart(candles_1m)
-
-        # === 8. 五檔報價 ===
-        if quote:
-            print(f"\n五檔報價")
-            print("-" * 20)
-            asks = quote.get("asks", [])[:5]
-            bids = quote.get("bids", [])[:5]
-
-            # 顯示賣檔
-            for i, ask in enumerate(asks, 1):
-                size = ask.get("size", 0)
-                price = ask.get("price", 0)
-                print(f"賣{i}: {price:>6.2f} ({size:>4}張)")
-
-            print(f"{'現價':>4}: {current_price:>6.2f}")
-            print("-" * 20)
-
-            # 顯示買檔
-            for i, bid in enumerate(bids, 1):
-                size = bid.get("size", 0)
-                price = bid.get("price", 0)
-                print(f"買{i}: {price:>6.2f} ({size:>4}張)")
-
-        # === 9. 成交明細 ===
-        if trades and trades.get("data"):
-            print(f"\n成交明細 (最近5筆)")
-            print("-" * 25)
-            print("時間     價格  張數")
-            print("-" * 25)
-            for trade in trades["data"][:5]:
-                timestamp = trade.get("time", 0)
-                if timestamp > 0:
-                    t = time.strftime("%H:%M:%S", time.localtime(timestamp / 1000000))
-                else:
-                    t = "N/A"
-                size = trade.get("size", 0)
-                price = trade.get("price", 0)
-                size_mark = " *" if size >= 50 else ""
-                print(f"{t} {price:>6.2f} {size:>4}張{size_mark}")
-
-        # === 10. 分價量表 ===
-        if volumes and volumes.get("data"):
-            print(f"\n分價量表 (前5檔)")
-            print("-" * 25)
-            print(" 價格   總量  內盤  外盤")
-            print("-" * 25)
-            data = sorted(
-                volumes["data"], key=lambda x: x.get("price", 0), reverse=True
-            )
-            for item in data[:5]:
-                price_vol = item.get("price", 0)
-                volume = item.get("volume", 0)
-                bid_vol = item.get("volumeAtBid", 0)
-                ask_vol = item.get("volumeAtAsk", 0)
-                print(f"{price_vol:>5.1f} {volume:>6} {bid_vol:>5} {ask_vol:>5}")
-
-        # === 11. 綜合評分 (修正版) ===
-        print(f"\n綜合技術分析評分")
-        print("-" * 30)
-
-        score = 0
-        total_indicators = 0
-
-        # MA評分
-        if len(close_prices) >= 10 and current_price:
-            ma5_values = calculate_ma(close_prices, 5)
-            ma10_values = calculate_ma(close_prices, 10)
-            if ma5_values and ma10_values:
-                if current_price > ma5_values[-1]:
-                    score += 1
-                if current_price > ma10_values[-1]:
-                    score += 1
-                if ma5_values[-1] > ma10_values[-1]:
-                    score += 1
-                total_indicators += 3
-
-        # RSI評分
-        if len(close_prices) >= 15:
-            rsi_data = calculate_rsi(close_prices)
-            if rsi_data:
-                rsi = rsi_data["current"]
-                if 30 < rsi < 70:
-                    score += 1  # 正常區間
-                if rsi > 50:
-                    score += 1  # 偏多
-                total_indicators += 2
-
-        # MACD評分 (修正版)
-        if len(close_prices) >= 26:
-            macd_data = calculate_macd(close_prices)
-            if macd_data:
-                dif, macd_val, osc = (
-                    macd_data["dif"],
-                    macd_data["macd"],
-                    macd_data["osc"],
-                )
+    # === 1. 市場概況 ===
+    lines.extend(render_market_sentiment(result["market"]))
 
-                # 重新計算評分
-                bullish_signals = sum(
-                    [
-                        dif > macd_val,  # 快線站上慢線
-                        dif > 0 and macd_val > 0,  # 雙線位於零軸上方
-                        osc > 0,  # OSC為正
-                    ]
+    # === 2. 個股即時資訊 ===
+    quote = result["quote"]
+    if quote:
+        change = quote["change"]
+        trend = "+" if change > 0 else "-" if change < 0 else "="
+        lines.append(f"\n個股即時資訊")
+        lines.append("-" * 30)
+        lines.append(
+            f"目前價格: {current_price} {trend} {change:+.1f} ({quote['change_pct']:+.2f}%)"
+        )
+        lines.append(f"開盤:{quote['open']} 最高:{quote['high']} 最低:{quote['low']}")
+        lines.append(f"成交量:{quote['volume']:,}張")
+
+    # === 3. 五檔買賣力道分析 ===
+    order_book = result["order_book"]
+    if order_book:
+        lines.append(f"\n五檔買賣力道")
+        lines.append("-" * 30)
+        lines.append(
+            f"買盤力道: {order_book['bid_ratio']:.1f}% ({order_book['total_bid_size']:,}張)"
+        )
+        lines.append(
+            f"賣盤力道: {order_book['ask_ratio']:.1f}% ({order_book['total_ask_size']:,}張)"
+        )
+        lines.append(f"市場情緒: {order_book['market_sentiment']}")
+        lines.append(
+            f"買賣價差: {order_book['spread']:.2f} ({order_book['spread_pct']:.3f}%)"
+        )
+
+    # === 4. 技術指標分析 ===
+    if any(result[key] for key in ("ma", "rsi", "bollinger", "macd", "kd")):
+        lines.append(f"\n技術指標分析")
+        lines.append("-" * 30)
+
+    ma = result["ma"]
+    if ma and ma["ma20"] is not None:
+        lines.append(f"MA5:  {ma['ma5']:.2f}")
+        lines.append(f"MA10: {ma['ma10']:.2f}")
+        lines.append(f"MA20: {ma['ma20']:.2f}")
+        if current_price:
+            for label, key in (("MA5: ", "ma5"), ("MA10:", "ma10"), ("MA20:", "ma20")):
+                diff = ((current_price - ma[key]) / ma[key]) * 100
+                lines.append(
+                    f"股價 vs {label} {diff:+.2f}% ({'上方' if diff > 0 else '下方'})"
                 )
+            lines.append(f"MA分析: {ma['analysis']}")
+
+    rsi = result["rsi"]
+    if rsi:
+        lines.append(f"\nRSI: {rsi['value']:.1f}")
+        lines.append(f"RSI狀態: {rsi['status']}")
+
+    bb = result["bollinger"]
+    if bb:
+        lines.append(f"\n布林通道:")
+        lines.append(f"上軌: {bb['upper']:.2f}")
+        lines.append(f"中軌: {bb['middle']:.2f}")
+        lines.append(f"下軌: {bb['lower']:.2f}")
+        lines.append(
+            f"位置: {bb['position']*100:.1f}% ({'上半部' if bb['position'] > 0.5 else '下半部'})"
+        )
+        lines.append(f"布林狀態: {bb['status']}")
 
-                if bullish_signals >= 2:
-                    score += 2  # 多頭
-                elif bullish_signals == 1:
-                    score += 1  # 偏多
-                # 空頭不加分
-
-                total_indicators += 2
-
-        # KD評分
-        if len(close_prices) >= 9:
-            kd_data = calculate_kd(high_prices, low_prices, close_prices)
-            if kd_data:
-                if kd_data["k"] > kd_data["d"]:
-                    score += 1
-                if 20 < kd_data["k"] < 80:
-                    score += 1  # 正常區間
-                total_indicators += 2
-
-        # VWAP評分
-        if current_vwap and current_price:
-            if current_price > current_vwap:
-                score += 1
-            total_indicators += 1
-
-        # 五檔力道評分
-        if order_book_analysis:
-            if order_book_analysis["bid_ratio"] > 55:
-                score += 1
-            total_indicators += 1
-
-        if total_indicators > 0:
-            final_score = (score / total_indicators) * 100
-            print(f"技術面評分: {score}/{total_indicators} ({final_score:.1f}%)")
-
-            if final_score >= 70:
-                print("技術面評價: 強勢")
-            elif final_score >= 50:
-                print("技術面評價: 中性偏多")
-            elif final_score >= 30:
-                print("技術面評價: 中性偏空")
+    macd = result["macd"]
+    if macd:
+        lines.append(
+            f"\nMACD: DIF:{macd['dif']:+.3f} MACD:{macd['macd']:+.3f} OSC:{macd['osc']:+.3f}"
+        )
+        lines.append(f"MACD分析: {macd['detail']}")
+        lines.append(f"MACD訊號: {macd['signal']}")
+
+    kd = result["kd"]
+    if kd:
+        lines.append(f"\nKD: K:{kd['k']:.1f} D:{kd['d']:.1f}")
+        lines.append(f"KD狀態: {kd['status']}")
+        if kd["cross"]:
+            lines.append(f"KD訊號: {kd['cross']}")
+
+    # === 5. VWAP ===
+    vwap = result["vwap"]
+    if vwap:
+        lines.append(f"\nVWAP: {vwap['value']:.2f} (股價{vwap['diff_pct']:+.2f}%)")
+        lines.append(f"VWAP狀態: {vwap['status']}")
+
+    # === 6. 大單分析 ===
+    big_orders = result["big_orders"]
+    if big_orders:
+        lines.append(f"\n大單流向 (50張以上)")
+        lines.append("-" * 30)
+        lines.append(
+            f"大單: {big_orders['total_orders']}筆 {big_orders['total_volume']:,}張"
+        )
+        if big_orders["bid_volume"] > 0 or big_orders["ask_volume"] > 0:
+            lines.append(
+                f"內盤大單:{big_orders['bid_volume']:,}張 ({big_orders['bid_ratio']:.1f}%)"
+            )
+            lines.append(
+                f"外盤大單:{big_orders['ask_volume']:,}張 ({big_orders['ask_ratio']:.1f}%)"
+            )
+            lines.append(f"大單趨勢: {big_orders['trend']}")
+
+    # === 7. 簡易走勢圖 ===
+    lines.extend(render_simple_chart(result["candles_1m"]))
+
+    # === 8. 五檔報價 ===
+    if quote and current_price:
+        lines.append(f"\n五檔報價")
+        lines.append("-" * 20)
+        for i, ask in enumerate(result["asks"], 1):
+            lines.append(f"賣{i}: {ask.get('price', 0):>6.2f} ({ask.get('size', 0):>4}張)")
+        lines.append(f"{'現價':>4}: {current_price:>6.2f}")
+        lines.append("-" * 20)
+        for i, bid in enumerate(result["bids"], 1):
+            lines.append(f"買{i}: {bid.get('price', 0):>6.2f} ({bid.get('size', 0):>4}張)")
+
+    # === 9. 成交明細 ===
+    if result["trades"]:
+        lines.append(f"\n成交明細 (最近5筆)")
+        lines.append("-" * 25)
+        lines.append("時間     價格  張數")
+        lines.append("-" * 25)
+        for trade in result["trades"]:
+            timestamp = trade.get("time", 0)
+            if timestamp > 0:
+                t = time.strftime("%H:%M:%S", time.localtime(timestamp / 1000000))
             else:
-                print("技術面評價: 弱勢")
+                t = "N/A"
+            size = trade.get("size", 0)
+            price = trade.get("price", 0)
+            size_mark = " *" if size >= 50 else ""
+            lines.append(f"{t} {price:>6.2f} {size:>4}張{size_mark}")
+
+    # === 10. 分價量表 ===
+    profile = result["profile"]
+    if profile:
+        lines.append(f"\n分價量表 (前5檔)")
+        lines.append("-" * 25)
+        lines.append(" 價格   總量  內盤  外盤")
+        lines.append("-" * 25)
+        for item in profile["levels"]:
+            lines.append(
+                f"{item['price']:>5.1f} {item['volume']:>6} {item['volumeAtBid']:>5} {item['volumeAtAsk']:>5}"
+            )
+        if profile["poc"] is not None and profile["value_area"]:
+            lines.append(
+                f"POC: {profile['poc']:.2f} 價值區(70%): {profile['value_area'][0]:.2f} ~ {profile['value_area'][1]:.2f}"
+            )
+
+    # === 11. 綜合評分 (修正版) ===
+    lines.append(f"\n綜合技術分析評分")
+    lines.append("-" * 30)
+    score = result["score"]
+    if score:
+        lines.append(
+            f"技術面評分: {score['score']}/{score['total']} ({score['pct']:.1f}%)"
+        )
+        lines.append(f"技術面評價: {score['rating']}")
+
+    lines.append(f"{'='*60}")
+    return "\n".join(lines)
 
-        print(f"{'='*60}")
-        return True
+
+def analyze_stock_complete(reststock, symbol, verbose=True, log=print):
+    """完整股票分析 (整合即時行情 + 技術指標)
+
+    Returns:
+        collect_analysis 的結構化結果，失敗時回傳 None；
+        verbose 時同時以 log 輸出完整文字報告。
+    """
+    try:
+        result = collect_analysis(reststock, symbol, log)
+        if result is None:
+            log(f"找不到 {symbol}")
+            return None
+
+        if verbose:
+            log(render_analysis_report(result))
+        return result
 
     except Exception as e:
-        print(f"分析失敗: {e}")
+        log(f"分析失敗: {e}")
         import traceback
 
-        traceback.print_exc()
+        log(traceback.format_exc())
+        return None
+
+
+def run_isolated_analysis(stock_code, log=print):
+    """以獨立連線分析單一股票 (供機器人並行使用)
+
+    每次呼叫自行登入、分析、登出，不讀寫模組全域的 sdk/reststock，
+    所有訊息只寫入呼叫端提供的 log，多個請求同時執行也不會互相干擾。
+
+    Returns:
+        collect_analysis 的結構化結果，失敗時回傳 None
+    """
+    if not stock_code:
+        log("請提供股票代碼")
+        return None
+
+    symbol = stock_code.strip().upper()
+    session_sdk = None
+    try:
+        with stage_timer("login"):
+            session_sdk, _ = login()
+            session_sdk.init_realtime()
+        session_rest = session_sdk.marketdata.rest_client.stock
+        return analyze_stock_complete(session_rest, symbol, verbose=False, log=log)
+    except Exception as e:
+        log(f"分析過程中發生錯誤: {e}")
+        return None
+    finally:
+        close_session(session_sdk, log)
+
+
+def run_isolated_batch(stock_codes, log=print, max_workers=5):
+    """以單一獨立連線批次分析多檔股票
+
+    大盤概況只查詢一次，各股日K先以線程池並行取得，
+    再並行計算各股分析；所有訊息寫入 log。
+
+    Returns:
+        {股票代碼: 結構化結果或 None}，依輸入順序；登入失敗時各檔皆為 None
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    symbols = list(dict.fromkeys(code.strip().upper() for code in stock_codes if code))
+    results = {symbol: None for symbol in symbols}
+    if not symbols:
+        return results
+
+    session_sdk = None
+    try:
+        with stage_timer("login"):
+            session_sdk, _ = login()
+            session_sdk.init_realtime()
+        session_rest = session_sdk.marketdata.rest_client.stock
+
+        start = time.time()
+        with stage_timer("fetch.market"):
+            market_data = get_market_overview(session_rest, log)
+
+        def timed_daily_candles(symbol):
+            with stage_timer("fetch.daily"):
+                return fetch_daily_candles(session_rest, symbol)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(symbols))) as executor:
+            # 日K並行預取
+            candle_futures = {
+                symbol: executor.submit(timed_daily_candles, symbol)
+                for symbol in symbols
+            }
+            candles = {}
+            for symbol, future in candle_futures.items():
+                try:
+                    candles[symbol] = future.result()
+                except Exception as e:
+                    log(f"{symbol} 取得日K失敗: {e}")
+                    candles[symbol] = {}
+
+            def analyze(symbol):
+                try:
+                    result = collect_analysis(
+                        session_rest, symbol, log, market_data, candles[symbol]
+                    )
+                    if result is None:
+                        log(f"找不到 {symbol}")
+                    return result
+                except Exception as e:
+                    log(f"{symbol} 分析失敗: {e}")
+                    return None
+
+            for symbol, result in zip(symbols, executor.map(analyze, symbols)):
+                results[symbol] = result
+
+        log(f"批次分析 {len(symbols)} 檔完成，耗時 {time.time() - start:.1f} 秒")
+    except Exception as e:
+        log(f"批次分析過程中發生錯誤: {e}")
+    finally:
+        close_session(session_sdk, log)
+
+    return results
+
+
+def check_login(log=print):
+    """測試登入是否正常 (登入後立即登出，不保留全域連線)"""
+    session_sdk = None
+    try:
+        session_sdk, _ = login()
+        return True
+    except Exception as e:
+        log(f"登入失敗: {e}")
         return False
+    finally:
+        close_session(session_sdk, log)
 
 
 def init_system():
@@ -1127,8 +1398,8 @@ def analyze_stock(symbol):
     return analyze_stock_complete(reststock, symbol)
 
 
-def analyze_stock_with_logout(symbol):
-    """分析股票後自動登出 (Telegram 機器人專用)"""
+def analyze_stock_with_logout(symbol, verbose=True):
+    """分析股票後自動登出 (Telegram 機器人專用)，回傳結構化結果"""
     global reststock, login_success
 
     if not login_success:
@@ -1143,7 +1414,7 @@ def analyze_stock_with_logout(symbol):
 
     try:
         # 執行分析
-        result = analyze_stock_complete(reststock, symbol)
+        result = analyze_stock_complete(reststock, symbol, verbose)
 
         # 分析完成後立即登出
         logout_system()
@@ -1196,14 +1467,18 @@ def run_analysis(stock_code):
     return analyze_stock(stock_code)
 
 
-def run_analysis_with_logout(stock_code):
-    """供 Telegram 機器人調用的分析函數 (包含自動登出)"""
+def run_analysis_with_logout(stock_code, verbose=True):
+    """供 Telegram 機器人調用的分析函數 (包含自動登出)
+
+    Returns:
+        collect_analysis 的結構化結果，失敗時為 False/None
+    """
     # 初始化系統 (如果尚未初始化)
     if not login_success:
         if not init_system():
             return False
 
-    return analyze_stock_with_logout(stock_code)
+    return analyze_stock_with_logout(stock_code, verbose)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta
+
+# 台股一般交易時段
+MARKET_OPEN = (9, 0)
+MARKET_CLOSE = (13, 30)
+
+
+def is_trading_time(now):
+    """是否在交易時段內 (週一至週五 09:00-13:30，不含國定假日)"""
+    if now.weekday() >= 5:
+        return False
+    open_time = now.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0)
+    close_time = now.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+    return open_time <= now < close_time
+
+
+def next_market_open(now):
+    """下一次開盤時間"""
+    candidate = now.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def format_age(seconds):
+    """資料年齡顯示文字"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} 秒前"
+    if seconds < 3600:
+        return f"{seconds // 60} 分鐘前"
+    if seconds < 86400:
+        return f"{seconds // 3600} 小時前"
+    return f"{seconds // 86400} 天前"
+
+
+class AnalysisCache:
+    """個股分析結果快取 (stale-while-revalidate)
+
+    盤中存入的結果 ttl 秒內視為新鮮；盤後存入的結果到下次開盤前都有效。
+    過期後 max_stale 秒內仍可先回覆舊資料，同時由呼叫端在背景重新分析。
+    """
+
+    def __init__(self, ttl=None, max_stale=None):
+        self.ttl = ttl if ttl is not None else int(os.getenv("ANALYSIS_CACHE_TTL", "60"))
+        self.max_stale = (
+            max_stale
+            if max_stale is not None
+            else int(os.getenv("ANALYSIS_CACHE_MAX_STALE", "600"))
+        )
+        self.entries = {}  # symbol -> (result, 存入時間)
+
+    def expires_at(self, stored_at):
+        """結果的新鮮期限"""
+        if is_trading_time(stored_at):
+            return stored_at + timedelta(seconds=self.ttl)
+        return next_market_open(stored_at)
+
+    def lookup(self, symbol, now=None):
+        """查詢快取
+
+        Returns:
+            (結果, 資料年齡秒數, 狀態)，狀態為 "fresh"、"stale" 或 "miss"
+        """
+        entry = self.entries.get(symbol)
+        if entry is None:
+            return None, None, "miss"
+
+        now = now or datetime.now()
+        result, stored_at = entry
+        age = (now - stored_at).total_seconds()
+        expires = self.expires_at(stored_at)
+
+        if now < expires:
+            return result, age, "fresh"
+        if (now - expires).total_seconds() <= self.max_stale:
+            return result, age, "stale"
+        return None, None, "miss"
+
+    def store(self, symbol, result, stored_at=None):
+        self.entries[symbol] = (result, stored_at or datetime.now())
+
+    def __len__(self):
+        return len(self.entries)
@@ -4,9 +4,20 @@ import asyncio
 import logging
 import tempfile
 import datetime
+import io
 import re
-from io import StringIO
-from contextlib import redirect_stdout, redirect_stderr
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from analysis_cache import AnalysisCache, format_age
+from watchlist import Watchlist, CONDITION_HELP
+from stage_metrics import metrics, stage_timer
+from job_queue import (
+    JobQueue,
+    QueueFull,
+    PRIORITY_ADMIN,
+    PRIORITY_NORMAL,
+    PRIORITY_BACKGROUND,
+)
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -19,7 +30,12 @@ from dotenv import load_dotenv
 
 # 導入您的 GaN 分析模組
 try:
-    from GaN import init_system, run_analysis_with_logout, login_success, sdk
+    from GaN import (
+        check_login,
+        run_isolated_analysis,
+        run_isolated_batch,
+        render_analysis_report,
+    )
 except ImportError:
     print("請確保 GaN.py 在同一目錄下")
     sys.exit(1)
@@ -40,6 +56,36 @@ class StockAnalysisBot:
         self.app = Application.builder().token(token).build()
         self.gan_initialized = False
 
+        # 分析專用線程池，每個請求使用獨立連線，可同時分析多檔
+        workers = int(os.getenv("ANALYSIS_WORKERS", "4"))
+        self.analysis_executor = ThreadPoolExecutor(max_workers=workers)
+        self.active_analyses = 0
+
+        # 分析工作佇列：限制同時分析數，管理員優先，各聊天室輪流
+        self.jobs = JobQueue(
+            concurrency=workers,
+            max_depth=int(os.getenv("ANALYSIS_QUEUE_DEPTH", "50")),
+            max_per_chat=int(os.getenv("ANALYSIS_QUEUE_PER_CHAT", "3")),
+        )
+        self.admin_chat_ids = {
+            int(chat_id)
+            for chat_id in os.getenv("TELEGRAM_ADMIN_CHAT_IDS", "").split(",")
+            if chat_id.strip()
+        }
+
+        # 分析結果快取與進行中的分析 (同一檔只跑一次)
+        self.cache = AnalysisCache()
+        self.inflight = {}
+        self.revalidating = set()
+        # 在處理器之外執行的工作 (保留參照避免被回收)
+        self.background_tasks = set()
+
+        # 串流監控 (第一次 /watch 時才登入並建立 websocket)
+        self.watchlist = Watchlist(
+            self.push_alert, max_per_chat=int(os.getenv("WATCH_MAX_PER_CHAT", "20"))
+        )
+        self.loop = None
+
         # 註冊處理器
         self.setup_handlers()
 
@@ -50,6 +96,12 @@ class StockAnalysisBot:
         self.app.add_handler(CommandHandler("help", self.help_command))
         self.app.add_handler(CommandHandler("status", self.status_command))
         self.app.add_handler(CommandHandler("init", self.init_command))
+        self.app.add_handler(CommandHandler("queue", self.queue_command))
+        self.app.add_handler(CommandHandler("batch", self.batch_command))
+        self.app.add_handler(CommandHandler("metrics", self.metrics_command))
+        self.app.add_handler(CommandHandler("watch", self.watch_command))
+        self.app.add_handler(CommandHandler("unwatch", self.unwatch_command))
+        self.app.add_handler(CommandHandler("watchlist", self.watchlist_command))
 
         # 訊息處理器 - 處理股票代碼
         self.app.add_handler(
@@ -141,6 +193,11 @@ class StockAnalysisBot:
 
 ⚙️ 系統指令：
 /status - 檢查連線狀態
+/queue - 查看排隊狀況
+/batch 2330 2454 0050 - 批次分析並排名
+/watch 2330 price>600 - 條件觸發時主動通知
+/unwatch 2330 [條件] - 取消監控
+/watchlist - 查看監控清單
 /init - 重新初始化（如遇問題可使用）
 
 💬 支援格式：
@@ -152,17 +209,16 @@ class StockAnalysisBot:
 
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """狀態檢查指令"""
-        global login_success
-
         status_text = f"""
 🔧 系統狀態檢查
 
 機器人狀態: ✅ 運行中 (增強版 v2.1)
-GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (已登出)'}
-富邦登入: {'✅ 已登入' if login_success else '❌ 未登入 (已登出)'}
+GaN系統: {'✅ 登入測試成功' if self.gan_initialized else '❌ 尚未測試登入'}
+分析模式: 每次查詢獨立登入/登出，可同時分析
+進行中分析: {self.active_analyses} 筆
 
-{('🟢 系統正常，可以查詢股票' if self.gan_initialized and login_success 
-  else '🟡 系統已登出，下次查詢時會自動重新登入')}
+{('🟢 系統正常，可以查詢股票' if self.gan_initialized
+  else '🟡 尚未測試登入，查詢時會自動登入')}
 
 🆕 新功能狀態:
 • RSI 指標: ✅ 可用
@@ -185,9 +241,11 @@ GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (
             # 顯示初始化訊息
             init_msg = await update.message.reply_text("⏳ 正在初始化股票分析系統...")
 
-            # 在後台執行初始化
-            loop = asyncio.get_event_loop()
-            success = await loop.run_in_executor(None, init_system)
+            # 在後台測試登入 (登入後立即登出，分析時各請求自行登入)
+            loop = asyncio.get_running_loop()
+            success = await loop.run_in_executor(
+                self.analysis_executor, check_login, logger.info
+            )
 
             if success:
                 self.gan_initialized = True
@@ -220,74 +278,418 @@ GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (
             )
             return
 
-        # 檢查系統狀態
-        if not self.gan_initialized:
-            await update.message.reply_text("⚠️ 系統尚未初始化，正在初始化中...")
-            await self.initialize_gan_system(update, context)
-            if not self.gan_initialized:
-                return
+        # 快取命中：新鮮資料直接回覆；過期資料先回覆再於背景重新分析
+        cached, age, state = self.cache.lookup(user_input)
+        if state != "miss":
+            revalidating = state == "stale"
+            if revalidating:
+                self.revalidate(user_input)
+            await self.send_analysis_file(update, cached)
+            await self.send_analysis_summary(update, cached, age, revalidating)
+            return
+
+        # 同一檔已在分析中，在背景等待結果，不佔用佇列也不阻塞其他更新的處理
+        if user_input in self.inflight:
+            analysis_msg = await update.message.reply_text(f"📊 分析中")
+            self.spawn(self.reply_analysis(update, analysis_msg, user_input))
+            return
+
+        await self.enqueue(
+            update,
+            lambda msg, queued: self.reply_analysis(update, msg, user_input, queued),
+            f"📊 分析中",
+        )
+
+    async def enqueue(self, update: Update, run, running_text):
+        """排入分析佇列並回覆狀態訊息
 
-        # 開始分析
-        analysis_msg = await update.message.reply_text(f"📊 分析中")
+        run(狀態訊息, 是否曾排隊) 為輪到時執行的 coroutine function。
+        """
+        chat_id = update.effective_chat.id
+        priority = (
+            PRIORITY_ADMIN if chat_id in self.admin_chat_ids else PRIORITY_NORMAL
+        )
+
+        # 先排入佇列，待回覆訊息送出後工作才開始，避免訊息更新順序錯亂
+        holder = {}
+        ready = asyncio.Event()
+
+        async def job():
+            await ready.wait()
+            if holder.get("msg") is not None:
+                await run(holder["msg"], holder["queued"])
 
         try:
-            # 捕獲分析輸出
-            output_buffer = StringIO()
-            error_buffer = StringIO()
-
-            with redirect_stdout(output_buffer), redirect_stderr(error_buffer):
-                # 在後台執行分析 (使用帶登出功能的版本)
-                loop = asyncio.get_event_loop()
-                success = await loop.run_in_executor(
-                    None, run_analysis_with_logout, user_input
-                )
+            position = await self.jobs.submit(chat_id, job, priority)
+        except QueueFull as e:
+            await update.message.reply_text(f"⚠️ 系統忙碌：{e}，請稍後再試")
+            return
+
+        try:
+            holder["queued"] = position > 0
+            holder["msg"] = await update.message.reply_text(
+                f"⏳ 已排入佇列，第 {position} 位" if position else running_text
+            )
+        finally:
+            ready.set()
+
+    async def reply_analysis(
+        self, update: Update, analysis_msg, symbol, queued=False
+    ):
+        """執行分析 (或使用排隊期間完成的快取) 並回覆結果"""
+        if queued:
+            try:
+                await analysis_msg.edit_text(f"📊 分析中")
+            except Exception:
+                pass
+
+        # 排隊期間可能已有其他請求完成同一檔
+        cached, age, state = self.cache.lookup(symbol)
+        if state == "fresh":
+            await self.send_analysis_file(update, cached)
+            await self.send_analysis_summary(update, cached, age)
+            try:
+                await analysis_msg.delete()
+            except Exception:
+                pass
+            return
 
-            # 取得輸出結果
-            analysis_output = output_buffer.getvalue()
-            error_output = error_buffer.getvalue()
+        try:
+            result, request_log = await self.run_analysis(symbol)
 
-            if success and analysis_output:
+            if result:
                 # 先發送 TXT 檔案
-                await self.send_analysis_file(update, analysis_output, user_input)
+                await self.send_analysis_file(update, result)
 
                 # 再發送摘要訊息
-                await self.send_analysis_summary(update, analysis_output, user_input)
-
-                # 🔒 系統已在 GaN 模組中自動登出，更新本地狀態
-                self.gan_initialized = False
+                await self.send_analysis_summary(update, result, 0)
 
                 # 刪除分析中訊息
                 try:
                     await analysis_msg.delete()
-                except:
+                except Exception:
                     pass
 
             else:
-                error_msg = f"❌ 分析 {user_input} 失敗"
-                if error_output:
-                    error_msg += f"\n錯誤訊息：{error_output[:200]}"
+                error_msg = f"❌ 分析 {symbol} 失敗"
+                errors = [line for line in request_log if "失敗" in line or "錯誤" in line]
+                if errors:
+                    error_msg += f"\n錯誤訊息：{errors[-1][:200]}"
                 await analysis_msg.edit_text(error_msg)
 
         except Exception as e:
-            logger.error(f"分析股票 {user_input} 時發生錯誤: {e}")
+            logger.error(f"分析股票 {symbol} 時發生錯誤: {e}")
             await analysis_msg.edit_text(f"❌ 分析過程中發生錯誤：{str(e)}")
-            # 發生錯誤時重置狀態
-            self.gan_initialized = False
 
-    async def send_analysis_file(
-        self, update: Update, analysis_content: str, stock_code: str
+    async def run_analysis(self, symbol):
+        """執行分析並寫入快取，同一檔已在分析中時共用同一個結果
+
+        Returns:
+            (結構化結果或 None, 該次分析的訊息列表)
+        """
+        task = self.inflight.get(symbol)
+        if task is None:
+            task = asyncio.ensure_future(self._analyze(symbol))
+            self.inflight[symbol] = task
+            task.add_done_callback(lambda _: self.inflight.pop(symbol, None))
+        return await asyncio.shield(task)
+
+    async def _analyze(self, symbol):
+        # 每個請求自己的訊息收集器 (不替換 sys.stdout，並行請求不會互相混入)
+        request_log = []
+
+        # 在後台以獨立連線執行分析 (自行登入/登出)，直接取得結構化結果
+        self.active_analyses += 1
+        loop = asyncio.get_running_loop()
+        try:
+            with stage_timer("analysis"):
+                result = await loop.run_in_executor(
+                    self.analysis_executor,
+                    run_isolated_analysis,
+                    symbol,
+                    request_log.append,
+                )
+        finally:
+            self.active_analyses -= 1
+
+        for line in request_log:
+            logger.info(f"[{symbol}] {line}")
+
+        if result:
+            self.cache.store(symbol, result)
+        return result, request_log
+
+    def spawn(self, coro):
+        """在背景執行 coroutine，處理器可立即返回"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def revalidate(self, symbol):
+        """背景重新分析過期的快取 (以最低優先排入佇列，已在分析或排隊中則略過)"""
+        if symbol in self.inflight or symbol in self.revalidating:
+            return
+        self.revalidating.add(symbol)
+
+        async def refresh():
+            try:
+                await self.run_analysis(symbol)
+            finally:
+                self.revalidating.discard(symbol)
+
+        async def enqueue():
+            try:
+                await self.jobs.submit("background", refresh, PRIORITY_BACKGROUND)
+            except QueueFull:
+                self.revalidating.discard(symbol)
+                logger.info(f"佇列忙碌，略過背景更新 {symbol}")
+
+        self.spawn(enqueue())
+
+    def push_alert(self, chat_id, text):
+        """由 websocket 執行緒呼叫，轉交 event loop 發送推播"""
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(
+            self.app.bot.send_message(chat_id=chat_id, text=text), self.loop
+        )
+
+    async def watch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """新增監控條件：/watch 2330 price>600"""
+        if len(context.args) < 2 or not self.is_valid_stock_code(context.args[0]):
+            await update.message.reply_text(f"用法：/watch 股票代碼 條件\n{CONDITION_HELP}")
+            return
+
+        symbol = context.args[0].strip().upper()
+        condition = "".join(context.args[1:])
+        self.loop = asyncio.get_running_loop()
+        try:
+            # 第一次監控會登入並取得初始資料，在背景線程執行
+            watch = await self.loop.run_in_executor(
+                self.analysis_executor,
+                self.watchlist.add,
+                update.effective_chat.id,
+                symbol,
+                condition,
+            )
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        except Exception as e:
+            logger.error(f"新增監控 {symbol} 失敗: {e}")
+            await update.message.reply_text(f"❌ 新增監控失敗：{e}")
+            return
+
+        await update.message.reply_text(
+            f"👀 已開始監控 {symbol} {watch['text']}，條件觸發時會主動通知"
+        )
+
+    async def unwatch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """取消監控：/unwatch 2330 [條件]"""
+        if not context.args:
+            await update.message.reply_text("用法：/unwatch 股票代碼 [條件]")
+            return
+
+        symbol = context.args[0].strip().upper()
+        condition = "".join(context.args[1:]) or None
+        try:
+            removed = self.watchlist.remove(update.effective_chat.id, symbol, condition)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+
+        if removed:
+            await update.message.reply_text(f"✅ 已取消 {symbol} 的 {removed} 個監控條件")
+        else:
+            await update.message.reply_text(f"⚠️ 沒有找到 {symbol} 的監控條件")
+
+    async def watchlist_command(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
-        """將分析結果製作成 TXT 檔案並發送"""
+        """列出本聊天室的監控條件"""
+        watches = self.watchlist.list(update.effective_chat.id)
+        if not watches:
+            await update.message.reply_text("目前沒有監控條件，使用 /watch 新增")
+            return
+        lines = [f"• {w['symbol']} {w['text']}" for w in watches]
+        await update.message.reply_text("👀 監控清單\n" + "\n".join(lines))
+
+    async def queue_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """排隊狀況指令"""
+        m = self.jobs.metrics()
+        await update.message.reply_text(
+            f"📮 分析佇列狀態\n"
+            f"執行中: {m['running']}/{m['concurrency']}\n"
+            f"排隊中: {m['depth']} 筆 (管理員 {m['waiting_admin']} / 一般 {m['waiting_normal']} / 背景 {m['waiting_background']})\n"
+            f"已完成: {m['processed']} 筆 | 失敗: {m['failed']} | 拒絕: {m['rejected']}\n"
+            f"等待時間: 平均 {m['avg_wait']:.1f}s | p95 {m['p95_wait']:.1f}s | 最長 {m['max_wait']:.1f}s"
+        )
+
+    async def metrics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """各階段耗時統計 (僅限管理員)：/metrics [dump]"""
+        if update.effective_chat.id not in self.admin_chat_ids:
+            await update.message.reply_text("⛔ 此指令僅限管理員使用")
+            return
+
+        if context.args and context.args[0].lower() == "dump":
+            try:
+                path = metrics.dump()
+            except Exception as e:
+                await update.message.reply_text(f"❌ 寫入統計檔失敗：{e}")
+                return
+            await update.message.reply_text(f"✅ 已寫入 {path}")
+            return
+
+        m = self.jobs.metrics()
+        await update.message.reply_text(
+            f"⏱ 各階段耗時 (毫秒，最近 {metrics.window} 筆)\n"
+            f"{metrics.render()}\n\n"
+            f"排隊等待: p95 {m['p95_wait'] * 1000:.0f} | 最長 {m['max_wait'] * 1000:.0f}"
+        )
+
+    async def batch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """批次分析：/batch 2330 2454 0050"""
+        max_symbols = int(os.getenv("BATCH_MAX_SYMBOLS", "20"))
+        codes = [code.strip().upper() for code in context.args]
+        invalid = [code for code in codes if not self.is_valid_stock_code(code)]
+        symbols = list(dict.fromkeys(code for code in codes if code not in invalid))
+
+        if not symbols:
+            await update.message.reply_text("用法：/batch 股票代碼1 股票代碼2 ...")
+            return
+        if len(symbols) > max_symbols:
+            await update.message.reply_text(f"❌ 一次最多分析 {max_symbols} 檔")
+            return
+        if invalid:
+            await update.message.reply_text(f"⚠️ 略過無效代碼：{', '.join(invalid)}")
+
+        await self.enqueue(
+            update,
+            lambda msg, queued: self.reply_batch(update, msg, symbols, queued),
+            f"📦 批次分析中 ({len(symbols)} 檔)",
+        )
+
+    async def reply_batch(self, update: Update, batch_msg, symbols, queued=False):
+        """批次分析並回覆排名摘要與報告壓縮檔"""
+        if queued:
+            try:
+                await batch_msg.edit_text(f"📦 批次分析中 ({len(symbols)} 檔)")
+            except Exception:
+                pass
+
+        # 快取中仍新鮮的直接使用，其餘共用同一個連線一次分析
+        results = {}
+        pending = []
+        for symbol in symbols:
+            cached, _, state = self.cache.lookup(symbol)
+            if state == "fresh":
+                results[symbol] = cached
+            else:
+                pending.append(symbol)
+
         try:
-            # 建立檔案名稱（包含時間戳記）
+            if pending:
+                request_log = []
+                self.active_analyses += 1
+                loop = asyncio.get_running_loop()
+                try:
+                    with stage_timer("batch"):
+                        fetched = await loop.run_in_executor(
+                            self.analysis_executor,
+                            run_isolated_batch,
+                            pending,
+                            request_log.append,
+                        )
+                finally:
+                    self.active_analyses -= 1
+
+                for line in request_log:
+                    logger.info(f"[batch] {line}")
+                for symbol, result in fetched.items():
+                    results[symbol] = result
+                    if result:
+                        self.cache.store(symbol, result)
+
+            ordered = {symbol: results.get(symbol) for symbol in symbols}
+            reports = [r for r in ordered.values() if r]
+            if not reports:
+                await batch_msg.edit_text(f"❌ 批次分析失敗：{', '.join(symbols)}")
+                return
+
+            # 各檔 TXT 報告打包成單一壓縮檔
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for result in reports:
+                    filename, file_content = self.build_report_file(result)
+                    archive.writestr(filename, file_content)
+            buffer.seek(0)
+
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{stock_code}_analysis_{timestamp}.txt"
+            with stage_timer("upload"):
+                await update.message.reply_document(
+                    document=buffer,
+                    filename=f"batch_analysis_{timestamp}.zip",
+                    caption=f"📦 批次分析報告 ({len(reports)} 檔)",
+                )
+            await update.message.reply_text(self.build_batch_summary(ordered))
+
+            try:
+                await batch_msg.delete()
+            except Exception:
+                pass
+
+        except Exception as e:
+            logger.error(f"批次分析時發生錯誤: {e}")
+            await batch_msg.edit_text(f"❌ 批次分析過程中發生錯誤：{str(e)}")
+
+    def build_batch_summary(self, results):
+        """依技術面評分排序的批次摘要"""
+        reports = [r for r in results.values() if r]
+        failed = [symbol for symbol, r in results.items() if not r]
+        ranked = sorted(
+            reports,
+            key=lambda r: r["score"]["pct"] if r["score"] else -1,
+            reverse=True,
+        )
+
+        lines = [f"📦 批次分析排名 (成功 {len(reports)} / 共 {len(results)} 檔)", "=" * 30]
+        for rank, result in enumerate(ranked, 1):
+            quote = result["quote"]
+            change = f" ({quote['change_pct']:+.2f}%)" if quote else ""
+            score = result["score"]
+            score_text = f"{score['pct']:.0f}% {score['rating']}" if score else "無評分"
+            lines.append(
+                f"{rank}. {result['symbol']} {result['name']} {result['price']}{change}"
+            )
 
-            # 準備檔案內容
-            file_content = f"""股票分析報告 (增強版)
+            details = [f"🏆 {score_text}"]
+            if result["rsi"]:
+                details.append(f"RSI {result['rsi']['value']:.0f}")
+            if result["vwap"]:
+                details.append(result["vwap"]["status"])
+            lines.append("   " + " | ".join(details))
+
+        if failed:
+            lines.append("=" * 30)
+            lines.append(f"❌ 分析失敗：{', '.join(failed)}")
+        return "\n".join(lines)
+
+    def build_report_file(self, result):
+        """產生 TXT 報告的檔名與內容"""
+        stock_code = result["symbol"]
+        with stage_timer("render"):
+            analysis_content = render_analysis_report(result)
+
+        # 建立檔案名稱（包含時間戳記）
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{stock_code}_analysis_{timestamp}.txt"
+
+        # 準備檔案內容
+        file_content = f"""股票分析報告 (增強版)
 ==========================================
 股票代碼: {stock_code}
-分析時間: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+分析時間: {result["analyzed_at"]}
 系統版本: GaN Stock Analysis Bot v2.1 Enhanced
 ==========================================
 
@@ -305,6 +707,13 @@ GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (
 ==========================================
 生成時間: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 """
+        return filename, file_content
+
+    async def send_analysis_file(self, update: Update, result):
+        """將分析結果製作成 TXT 檔案並發送"""
+        stock_code = result["symbol"]
+        try:
+            filename, file_content = self.build_report_file(result)
 
             # 建立臨時檔案
             with tempfile.NamedTemporaryFile(
@@ -314,7 +723,7 @@ GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (
                 temp_file_path = temp_file.name
 
             # 發送檔案
-            with open(temp_file_path, "rb") as file:
+            with open(temp_file_path, "rb") as file, stage_timer("upload"):
                 await update.message.reply_document(
                     document=file,
                     filename=filename,
@@ -331,24 +740,33 @@ GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (
             await update.message.reply_text(f"❌ 檔案生成失敗：{str(e)}")
 
     async def send_analysis_summary(
-        self, update: Update, analysis_content: str, stock_code: str
+        self, update: Update, result, age=None, revalidating=False
     ):
-        """發送分析摘要（增強版本）"""
+        """發送分析摘要（增強版本），age 為資料年齡秒數"""
+        stock_code = result["symbol"]
         try:
-            # 提取關鍵資訊製作摘要
-            summary = self.extract_enhanced_summary(analysis_content, stock_code)
+            summary = self.build_summary(result)
+
+            current_time = result["analyzed_at"]
+            age_text = ""
+            if age is not None:
+                age_text = f"⏱ 資料年齡: {format_age(age)}"
+                if age > 0:
+                    age_text += " (快取，背景更新中)" if revalidating else " (快取)"
+                age_text += "\n"
 
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             # 構建摘要訊息
             summary_message = (
                 f"📋 {stock_code} 分析摘要\n"
                 f"🕐 分析時間: {current_time}\n"
+                f"{age_text}"
                 f"{'='*30}\n"
                 f"{summary}\n"
                 f"{'='*30}\n"
             )
 
-            await update.message.reply_text(summary_message)
+            with stage_timer("reply"):
+                await update.message.reply_text(summary_message)
 
         except Exception as e:
             logger.error(f"發送摘要時發生錯誤: {e}")
@@ -359,200 +777,74 @@ GaN系統: {'✅ 已初始化' if self.gan_initialized else '❌ 未初始化 (
             except Exception as fallback_error:
                 logger.error(f"發送備用訊息也失敗: {fallback_error}")
 
-    def extract_enhanced_summary(self, analysis_content: str, stock_code: str):
-        """從完整分析中提取關鍵摘要（增強版）"""
-        try:
-            lines = analysis_content.split("\n")
-            summary_parts = []
-
-            # 用於儲存特殊資訊
-            vwap_info = {"value": None, "status": None, "current_price": None}
-            order_book_info = {"bid_total": 0, "ask_total": 0, "sentiment": None}
-
-            # 尋找關鍵資訊
-            for i, line in enumerate(lines):
-                line = line.strip()
-
-                # 股價資訊
-                if "目前價格:" in line:
-                    summary_parts.append(f"💰 {line}")
-                    # 提取現價用於 VWAP 對照
-                    try:
-                        import re
-
-                        price_match = re.search(r"目前價格:\s*([0-9.]+)", line)
-                        if price_match:
-                            vwap_info["current_price"] = float(price_match.group(1))
-                    except:
-                        pass
-
-                # VWAP 資訊收集
-                elif line.startswith("VWAP:") and "股價" in line:
-                    try:
-                        import re
-
-                        # 提取 VWAP 數值: "VWAP: 95.14 (股價+2.35%)"
-                        vwap_match = re.search(r"VWAP:\s*([0-9.]+)", line)
-                        if vwap_match:
-                            vwap_info["value"] = float(vwap_match.group(1))
-                    except:
-                        pass
-                elif "VWAP狀態:" in line:
-                    vwap_info["status"] = line.replace("VWAP狀態:", "").strip()
-
-                # 五檔力道資訊收集
-                elif "買盤力道:" in line and "%" in line:
-                    try:
-                        import re
-
-                        # 提取買盤張數: "買盤力道: 45.2% (1200張)"
-                        bid_match = re.search(r"\(([0-9,]+)張\)", line)
-                        if bid_match:
-                            order_book_info["bid_total"] = int(
-                                bid_match.group(1).replace(",", "")
-                            )
-                    except:
-                        pass
-                elif "賣盤力道:" in line and "%" in line:
-                    try:
-                        import re
-
-                        # 提取賣盤張數: "賣盤力道: 54.8% (1460張)"
-                        ask_match = re.search(r"\(([0-9,]+)張\)", line)
-                        if ask_match:
-                            order_book_info["ask_total"] = int(
-                                ask_match.group(1).replace(",", "")
-                            )
-                    except:
-                        pass
-                elif "市場情緒:" in line:
-                    order_book_info["sentiment"] = line.replace("市場情緒:", "").strip()
-
-                # 技術指標摘要
-                elif line.startswith("MA5:") and i + 2 < len(lines):
-                    # 收集 MA 資訊
-                    ma_info = []
-                    for j in range(3):  # MA5, MA10, MA20
-                        if i + j < len(lines) and (
-                            "MA" in lines[i + j] or "股價 vs MA" in lines[i + j]
-                        ):
-                            ma_line = lines[i + j].strip()
-                            if ma_line.startswith("MA"):
-                                ma_info.append(ma_line)
-                    if ma_info:
-                        summary_parts.append(f"📈 {' | '.join(ma_info[:2])}")
-
-                # MA 排列
-                elif "MA排列:" in line:
-                    summary_parts.append(f"📊 {line}")
-
-                # RSI 狀態 (新增)
-                elif "RSI狀態:" in line:
-                    rsi_line = None
-                    # 找前一行的 RSI 數值
-                    if i > 0:
-                        prev_line = lines[i - 1].strip()
-                        if prev_line.startswith("RSI:"):
-                            rsi_line = prev_line
-                    summary_parts.append(
-                        f"🔥 {rsi_line + ' ' if rsi_line else ''}{line}"
-                    )
-
-                # 布林通道狀態 (新增)
-                elif "布林狀態:" in line:
-                    summary_parts.append(f"📏 {line}")
-
-                # MACD 訊號
-                elif "MACD訊號:" in line:
-                    summary_parts.append(f"🎯 {line}")
-
-                # KD 狀態和交叉
-                elif "KD狀態:" in line:
-                    summary_parts.append(f"📊 {line}")
-                elif "KD訊號:" in line and ("黃金交叉" in line or "死亡交叉" in line):
-                    summary_parts.append(f"⚡ {line}")
-
-                # 大單趨勢 (新增)
-                elif "大單趨勢:" in line:
-                    summary_parts.append(f"💼 {line}")
-
-                # 綜合技術分析評分 (新增)
-                elif "技術面評價:" in line:
-                    # 尋找前一行的評分
-                    score_line = None
-                    if i > 0 and "技術面評分:" in lines[i - 1]:
-                        score_line = lines[i - 1].strip()
-                    summary_parts.append(
-                        f"🏆 {score_line + ' | ' if score_line else ''}{line}"
-                    )
-
-            # 生成 VWAP 對照資訊
-            if (
-                vwap_info["value"]
-                and vwap_info["current_price"]
-                and vwap_info["status"]
-            ):
-                vwap_summary = f"🧭 VWAP: {vwap_info['value']:.2f} ｜目前價格{vwap_info['status'].replace('股價', '').replace('VWAP', 'VWAP')}"
-                summary_parts.insert(1, vwap_summary)  # 插入到股價後面
-
-            # 生成五檔買賣力道概況
-            if order_book_info["bid_total"] > 0 and order_book_info["ask_total"] > 0:
-                # 判斷上壓下撐
-                if order_book_info["ask_total"] > order_book_info["bid_total"]:
-                    pressure_situation = "上壓>下撐"
-                    pressure_detail = f"賣1~賣3 共{order_book_info['ask_total']:,}張 vs 買1~買3 約{order_book_info['bid_total']:,}張"
-                elif order_book_info["bid_total"] > order_book_info["ask_total"]:
-                    pressure_situation = "下撐>上壓"
-                    pressure_detail = f"買1~買3 共{order_book_info['bid_total']:,}張 vs 賣1~賣3 約{order_book_info['ask_total']:,}張"
-                else:
-                    pressure_situation = "上壓≈下撐"
-                    pressure_detail = (
-                        f"買賣力道均衡 約{order_book_info['bid_total']:,}張"
-                    )
-
-                order_book_summary = (
-                    f"📦 五檔：{pressure_situation}（{pressure_detail}）"
-                )
-                summary_parts.insert(2, order_book_summary)  # 插入到 VWAP 後面
+    def build_summary(self, result):
+        """由結構化分析結果產生摘要（增強版）"""
+        stock_code = result["symbol"]
+        important_parts = []
+        other_parts = []
+
+        # 股價資訊
+        quote = result["quote"]
+        if quote:
+            change = quote["change"]
+            trend = "+" if change > 0 else "-" if change < 0 else "="
+            important_parts.append(
+                f"💰 目前價格: {result['price']} {trend} {change:+.1f} ({quote['change_pct']:+.2f}%)"
+            )
 
-            # 如果沒有找到關鍵資訊，返回基本摘要
-            if not summary_parts:
-                return (
-                    f"✅ 已完成 {stock_code} 增強版分析\n📄 請查看 TXT 檔案獲取完整報告"
-                )
+        # VWAP 對照資訊
+        vwap = result["vwap"]
+        if vwap:
+            important_parts.append(
+                f"🧭 VWAP: {vwap['value']:.2f} ｜目前價格{vwap['status'].replace('股價', '')}"
+            )
 
-            # 限制摘要長度，優先顯示重要資訊
-            important_keywords = [
-                "目前價格",
-                "VWAP:",
-                "五檔：",
-                "技術面評價",
-                "RSI狀態",
-                "市場情緒",
-                "MA排列",
-                "MACD訊號",
-            ]
-
-            # 先取重要資訊
-            important_parts = []
-            other_parts = []
-
-            for part in summary_parts:
-                is_important = any(keyword in part for keyword in important_keywords)
-                if is_important:
-                    important_parts.append(part)
-                else:
-                    other_parts.append(part)
-
-            # 組合摘要，重要資訊優先，總共最多10行（增加2行給新功能）
-            selected_parts = important_parts[:8] + other_parts[:2]
-
-            return "\n".join(selected_parts[:10])
+        # 五檔買賣力道概況 (判斷上壓下撐)
+        order_book = result["order_book"]
+        if order_book:
+            bid_total = order_book["total_bid_size"]
+            ask_total = order_book["total_ask_size"]
+            if ask_total > bid_total:
+                pressure_situation = "上壓>下撐"
+                pressure_detail = f"賣1~賣3 共{ask_total:,}張 vs 買1~買3 約{bid_total:,}張"
+            elif bid_total > ask_total:
+                pressure_situation = "下撐>上壓"
+                pressure_detail = f"買1~買3 共{bid_total:,}張 vs 賣1~賣3 約{ask_total:,}張"
+            else:
+                pressure_situation = "上壓≈下撐"
+                pressure_detail = f"買賣力道均衡 約{bid_total:,}張"
+            important_parts.append(f"📦 五檔：{pressure_situation}（{pressure_detail}）")
+
+        if result["rsi"]:
+            rsi = result["rsi"]
+            important_parts.append(f"🔥 RSI: {rsi['value']:.1f} RSI狀態: {rsi['status']}")
+        if result["macd"]:
+            important_parts.append(f"🎯 MACD訊號: {result['macd']['signal']}")
+        if result["score"]:
+            score = result["score"]
+            important_parts.append(
+                f"🏆 技術面評分: {score['score']}/{score['total']} ({score['pct']:.1f}%) | 技術面評價: {score['rating']}"
+            )
 
-        except Exception as e:
-            logger.error(f"提取增強版摘要時發生錯誤: {e}")
+        # 次要資訊
+        ma = result["ma"]
+        if ma and ma["ma20"] is not None:
+            other_parts.append(f"📈 MA5:  {ma['ma5']:.2f} | MA10: {ma['ma10']:.2f}")
+        if result["bollinger"]:
+            other_parts.append(f"📏 布林狀態: {result['bollinger']['status']}")
+        if result["kd"]:
+            other_parts.append(f"📊 KD狀態: {result['kd']['status']}")
+            if result["kd"]["cross"]:
+                other_parts.append(f"⚡ KD訊號: {result['kd']['cross']}")
+        if result["big_orders"] and "trend" in result["big_orders"]:
+            other_parts.append(f"💼 大單趨勢: {result['big_orders']['trend']}")
+
+        if not important_parts and not other_parts:
             return f"✅ 已完成 {stock_code} 增強版分析\n📄 請查看 TXT 檔案獲取完整報告"
 
+        # 重要資訊優先，總共最多10行
+        return "\n".join((important_parts[:8] + other_parts[:2])[:10])
+
     def run(self):
         """啟動機器人"""
         logger.info("股票分析機器人 (增強版 v2.1) 啟動中...")
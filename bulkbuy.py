@@ -2,11 +2,22 @@ import csv
 import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from fubon_neo.constant import BSAction, MarketType, OrderType, PriceType, TimeInForce
 from fubon_neo.sdk import Order
 from order_status_map import STATUS_MAP
 from login_helper import login
+from order_journal import OrderJournal, batch_digest, batch_id, make_user_def, reconcile
+from order_latency import LatencyRecorder
+from own_orders import OwnOrderBook
+from pretrade import format_price, load_references, validate_prices
+from rate_limiter import RateLimiter
+from stage_metrics import percentile
+
+# 下單速率 (筆/秒) 與同時送單的執行緒數
+ORDER_RATE = float(os.getenv("BULK_ORDER_RATE", "5"))
+ORDER_WORKERS = int(os.getenv("BULK_ORDER_WORKERS", "4"))
 
 # 全域變數
 sdk = None
@@ -100,6 +111,7 @@ def read_csv_orders(filename):
                 if errors:
                     all_errors.extend(errors)
                 else:
+                    order_data["row"] = row_num
                     orders.append(order_data)
 
     except Exception as e:
@@ -144,10 +156,64 @@ def display_orders_preview(orders):
     print("-" * 50)
 
 
-def place_single_order(order_data, index, total):
-    """執行單筆下單"""
+def pretrade_check(orders):
+    """送單前以漲跌停與跳動單位檢查整批委託 (一次 snapshot 取得全市場參考價)
+
+    不在跳動單位上的價格調整到最近檔位，超出漲跌停或查無參考價的剔除；
+    無法取得參考價時不做檢查，回傳可送出的委託。
+    """
+    try:
+        sdk.init_realtime()
+        references = load_references(sdk.marketdata.rest_client.stock)
+    except Exception as e:
+        print(f"⚠️ 無法取得參考價（{e}），略過送單前檢查")
+        return orders
+    if not references:
+        print("⚠️ 參考價資料為空，略過送單前檢查")
+        return orders
+
+    results = validate_prices(
+        [order["code"] for order in orders],
+        [order["price_float"] for order in orders],
+        references,
+    )
+
+    passed = []
+    rejected = 0
+    adjusted = 0
+    for order, result in zip(orders, results):
+        if result["error"]:
+            rejected += 1
+            print(f"   ❌ 第{order['row']}行 {order['code']} {order['price']}：{result['error']}")
+            continue
+        if result["adjusted"]:
+            adjusted += 1
+            new_price = format_price(result["price"])
+            print(f"   🔧 第{order['row']}行 {order['code']} 價格 {order['price']} → {new_price}（跳動單位）")
+            order["price"] = new_price
+            order["price_float"] = result["price"]
+        passed.append(order)
+
+    print(f"🛡 送單前檢查：通過 {len(passed)} 筆（調整 {adjusted} 筆），剔除 {rejected} 筆")
+    return passed
+
+
+def place_single_order(order_data, index, total, journal=None, recorder=None, limiter=None):
+    """執行單筆下單，有日誌時記錄 submit 與 ack/reject/error 事件，有 recorder 時記錄往返延遲
+
+    有 limiter 時在呼叫下單 API 前才取得額度，確保實際送單速率不超過限速。
+
+    Returns:
+        (是否成功, 委託結果或錯誤訊息, 等待限速額度的秒數)
+    """
+    row = order_data.get("row", index)
+    user_def = order_data.get("user_def", "CSV_BATCH")
+    timer = None
+    waited = 0.0
     try:
         # 建立委託單
+        if recorder:
+            timer = recorder.start(order_data["code"], MarketType.IntradayOdd, user_def)
         order = Order(
             buy_sell=BSAction.Buy,  # 目前固定為買進，可以後續擴展
             symbol=order_data["code"],
@@ -157,15 +223,37 @@ def place_single_order(order_data, index, total):
             price_type=PriceType.Limit,
             time_in_force=TimeInForce.ROD,
             order_type=OrderType.Stock,
-            user_def="CSV_BATCH",
+            user_def=user_def,
         )
 
         print(
             f"⏳ [{index}/{total}] 處理中：{order_data['code']} {order_data['quantity']}股..."
         )
 
-        # 發送下單請求
+        # 發送下單請求 (先寫日誌，中斷後才知道這筆可能已送出)
+        if limiter:
+            waited = limiter.acquire()
+        if journal:
+            journal.record("submit", row, user_def=user_def, code=order_data["code"])
+        if timer:
+            timer.mark("submit")
         result = sdk.stock.place_order(account, order, unblock=False)
+        if timer:
+            timer.ack(result)
+
+        if journal:
+            if result.is_success:
+                journal.record(
+                    "ack",
+                    row,
+                    user_def=user_def,
+                    code=order_data["code"],
+                    order_no=result.data.order_no if result.data else None,
+                )
+            else:
+                journal.record(
+                    "reject", row, user_def=user_def, code=order_data["code"], error=result.message
+                )
 
         if result.is_success and result.data:
             status_label = STATUS_MAP.get(
@@ -174,48 +262,114 @@ def place_single_order(order_data, index, total):
             print(
                 f"✅ [{index}/{total}] 成功：{order_data['code']} - 委託書號：{result.data.order_no or '未回傳'} - {status_label}"
             )
-            return True, result.data
+            return True, result.data, waited
         elif result.is_success:
             print(f"⚠️ [{index}/{total}] 送出成功但無詳細資料：{order_data['code']}")
-            return True, None
+            return True, None, waited
         else:
             print(f"❌ [{index}/{total}] 失敗：{order_data['code']} - {result.message}")
-            return False, result.message
+            return False, result.message, waited
 
     except Exception as e:
+        if timer:
+            timer.fail(e)
+        # 例外時無法確定券商是否已收到，續傳時會以委託清單確認
+        if journal:
+            journal.record("error", row, user_def=user_def, code=order_data["code"], error=str(e))
         print(f"❌ [{index}/{total}] 異常：{order_data['code']} - {str(e)}")
-        return False, str(e)
+        return False, str(e), waited
+
+
+def submit_order(order_data, index, total, journal=None, recorder=None, limiter=None):
+    """送出單筆委託，回傳結果與委託回報延遲 (不含等待限速額度的時間)"""
+    start = time.perf_counter()
+    success, result, waited = place_single_order(
+        order_data, index, total, journal, recorder, limiter
+    )
+    return success, result, time.perf_counter() - start - waited
+
+
+def summarize_latency(latencies, elapsed, count):
+    """送單耗時統計"""
+    ordered = sorted(latencies)
+    return {
+        "elapsed": elapsed,
+        "throughput": count / elapsed if elapsed else 0.0,
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
 
 
-def batch_place_orders(orders):
-    """批次執行下單"""
+def batch_place_orders(
+    orders, rate=ORDER_RATE, workers=ORDER_WORKERS, journal=None, recorder=None
+):
+    """批次執行下單
+
+    依 CSV 順序派送給執行緒池 (實際送單先後不保證)，各執行緒在呼叫下單 API 前
+    才取得 Token Bucket 額度，多筆委託同時等待回報；
+    委託回報依完成順序收集，最後依 CSV 順序整理成功/失敗清單。
+    """
     if not orders:
         print("❌ 沒有訂單可以執行")
         return
 
-    print(f"\n🚀 開始批次下單（共 {len(orders)} 筆）...")
+    print(f"\n🚀 開始批次下單（共 {len(orders)} 筆，{rate:g} 筆/秒，{workers} 個執行緒）...")
     print("=" * 60)
 
+    # 容量 1：執行緒等回應期間累積的額度不會變成連續突發送單
+    limiter = RateLimiter(rate, burst=1)
+    outcomes = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 主執行緒依 CSV 順序派送，這只決定派送順序，各執行緒實際送達券商的先後仍可能不同；
+        # 額度在執行緒內送單前才取得，執行緒都在等回應時不會累積待送的委託
+        futures = {}
+        for i, order_data in enumerate(orders, 1):
+            if journal:
+                journal.record(
+                    "intent",
+                    order_data.get("row", i),
+                    user_def=order_data.get("user_def"),
+                    code=order_data["code"],
+                    quantity=order_data["quantity"],
+                    price=order_data["price"],
+                )
+            futures[
+                executor.submit(
+                    submit_order, order_data, i, len(orders), journal, recorder, limiter
+                )
+            ] = i
+        for future in as_completed(futures):
+            outcomes[futures[future]] = future.result()
+
+    elapsed = time.perf_counter() - start
+
     success_orders = []
     failed_orders = []
-
     for i, order_data in enumerate(orders, 1):
-        success, result = place_single_order(order_data, i, len(orders))
-
+        success, result, latency = outcomes[i]
         if success:
-            success_orders.append({"order_data": order_data, "result": result})
+            success_orders.append({"order_data": order_data, "result": result, "latency": latency})
         else:
-            failed_orders.append({"order_data": order_data, "error": result})
+            failed_orders.append({"order_data": order_data, "error": result, "latency": latency})
 
-        # 避免下單過於頻繁，稍作延遲
-        if i < len(orders):
-            time.sleep(0.5)
+    stats = summarize_latency(
+        [latency for _, _, latency in outcomes.values()], elapsed, len(orders)
+    )
 
     # 顯示執行結果摘要
     print("\n" + "=" * 60)
     print(f"📊 批次下單完成")
     print(f"✅ 成功：{len(success_orders)} 筆")
     print(f"❌ 失敗：{len(failed_orders)} 筆")
+    print(f"⏱ 總耗時：{stats['elapsed']:.2f} 秒（{stats['throughput']:.1f} 筆/秒）")
+    print(
+        f"⏱ 委託回報延遲：p50 {stats['p50'] * 1000:.0f}ms | p95 {stats['p95'] * 1000:.0f}ms | "
+        f"p99 {stats['p99'] * 1000:.0f}ms | 最長 {stats['max'] * 1000:.0f}ms"
+    )
 
     if failed_orders:
         print("\n❌ 失敗清單：")
@@ -224,10 +378,53 @@ def batch_place_orders(orders):
             print(f"   {order['code']} {order['quantity']}股 - {item['error']}")
 
     # 生成執行報告
-    generate_report(success_orders, failed_orders)
+    generate_report(success_orders, failed_orders, stats)
 
 
-def generate_report(success_orders, failed_orders):
+def print_fill(event, order):
+    """委託簿成交回報即時顯示"""
+    if event != "fill":
+        return
+    fill = order.last_fill
+    print(
+        f"💰 成交：{order.stock_no} {fill.filled_qty}股 @ {fill.filled_price}"
+        f"（委託書號 {order.order_no}，累計 {order.filled_qty}/{order.quantity}）"
+    )
+
+
+def plan_resume(orders, journal, book):
+    """依日誌決定續傳時要送出的委託
+
+    已確認 (ack) 的略過；結果不明 (submit/error) 的以委託簿 (一次 get_order_results 載入) 比對 user_def，
+    券商查得到的補記 ack 後略過。日誌不屬於這份 CSV (批次代號碰撞) 或無法查詢券商委託時
+    回傳 None，避免重複下單。
+    """
+    if not journal.matches():
+        print(f"❌ 下單日誌 {journal.path} 與此 CSV 的摘要不符（不同批次代號碰撞），拒絕續傳")
+        print("   請確認日誌內容後移走該檔案再重新執行")
+        return None
+
+    states = journal.states()
+    uncertain = [row for row, entry in states.items() if entry["event"] in ("submit", "error")]
+
+    confirmed = set()
+    if uncertain:
+        print(f"🔎 {len(uncertain)} 筆委託結果不明，查詢券商委託清單確認中...")
+        if not book.ready and not book.seed():
+            print(f"❌ 無法查詢委託清單（{book.error}），為避免重複下單請手動確認")
+            return None
+        confirmed = reconcile(journal, states, book.orders())
+
+    done = {row for row, entry in states.items() if entry["event"] == "ack"} | confirmed
+    pending = [order for order in orders if order["row"] not in done]
+
+    print(f"📒 下單日誌：{journal.path}")
+    print(f"   已確認：{len(done)} 筆（其中 {len(confirmed)} 筆由券商委託清單確認）")
+    print(f"   待送出：{len(pending)} 筆（其中 {len(uncertain) - len(confirmed)} 筆券商查無委託）")
+    return pending
+
+
+def generate_report(success_orders, failed_orders, stats=None):
     """生成執行報告"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     report_filename = f"batch_order_report_{timestamp}.txt"
@@ -242,7 +439,14 @@ def generate_report(success_orders, failed_orders):
             f.write(f"執行摘要：\n")
             f.write(f"成功：{len(success_orders)} 筆\n")
             f.write(f"失敗：{len(failed_orders)} 筆\n")
-            f.write(f"總計：{len(success_orders) + len(failed_orders)} 筆\n\n")
+            f.write(f"總計：{len(success_orders) + len(failed_orders)} 筆\n")
+            if stats:
+                f.write(
+                    f"總耗時：{stats['elapsed']:.2f} 秒（{stats['throughput']:.1f} 筆/秒）\n"
+                    f"委託回報延遲：p50 {stats['p50'] * 1000:.0f}ms, p95 {stats['p95'] * 1000:.0f}ms, "
+                    f"p99 {stats['p99'] * 1000:.0f}ms, 最長 {stats['max'] * 1000:.0f}ms\n"
+                )
+            f.write("\n")
 
             if success_orders:
                 f.write("成功訂單明細：\n")
@@ -257,7 +461,7 @@ def generate_report(success_orders, failed_orders):
                         else "未知"
                     )
                     f.write(
-                        f"股票：{order['code']}, 股數：{order['quantity']}, 價格：{order['price']}, 委託書號：{order_no}, 狀態：{status}\n"
+                        f"股票：{order['code']}, 股數：{order['quantity']}, 價格：{order['price']}, 委託書號：{order_no}, 狀態：{status}, 延遲：{item['latency'] * 1000:.0f}ms\n"
                     )
                 f.write("\n")
 
@@ -307,13 +511,49 @@ def main():
 
     print(f"✅ 登入成功，帳號：{account.account}")
 
-    # 最終確認
-    print(f"\n⚠️ 即將對帳號 {account.account} 執行 {len(orders)} 筆買進下單")
-    input("按 Enter 鍵確認執行，或按 Ctrl+C 取消...")
-    print("🚀 開始執行批次下單...")
-
-    # 執行批次下單
-    batch_place_orders(orders)
+    # 漲跌停與跳動單位檢查 (不合規的委託不必送到券商才被退回)
+    orders = pretrade_check(orders)
+
+    # 委託簿：註冊委託/成交回報，成交即時顯示，續傳時才查詢既有委託
+    book = OwnOrderBook(sdk, account)
+    book.attach()
+    book.add_listener(print_fill)
+
+    # 每行委託使用唯一的 user_def，並寫入下單日誌
+    digest = batch_digest(csv_filename)
+    batch = batch_id(digest)
+    for order in orders:
+        order["user_def"] = make_user_def(batch, order["row"])
+    journal = OrderJournal(batch, digest)
+
+    if journal.exists():
+        print("\n♻️ 偵測到此 CSV 今日的下單日誌，只送出尚未確認的委託")
+        orders = plan_resume(orders, journal, book)
+        if orders == []:
+            print("✅ 所有委託皆已確認，無需續傳")
+
+    if orders:
+        # 最終確認
+        print(f"\n⚠️ 即將對帳號 {account.account} 執行 {len(orders)} 筆買進下單")
+        input("按 Enter 鍵確認執行，或按 Ctrl+C 取消...")
+        print("🚀 開始執行批次下單...")
+
+        # 執行批次下單，同時記錄每筆委託的往返延遲
+        recorder = LatencyRecorder("bulkbuy")
+        recorder.attach_book(book)
+        try:
+            batch_place_orders(orders, journal=journal, recorder=recorder)
+        finally:
+            journal.close()
+            written = recorder.flush()
+            if written:
+                print(f"⏱ 已記錄 {written} 筆委託延遲（python order_latency.py 查看報告）")
+
+        filled = [
+            o for order in orders for o in book.for_user_def(order["user_def"]) if o.filled_qty
+        ]
+        if filled:
+            print(f"💰 本批目前已有 {len(filled)} 筆委託成交")
 
     # 登出
     if sdk.logout():
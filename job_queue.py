@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# 優先等級 (數字小者先處理)
+PRIORITY_ADMIN = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+
+class QueueFull(Exception):
+    """佇列已滿或該聊天室排隊數已達上限"""
+
+
+class Job:
+    """排隊中的工作"""
+
+    def __init__(self, chat_id, run, priority):
+        self.chat_id = chat_id
+        self.run = run  # 無參數的 coroutine function
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class JobQueue:
+    """有上限的非同步工作佇列
+
+    - 同時執行數固定為 concurrency，保護券商 API 額度
+    - 依優先等級處理，同等級內各聊天室輪流 (round-robin)，避免單一聊天室洗版佔滿
+    - 總排隊數與每個聊天室的排隊數皆有上限，超過時 submit 直接拋出 QueueFull
+    """
+
+    def __init__(self, concurrency=2, max_depth=50, max_per_chat=3):
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.max_per_chat = max_per_chat
+
+        # priority -> OrderedDict(chat_id -> deque[Job])，OrderedDict 順序即輪替順序
+        self.lanes = {}
+        self.depth = 0
+        self.running = 0
+        self.workers = []
+        self.condition = None
+
+        # 統計
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waits = deque(maxlen=500)  # 最近的排隊等待秒數
+
+    def start(self):
+        """在目前的 event loop 啟動工作協程 (第一次 submit 時自動呼叫)"""
+        if self.workers:
+            return
+        self.condition = asyncio.Condition()
+        self.workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    def chat_depth(self, chat_id):
+        return sum(len(lane.get(chat_id, ())) for lane in self.lanes.values())
+
+    async def submit(self, chat_id, run, priority=PRIORITY_NORMAL):
+        """加入工作
+
+        Returns:
+            0 表示會立即開始，否則為排隊位置 (第 N 位)
+        """
+        self.start()
+
+        if self.depth >= self.max_depth:
+            self.rejected += 1
+            raise QueueFull(f"佇列已滿 ({self.depth} 筆排隊中)")
+        if self.chat_depth(chat_id) >= self.max_per_chat:
+            self.rejected += 1
+            raise QueueFull(f"您已有 {self.max_per_chat} 筆查詢排隊中")
+
+        job = Job(chat_id, run, priority)
+        starts_now = self.depth < self.concurrency - self.running
+
+        async with self.condition:
+            lane = self.lanes.setdefault(priority, OrderedDict())
+            lane.setdefault(chat_id, deque()).append(job)
+            self.depth += 1
+            position = 0 if starts_now else self._position(job)
+            self.condition.notify()
+
+        return position
+
+    def _dispatch_order(self):
+        """模擬取出順序 (佇列有上限，模擬成本很低)"""
+        order = []
+        for priority in sorted(self.lanes):
+            chats = [(chat_id, list(jobs)) for chat_id, jobs in self.lanes[priority].items()]
+            while chats:
+                chat_id, jobs = chats.pop(0)
+                order.append(jobs.pop(0))
+                if jobs:
+                    chats.append((chat_id, jobs))
+        return order
+
+    def _position(self, job):
+        return self._dispatch_order().index(job) + 1
+
+    def _pop(self):
+        for priority in sorted(self.lanes):
+            lane = self.lanes[priority]
+            if not lane:
+                continue
+            chat_id, jobs = next(iter(lane.items()))
+            job = jobs.popleft()
+            if jobs:
+                lane.move_to_end(chat_id)  # 輪到下一個聊天室
+            else:
+                del lane[chat_id]
+            self.depth -= 1
+            return job
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.depth > 0)
+                job = self._pop()
+
+            self.waits.append(time.monotonic() - job.enqueued_at)
+            self.running += 1
+            try:
+                await job.run()
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"佇列工作失敗 (chat {job.chat_id}): {e}")
+            finally:
+                self.running -= 1
+
+    def metrics(self):
+        """佇列狀態與等待時間統計"""
+        waits = sorted(self.waits)
+        by_priority = {
+            priority: sum(len(jobs) for jobs in lane.values())
+            for priority, lane in self.lanes.items()
+        }
+        return {
+            "depth": self.depth,
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "waiting_admin": by_priority.get(PRIORITY_ADMIN, 0),
+            "waiting_normal": by_priority.get(PRIORITY_NORMAL, 0),
+            "waiting_background": by_priority.get(PRIORITY_BACKGROUND, 0),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "max_wait": waits[-1] if waits else 0.0,
+        }
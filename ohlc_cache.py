@@ -0,0 +1,151 @@
+import json
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# 本地日K快取：每檔股票每個月一個檔案
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ohlc_cache")
+
+# 證交所/櫃買中心盤後日資料的更新時間 (收盤 13:30 後)
+SETTLE_TIME = (14, 0)
+
+# 欄位與 twstock.Stock.data 相同，工具程式可直接替換使用
+DailyBar = namedtuple(
+    "DailyBar",
+    ["date", "capacity", "turnover", "open", "high", "low", "close", "change", "transaction"],
+)
+
+
+class NoDataError(ValueError):
+    """抓到空資料 (查無此股票，或被證交所限流)"""
+
+
+def last_settle_time(now):
+    """最近一次盤後資料更新時間 (週末往前推到週五，不含國定假日)"""
+    settle = now.replace(hour=SETTLE_TIME[0], minute=SETTLE_TIME[1], second=0, microsecond=0)
+    if settle > now:
+        settle -= timedelta(days=1)
+    while settle.weekday() >= 5:
+        settle -= timedelta(days=1)
+    return settle
+
+
+def _month_path(symbol, year, month):
+    return os.path.join(CACHE_DIR, symbol, f"{year:04d}-{month:02d}.json")
+
+
+def _previous_month(year, month):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        rows = [
+            DailyBar(datetime.strptime(row[0], "%Y-%m-%d"), *row[1:])
+            for row in payload["rows"]
+        ]
+        return rows, datetime.fromisoformat(payload["fetched_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+
+def _save(path, rows, fetched_at):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    payload = {
+        "fetched_at": fetched_at.isoformat(timespec="seconds"),
+        "rows": [[row.date.strftime("%Y-%m-%d")] + list(row[1:]) for row in rows],
+    }
+    # 先寫暫存檔再取代，多個程式同時讀寫也不會讀到寫一半的檔案
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _is_current(fetched_at, year, month, now):
+    """快取是否已包含該月最近一次盤後資料 (月份結束後的盤後時間之後抓取的即為完整月份)"""
+    month_end = datetime(year + month // 12, month % 12 + 1, 1)
+    return fetched_at >= last_settle_time(min(now, month_end))
+
+
+def _fetch_month(symbol, year, month):
+    """抓取某月日K；twstock 被限流或失敗時會回傳空列表，視為抓取失敗"""
+    import twstock
+
+    stock = twstock.Stock(symbol, initial_fetch=False)
+    rows = [DailyBar(*row) for row in stock.fetch(year, month)]
+    if not rows:
+        raise NoDataError("查無資料 (可能被限流)")
+    return rows
+
+
+def get_month(symbol, year, month, now=None):
+    """取得某檔某月的日K
+
+    過去月份抓過就不再更新；當月資料在盤後更新時間之後才重新抓取。
+    抓取失敗 (含抓到空資料) 時不寫入快取並沿用舊快取，沒有快取則拋出例外，由呼叫端決定是否重試。
+    """
+    now = now or datetime.now()
+    path = _month_path(symbol, year, month)
+    rows, fetched_at = _load(path)
+    if not rows:
+        # 舊版可能存下被限流時的空資料，視同沒有快取
+        rows = None
+
+    if rows is not None and _is_current(fetched_at, year, month, now):
+        return rows
+
+    try:
+        fresh = _fetch_month(symbol, year, month)
+    except Exception as e:
+        if rows is None:
+            raise
+        print(f"⚠️ 取得 {symbol} {year}-{month:02d} 日K失敗，沿用舊資料：{e}")
+        return rows
+
+    _save(path, fresh, now)
+    return fresh
+
+
+def get_daily(symbol, months=1, now=None):
+    """取得最近 months 個月 (含當月) 的日K，依日期排序"""
+    now = now or datetime.now()
+    year, month = now.year, now.month
+    periods = []
+    for _ in range(months):
+        periods.append((year, month))
+        year, month = _previous_month(year, month)
+
+    bars = []
+    for year, month in reversed(periods):
+        bars.extend(get_month(symbol, year, month, now))
+    return bars
+
+
+def peek_latest(symbol, now=None):
+    """只讀本地快取的最新一筆日K (不連線)，快取不存在或需要更新時回傳 None"""
+    now = now or datetime.now()
+    year, month = now.year, now.month
+    rows, fetched_at = _load(_month_path(symbol, year, month))
+    if not rows and last_settle_time(now) < datetime(year, month, 1):
+        # 月初尚未有盤後資料，最新一筆在上個月
+        year, month = _previous_month(year, month)
+        rows, fetched_at = _load(_month_path(symbol, year, month))
+    if not rows or not _is_current(fetched_at, year, month, now):
+        return None
+    return rows[-1]
+
+
+def get_latest(symbol, now=None):
+    """最新一筆日K，當月尚無資料 (月初) 時改看上個月"""
+    now = now or datetime.now()
+    try:
+        bars = get_month(symbol, now.year, now.month, now)
+    except NoDataError:
+        if last_settle_time(now) >= datetime(now.year, now.month, 1):
+            raise
+        # 月初尚未有盤後資料
+        bars = get_month(symbol, *_previous_month(now.year, now.month), now)
+    return bars[-1]
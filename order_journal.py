@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+# 批次下單日誌目錄 (每個 CSV 每天一個檔案)
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal")
+
+# 事件依序為 intent (準備送出) -> submit (呼叫下單 API) -> ack (券商確認) / reject (券商拒絕) / error (結果不明)
+DONE_EVENTS = ("ack",)
+UNCERTAIN_EVENTS = ("submit", "error")
+
+
+def batch_digest(csv_path, day=None):
+    """由 CSV 內容與日期產生完整摘要 (同一份 CSV 當天重跑會得到相同摘要)"""
+    day = day or datetime.now().strftime("%Y%m%d")
+    digest = hashlib.sha1()
+    with open(csv_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(day.encode())
+    return digest.hexdigest()
+
+
+def batch_id(digest):
+    """批次代號 (摘要前 4 碼，只有 16 bits，用於 user_def 與檔名；比對批次需用完整摘要)"""
+    return digest[:4].upper()
+
+
+def make_user_def(batch, row):
+    """每筆委託唯一的自訂欄位 (批次代號 + CSV 行號)，用於事後比對券商委託"""
+    return f"B{batch}{row:04d}"
+
+
+class OrderJournal:
+    """只增不改的下單日誌 (JSONL)，每筆事件寫入後立即 fsync
+
+    程式中斷後可由日誌得知每一行的最後狀態，續傳時只送出尚未確認的委託。
+    第一行記錄 CSV 的完整摘要，不同 CSV 的批次代號相同時可由 matches() 分辨。
+    """
+
+    def __init__(self, batch, digest=None, directory=JOURNAL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.batch = batch
+        self.digest = digest
+        self.path = os.path.join(
+            directory, f"bulkbuy_{datetime.now().strftime('%Y%m%d')}_{batch}.jsonl"
+        )
+        self.lock = threading.Lock()
+        self.file = None
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def record(self, event, row, **fields):
+        entry = dict(
+            ts=datetime.now().isoformat(timespec="milliseconds"),
+            event=event,
+            row=row,
+            **fields,
+        )
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                new = not self.exists()
+                self.file = open(self.path, "a", encoding="utf-8")
+                if new:
+                    header = dict(event="batch", batch=self.batch, digest=self.digest)
+                    line = json.dumps(header) + "\n" + line
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def stored_digest(self):
+        """日誌記錄的 CSV 完整摘要，沒有記錄時回傳 None"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                entry = json.loads(f.readline())
+            except ValueError:
+                return None
+        return entry.get("digest") if entry.get("event") == "batch" else None
+
+    def matches(self):
+        """日誌是否屬於同一份 CSV (完整摘要相符)"""
+        return self.digest is not None and self.stored_digest() == self.digest
+
+    def states(self):
+        """{row: 最後一筆事件}，最後一行寫到一半 (程式中斷) 時略過"""
+        states = {}
+        if not os.path.exists(self.path):
+            return states
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("row") is not None:
+                    states[entry["row"]] = entry
+        return states
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def reconcile(journal, states, order_results):
+    """以券商委託清單 (一次查詢) 確認結果不明的委託
+
+    user_def 相符者補記 ack 並視為已完成，回傳已確認的行號集合。
+    """
+    by_user_def = {
+        getattr(order, "user_def", None): order for order in order_results or []
+    }
+    confirmed = set()
+    for row, entry in states.items():
+        if entry["event"] not in UNCERTAIN_EVENTS:
+            continue
+        order = by_user_def.get(entry["user_def"])
+        if order is None:
+            continue
+        journal.record(
+            "ack",
+            row,
+            user_def=entry["user_def"],
+            code=entry.get("code"),
+            order_no=getattr(order, "order_no", None),
+            source="reconcile",
+        )
+        confirmed.add(row)
+    return confirmed
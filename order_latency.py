@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from stage_metrics import percentile
+
+# 委託往返延遲紀錄 (JSONL，每筆委託一行)
+LATENCY_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "order_latency.jsonl")
+
+# 送單後等待第一次委託狀態回報的時間 (秒)
+STATUS_WAIT = float(os.getenv("ORDER_STATUS_WAIT", "5"))
+
+# 報告中的延遲欄位：建立委託 -> 送出、送出 -> 下單回應、送出 -> 第一次狀態回報
+LATENCY_FIELDS = ("build_ms", "ack_ms", "status_ms")
+GROUP_FIELDS = ("market_type", "hour", "symbol")
+
+
+def _enum_name(value):
+    """MarketType 等列舉轉成簡短名稱"""
+    name = getattr(value, "name", None)
+    return name if name else str(value).split(".")[-1]
+
+
+def _elapsed_ms(marks, start, end):
+    if start not in marks or end not in marks:
+        return None
+    return round((marks[end] - marks[start]) * 1000, 1)
+
+
+class OrderTimer:
+    """單筆委託的時間點：build (建立委託) -> submit (呼叫下單) -> ack (下單回應) -> status (第一次狀態回報)"""
+
+    def __init__(self, source, symbol, market_type, user_def=None):
+        self.started_at = datetime.now()
+        self.marks = {"build": time.perf_counter()}
+        self.source = source
+        self.symbol = symbol
+        self.market_type = _enum_name(market_type)
+        self.user_def = user_def
+        self.order_no = None
+        self.status = None
+        self.ok = None
+        self.error = None
+
+    def mark(self, stage):
+        """記錄時間點 (同一階段只保留第一次)"""
+        self.marks.setdefault(stage, time.perf_counter())
+
+    def ack(self, result):
+        """place_order 回應"""
+        self.mark("ack")
+        self.ok = bool(result.is_success)
+        if result.is_success and result.data:
+            self.order_no = result.data.order_no
+            self.status = result.data.status
+        elif not result.is_success:
+            self.error = result.message
+
+    def fail(self, error):
+        """下單時發生例外"""
+        self.mark("ack")
+        self.ok = False
+        self.error = str(error)
+
+    def waiting_status(self):
+        return bool(self.ok) and "status" not in self.marks
+
+    def describe(self):
+        """單行延遲摘要 (毫秒)"""
+        record = self.to_record()
+        parts = [f"建立 {record['build_ms']}", f"回應 {record['ack_ms']}"]
+        status_ms = record["status_ms"]
+        parts.append(f"狀態回報 {status_ms}" if status_ms is not None else "狀態回報 未收到")
+        return "⏱ 委託延遲 (ms)：" + " | ".join(parts)
+
+    def to_record(self):
+        return {
+            "ts": self.started_at.isoformat(timespec="milliseconds"),
+            "source": self.source,
+            "symbol": self.symbol,
+            "market_type": self.market_type,
+            "hour": self.started_at.hour,
+            "ok": self.ok,
+            "order_no": self.order_no,
+            "status": self.status,
+            "error": self.error,
+            "build_ms": _elapsed_ms(self.marks, "build", "submit"),
+            "ack_ms": _elapsed_ms(self.marks, "submit", "ack"),
+            "status_ms": _elapsed_ms(self.marks, "submit", "status"),
+        }
+
+
+class LatencyRecorder:
+    """收集一次執行中所有委託的往返時間，結束時寫入延遲紀錄
+
+    以 SDK 的委託回報 callback 取得第一次狀態變化，依 user_def 或委託書號比對。
+    """
+
+    def __init__(self, source, path=LATENCY_LOG):
+        self.source = source
+        self.path = path
+        self.cond = threading.Condition()
+        self.timers = []
+
+    def start(self, symbol, market_type, user_def=None):
+        """建立委託前呼叫，回傳該筆委託的計時器"""
+        timer = OrderTimer(self.source, symbol, market_type, user_def)
+        with self.cond:
+            self.timers.append(timer)
+        return timer
+
+    def attach(self, sdk):
+        """註冊委託回報 callback，不支援時只記錄到下單回應為止"""
+        try:
+            sdk.set_on_order(self._on_report)
+            sdk.set_on_order_changed(self._on_report)
+        except Exception as e:
+            print(f"⚠️ 無法註冊委託回報（{e}），延遲紀錄不含狀態回報")
+
+    def attach_book(self, book):
+        """已有委託簿 (own_orders.OwnOrderBook) 時改由其回報取得狀態變化，避免重複註冊 callback"""
+        book.add_listener(self._on_book_event)
+
+    def _on_book_event(self, event, order):
+        if event != "seed":
+            self._on_report(None, order)
+
+    def _on_report(self, code, content):
+        if content is None:
+            return
+        user_def = getattr(content, "user_def", None)
+        order_no = getattr(content, "order_no", None)
+        with self.cond:
+            for timer in self.timers:
+                if "submit" not in timer.marks or "status" in timer.marks:
+                    continue
+                if (order_no and order_no == timer.order_no) or (
+                    user_def and user_def == timer.user_def
+                ):
+                    timer.mark("status")
+                    timer.status = getattr(content, "status", timer.status)
+                    self.cond.notify_all()
+                    break
+
+    def flush(self, wait=STATUS_WAIT):
+        """等待尚未收到狀態回報的委託 (最多 wait 秒) 後寫入紀錄，回傳寫入筆數"""
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while any(t.waiting_status() for t in self.timers):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            timers = [t for t in self.timers if "submit" in t.marks]
+            self.timers = []
+
+        if not timers:
+            return 0
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for timer in timers:
+                    f.write(json.dumps(timer.to_record(), ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ 無法寫入延遲紀錄：{e}")
+            return 0
+        return len(timers)
+
+
+def load_records(path=LATENCY_LOG, days=None):
+    """讀取延遲紀錄，days 指定時只保留最近幾天"""
+    if not os.path.exists(path):
+        return []
+    since = datetime.now() - timedelta(days=days) if days else None
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since and datetime.fromisoformat(record["ts"]) < since:
+                continue
+            records.append(record)
+    return records
+
+
+def group_percentiles(records, group_field, field):
+    """{分組: {count, p50, p95, p99, max}}，只計入成功的委託"""
+    groups = {}
+    for record in records:
+        value = record.get(field)
+        if not record.get("ok") or value is None:
+            continue
+        groups.setdefault(record.get(group_field), []).append(value)
+
+    summary = {}
+    for key, values in groups.items():
+        values.sort()
+        summary[key] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+    return summary
+
+
+def render_report(records, group_field, field, limit=None):
+    """文字表格 (毫秒)"""
+    summary = group_percentiles(records, group_field, field)
+    if not summary:
+        return f"{field}：尚無資料"
+    if group_field == "hour":
+        keys = sorted(summary)
+    else:
+        keys = sorted(summary, key=lambda k: summary[k]["p95"], reverse=True)
+    if limit:
+        keys = keys[:limit]
+
+    lines = [
+        f"{field} 依 {group_field}",
+        f"{group_field:<14}{'筆數':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}",
+    ]
+    for key in keys:
+        s = summary[key]
+        label = f"{key:02d}:00" if group_field == "hour" else str(key)
+        lines.append(
+            f"{label:<14}{s['count']:>6}{s['p50']:>9.0f}{s['p95']:>9.0f}"
+            f"{s['p99']:>9.0f}{s['max']:>9.0f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="委託往返延遲報告")
+    parser.add_argument("--days", type=int, help="只統計最近 N 天")
+    parser.add_argument(
+        "--by", choices=GROUP_FIELDS, action="append", help="分組欄位 (可重複，預設全部)"
+    )
+    parser.add_argument(
+        "--field", choices=LATENCY_FIELDS, action="append", help="延遲欄位 (可重複，預設 ack_ms 與 status_ms)"
+    )
+    parser.add_argument("--top", type=int, default=20, help="依股票分組時只列 p95 最高的前 N 檔")
+    args = parser.parse_args()
+
+    records = load_records(days=args.days)
+    if not records:
+        print("❌ 尚無委託延遲紀錄")
+        return
+
+    failed = sum(1 for r in records if not r.get("ok"))
+    print(f"📊 委託延遲報告：共 {len(records)} 筆（失敗 {failed} 筆），單位 ms")
+    for field in args.field or ("ack_ms", "status_ms"):
+        for group_field in args.by or GROUP_FIELDS:
+            limit = args.top if group_field == "symbol" else None
+            print()
+            print(render_report(records, group_field, field, limit))
+
+
+if __name__ == "__main__":
+    main()
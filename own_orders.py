@@ -0,0 +1,233 @@
+import threading
+
+# 不會再變動的委託狀態 (刪單成功、完全成交、委託失敗)
+FINAL_STATUSES = (30, 40, 50, 90)
+
+ORDER_FIELDS = (
+    "order_no",
+    "stock_no",
+    "buy_sell",
+    "market_type",
+    "price",
+    "after_price",
+    "quantity",
+    "filled_qty",
+    "filled_money",
+    "status",
+    "user_def",
+    "last_time",
+)
+
+
+class OwnOrder:
+    """今日委託的本地狀態，欄位名稱與 SDK 委託結果相同
+
+    raw 保留最近一次的 SDK 委託物件 (刪單/改單時使用)，last_fill 為最近一筆成交回報。
+    """
+
+    def __init__(self, raw):
+        self.raw = None
+        self.last_fill = None
+        for field in ORDER_FIELDS:
+            setattr(self, field, None)
+        self.update(raw)
+
+    def update(self, raw):
+        """套用委託回報，已累計的成交數量與金額不會被較舊的資料蓋掉"""
+        filled_qty = self.filled_qty or 0
+        filled_money = self.filled_money or 0
+        self.raw = raw
+        for field in ORDER_FIELDS:
+            value = getattr(raw, field, None)
+            if value is not None:
+                setattr(self, field, value)
+        self.filled_qty = max(filled_qty, self.filled_qty or 0)
+        self.filled_money = max(filled_money, self.filled_money or 0)
+
+    def apply_fill(self, fill):
+        """套用成交回報"""
+        qty = getattr(fill, "filled_qty", 0) or 0
+        price = getattr(fill, "filled_price", 0) or 0
+        self.filled_qty = (self.filled_qty or 0) + qty
+        self.filled_money = (self.filled_money or 0) + qty * price
+        self.last_fill = fill
+        if self.quantity and self.filled_qty >= self.quantity:
+            self.status = 50
+
+    @property
+    def is_open(self):
+        """仍可刪單 (未完全成交且不是最終狀態)"""
+        return self.status not in FINAL_STATUSES and (self.filled_qty or 0) < (self.quantity or 0)
+
+
+class OwnOrderBook:
+    """以 SDK 委託/成交回報維護的今日委託簿
+
+    attach() 只註冊一次 callback，seed() 以一次 get_order_results 載入已存在的委託，
+    之後的新單、改單、刪單與成交都由回報即時更新；依委託書號、股票代號與 user_def 建立索引。
+    回報先於 seed 到達的委託以回報為準；seed 之前到達的成交視為已包含在查詢結果中。
+    """
+
+    def __init__(self, sdk, account):
+        self.sdk = sdk
+        self.account = account
+        self.lock = threading.RLock()
+        self.by_order_no = {}
+        self.by_symbol = {}  # stock_no -> [order_no]
+        self.by_user_def = {}  # user_def -> [order_no]
+        self.fill_ids = set()
+        self.pending_fills = {}  # order_no -> [成交回報]，委託回報尚未到達
+        self.listeners = []
+        self.attached = False
+        self.ready = False
+        self.error = None
+
+    # ---- 初始化 ----
+
+    def attach(self):
+        """註冊委託、改單與成交回報 callback (重複呼叫不會重複註冊)"""
+        if self.attached:
+            return True
+        try:
+            self.sdk.set_on_order(self._on_order)
+            self.sdk.set_on_order_changed(self._on_order_changed)
+            self.sdk.set_on_filled(self._on_filled)
+        except Exception as e:
+            self.error = str(e)
+            print(f"⚠️ 無法註冊委託回報（{e}），委託簿只反映查詢當下的狀態")
+            return False
+        self.attached = True
+        return True
+
+    def seed(self):
+        """以一次委託查詢載入今日已存在的委託，失敗時回傳 False (錯誤訊息在 error)"""
+        try:
+            result = self.sdk.stock.get_order_results(self.account)
+        except Exception as e:
+            self.error = str(e)
+            return False
+        if not result.is_success:
+            self.error = getattr(result, "message", None) or "查詢失敗"
+            return False
+
+        with self.lock:
+            for raw in result.data or []:
+                order_no = getattr(raw, "order_no", None)
+                if order_no and order_no not in self.by_order_no:
+                    self._insert(raw)
+                self.pending_fills.pop(order_no, None)
+            self.ready = True
+        self._notify("seed", None)
+        return True
+
+    def start(self):
+        """註冊回報並載入今日委託"""
+        self.attach()
+        return self.seed()
+
+    def sync(self):
+        """重新查詢並以查詢結果為準 (回報中斷後校正用)"""
+        with self.lock:
+            self.by_order_no.clear()
+            self.by_symbol.clear()
+            self.by_user_def.clear()
+            self.pending_fills.clear()
+            self.ready = False
+        return self.seed()
+
+    # ---- 查詢 ----
+
+    def get(self, order_no):
+        with self.lock:
+            return self.by_order_no.get(order_no)
+
+    def orders(self):
+        """今日所有委託 (依加入順序)"""
+        with self.lock:
+            return list(self.by_order_no.values())
+
+    def for_symbol(self, symbol):
+        with self.lock:
+            return [self.by_order_no[n] for n in self.by_symbol.get(symbol, [])]
+
+    def for_user_def(self, user_def):
+        with self.lock:
+            return [self.by_order_no[n] for n in self.by_user_def.get(user_def, [])]
+
+    def open_orders(self, symbol=None):
+        """可刪單的委託，可指定股票代號"""
+        orders = self.for_symbol(symbol) if symbol else self.orders()
+        return [order for order in orders if order.is_open]
+
+    # ---- 回報 ----
+
+    def add_listener(self, listener):
+        """listener(event, order)，event 為 seed / order / changed / fill"""
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _notify(self, event, order):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(event, order)
+            except Exception as e:
+                print(f"⚠️ 委託回報處理失敗：{e}")
+
+    def _insert(self, raw):
+        order = OwnOrder(raw)
+        self.by_order_no[order.order_no] = order
+        self.by_symbol.setdefault(order.stock_no, []).append(order.order_no)
+        if order.user_def:
+            self.by_user_def.setdefault(order.user_def, []).append(order.order_no)
+        return order
+
+    def _upsert(self, raw):
+        order_no = getattr(raw, "order_no", None)
+        if not order_no:
+            return None
+        with self.lock:
+            order = self.by_order_no.get(order_no)
+            if order is None:
+                order = self._insert(raw)
+                for fill in self.pending_fills.pop(order_no, []):
+                    order.apply_fill(fill)
+            else:
+                order.update(raw)
+        return order
+
+    def _on_order(self, code, content):
+        if content is None:
+            return
+        order = self._upsert(content)
+        if order is not None:
+            self._notify("order", order)
+
+    def _on_order_changed(self, code, content):
+        if content is None:
+            return
+        order = self._upsert(content)
+        if order is not None:
+            self._notify("changed", order)
+
+    def _on_filled(self, code, content):
+        if content is None:
+            return
+        order_no = getattr(content, "order_no", None)
+        fill_id = (order_no, getattr(content, "filled_no", None))
+        with self.lock:
+            if fill_id in self.fill_ids:
+                return
+            self.fill_ids.add(fill_id)
+            order = self.by_order_no.get(order_no)
+            if order is None:
+                self.pending_fills.setdefault(order_no, []).append(content)
+                return
+            order.apply_fill(content)
+        self._notify("fill", order)
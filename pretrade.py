@@ -0,0 +1,243 @@
+from datetime import date, datetime
+
+import numpy as np
+
+from security_master import MARKETS, get_shared_master
+
+# 台股升降單位 (股票)：價格區間下限 -> 跳動單位
+TICK_BOUNDS = np.array([10, 50, 100, 500, 1000])
+TICK_SIZES = np.array([0.01, 0.05, 0.1, 0.5, 1, 5])
+
+# ETF/受益憑證：50 元以下 0.01，50 元以上 0.05
+ETF_TICK_BOUNDS = np.array([50])
+ETF_TICK_SIZES = np.array([0.01, 0.05])
+
+LIMIT_PCT = 0.10  # 漲跌幅限制
+
+_EPSILON = 1e-6
+
+
+def tick_size(prices, etf=False):
+    """各價格對應的跳動單位 (可傳入陣列)"""
+    prices = np.asarray(prices, dtype=float)
+    stock_ticks = TICK_SIZES[np.searchsorted(TICK_BOUNDS, prices, side="right")]
+    etf_ticks = ETF_TICK_SIZES[np.searchsorted(ETF_TICK_BOUNDS, prices, side="right")]
+    return np.where(etf, etf_ticks, stock_ticks)
+
+
+def snap_to_tick(prices, etf=False, mode="nearest"):
+    """將價格調整到跳動單位上，mode 為 nearest / down / up"""
+    prices = np.asarray(prices, dtype=float)
+    ticks = tick_size(prices, etf)
+    steps = prices / ticks
+    if mode == "down":
+        steps = np.floor(steps + _EPSILON)
+    elif mode == "up":
+        steps = np.ceil(steps - _EPSILON)
+    else:
+        steps = np.round(steps)
+    return np.round(steps * ticks, 2)
+
+
+def on_tick(prices, etf=False):
+    """價格是否落在跳動單位上"""
+    prices = np.asarray(prices, dtype=float)
+    steps = prices / tick_size(prices, etf)
+    return np.abs(steps - np.round(steps)) < _EPSILON
+
+
+def price_limits(reference, etf=False):
+    """由參考價計算漲跌停價 (漲停向下、跌停向上取到跳動單位)"""
+    reference = np.asarray(reference, dtype=float)
+    limit_up = snap_to_tick(reference * (1 + LIMIT_PCT), etf, mode="down")
+    limit_down = snap_to_tick(reference * (1 - LIMIT_PCT), etf, mode="up")
+    return limit_up, limit_down
+
+
+def _is_etf(symbol, master):
+    record = master.get(symbol) if master is not None else None
+    if record is not None:
+        return record["category"] == "ETF"
+    return symbol.startswith("00")
+
+
+def _session_date(stock, default):
+    """snapshot 單檔資料所屬的交易日 (lastUpdated 為微秒時間戳)"""
+    updated = stock.get("lastUpdated")
+    if updated:
+        return datetime.fromtimestamp(updated / 1_000_000).date().isoformat()
+    return default
+
+
+def load_references(reststock, markets=MARKETS):
+    """以 snapshot 一次取得全市場參考價，回傳 {symbol: {reference, limit_up, limit_down, etf}}
+
+    snapshot 為今日盤中資料時參考價 = 收盤/最新價 - 漲跌；開盤前 snapshot 仍是前一交易日，
+    其收盤價即今日參考價 (除權息日不準，今日商品主檔有交易所公布的價格時優先使用)。
+    無法判斷交易日且主檔沒有今日價格的股票不列入。
+
+    ETF 只使用交易所公布的漲跌停價：槓桿/反向與國外成分 ETF 沒有漲跌幅限制，
+    無公布價格時 limit_up/limit_down 為 None，不檢查漲跌停。
+    """
+    master = get_shared_master()
+    fresh_master = master if master is not None and master.is_fresh() else None
+    today = date.today().isoformat()
+
+    symbols, references = [], []
+    for market in markets:
+        snapshot = reststock.snapshot.quotes(market=market, type="ALLBUT0999") or {}
+        for stock in snapshot.get("data", []):
+            close = stock.get("closePrice") or stock.get("lastPrice")
+            if not stock.get("symbol") or not close:
+                continue
+            session = _session_date(stock, snapshot.get("date"))
+            if session == today:
+                reference = close - (stock.get("change") or 0)
+            elif session:
+                reference = close
+            else:
+                reference = None
+            symbols.append(stock["symbol"])
+            references.append(np.nan if reference is None else reference)
+
+    etf = np.array([_is_etf(s, master) for s in symbols], dtype=bool)
+    limit_up, limit_down = price_limits(references, etf)
+
+    table = {}
+    for i, symbol in enumerate(symbols):
+        entry = {
+            "reference": float(references[i]),
+            "limit_up": None if etf[i] else float(limit_up[i]),
+            "limit_down": None if etf[i] else float(limit_down[i]),
+            "etf": bool(etf[i]),
+        }
+        record = fresh_master.get(symbol) if fresh_master is not None else None
+        if record and record.get("reference_price"):
+            entry["reference"] = record["reference_price"]
+        if record and record.get("limit_up") and record.get("limit_down"):
+            entry["limit_up"] = record["limit_up"]
+            entry["limit_down"] = record["limit_down"]
+        elif not etf[i] and record and record.get("reference_price"):
+            up, down = price_limits(record["reference_price"])
+            entry["limit_up"], entry["limit_down"] = float(up), float(down)
+        if np.isnan(entry["reference"]):
+            continue
+        table[symbol] = entry
+    return table
+
+
+def load_reference(reststock, symbol):
+    """單一股票的參考價與漲跌停價 (intraday.ticker)，查無資料回傳 None
+
+    ETF 沒有交易所公布的漲跌停價時不檢查漲跌停 (limit_up/limit_down 為 None)。
+    """
+    ticker = reststock.intraday.ticker(symbol=symbol)
+    if not ticker or not ticker.get("referencePrice"):
+        return None
+    master = get_shared_master()
+    etf = _is_etf(symbol, master)
+    limit_up, limit_down = price_limits(ticker["referencePrice"], etf)
+    return {
+        "reference": ticker["referencePrice"],
+        "limit_up": ticker.get("limitUpPrice") or (None if etf else float(limit_up)),
+        "limit_down": ticker.get("limitDownPrice") or (None if etf else float(limit_down)),
+        "etf": etf,
+    }
+
+
+def _limit(references, symbol, field):
+    value = references[symbol][field] if symbol in references else None
+    return np.nan if value is None else value
+
+
+def validate_prices(symbols, prices, references, snap=True):
+    """一次檢查整批委託價格
+
+    Args:
+        symbols/prices: 股票代號與委託價格 (同長度)
+        references: load_references 的結果
+        snap: 不在跳動單位上的價格是否調整到最近檔位 (否則直接拒絕)
+
+    Returns:
+        list[{"price": 調整後價格, "adjusted": bool, "error": 錯誤訊息或 None}]，依輸入順序
+    """
+    prices = np.asarray(prices, dtype=float)
+    known = np.array([s in references for s in symbols], dtype=bool)
+    etf = np.array([references[s]["etf"] if s in references else False for s in symbols])
+    # 沒有漲跌停價 (無漲跌幅限制的 ETF) 為 nan，不會超出範圍
+    upper = np.array([_limit(references, s, "limit_up") for s in symbols], dtype=float)
+    lower = np.array([_limit(references, s, "limit_down") for s in symbols], dtype=float)
+
+    valid_tick = on_tick(prices, etf)
+    snapped = np.where(valid_tick, prices, snap_to_tick(prices, etf))
+    final = snapped if snap else prices
+
+    with np.errstate(invalid="ignore"):
+        above = final > upper + _EPSILON
+        below = final < lower - _EPSILON
+
+    results = []
+    for i in range(len(symbols)):
+        error = None
+        if not known[i]:
+            error = "查無參考價"
+        elif not snap and not valid_tick[i]:
+            error = f"價格不符跳動單位 (最近檔位 {snapped[i]:g})"
+        elif above[i]:
+            error = f"高於漲停價 {upper[i]:g}"
+        elif below[i]:
+            error = f"低於跌停價 {lower[i]:g}"
+        results.append(
+            {
+                "price": float(final[i]),
+                "adjusted": bool(snap and not valid_tick[i]),
+                "error": error,
+            }
+        )
+    return results
+
+
+def format_price(price):
+    """委託價格字串 (API 使用字串格式)"""
+    return f"{price:.2f}".rstrip("0").rstrip(".")
+
+
+def confirm_order_price(sdk, symbol, price):
+    """單筆下單前的互動式檢查 (3_buy / 5_BuyFull 共用)
+
+    超出漲跌停直接取消；不在跳動單位上時詢問是否改用最近檔位。
+    無法取得參考價時保留原價格由券商檢查。
+
+    Returns:
+        要送出的價格字串，取消時回傳 None
+    """
+    try:
+        sdk.init_realtime()
+        reference = load_reference(sdk.marketdata.rest_client.stock, symbol)
+    except Exception as e:
+        print(f"⚠️ 無法取得參考價（{e}），略過送單前檢查")
+        return price
+    if reference is None:
+        print(f"⚠️ 查無 {symbol} 參考價，略過送單前檢查")
+        return price
+
+    result = validate_prices([symbol], [float(price)], {symbol: reference})[0]
+    if result["error"]:
+        print(f"❌ 價格 {price} {result['error']}，已取消下單")
+        return None
+    if result["adjusted"]:
+        snapped = format_price(result["price"])
+        choice = input(f"⚠️ 價格 {price} 不符跳動單位，是否改用 {snapped}？(Y/n)：").strip().lower()
+        if choice == "n":
+            print("已取消下單")
+            return None
+        return snapped
+
+    if reference["limit_up"] is None:
+        print(f"✅ 價格檢查通過（參考價 {reference['reference']:g}，無漲跌停限制）")
+    else:
+        print(
+            f"✅ 價格檢查通過（參考價 {reference['reference']:g}，"
+            f"跌停 {reference['limit_down']:g} ~ 漲停 {reference['limit_up']:g}）"
+        )
+    return price
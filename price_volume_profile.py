@@ -0,0 +1,308 @@
+import bisect
+import heapq
+import json
+import threading
+
+# 價格以 0.01 元為一個 tick 作為索引鍵，避免浮點數當 dict key 的誤差
+TICK_SCALE = 100
+
+# 分價量表的最後成交落後報價超過此秒數，視為串流中斷
+STALE_TOLERANCE = 30
+
+
+def price_to_tick(price):
+    """價格轉換為整數 tick"""
+    return int(round(price * TICK_SCALE))
+
+
+def tick_to_price(tick):
+    """整數 tick 轉回價格"""
+    return tick / TICK_SCALE
+
+
+def classify_trade_side(trade):
+    """判斷成交為內盤或外盤 (與 GaN.analyze_big_orders 相同邏輯)
+
+    Returns:
+        "ask" 外盤（主動買進）、"bid" 內盤（主動賣出）或 None 無法歸類
+    """
+    # 方法1：使用交易標記
+    if "tick" in trade:
+        tick = trade["tick"]
+        if tick in ["up", "plus", "+", 1]:
+            return "ask"
+        if tick in ["down", "minus", "-", -1]:
+            return "bid"
+        return None
+
+    # 方法2：使用成交當下的買賣價判斷
+    price = trade.get("price", 0)
+    bid = trade.get("bid", 0)
+    ask = trade.get("ask", 0)
+    if bid and ask and price:
+        if abs(price - ask) < abs(price - bid):
+            return "ask"
+        if abs(price - bid) < abs(price - ask):
+            return "bid"
+    return None
+
+
+class PriceVolumeProfile:
+    """分價量表 - 由逐筆成交增量維護
+
+    每個價位 (tick) 記錄總量、內盤量 (volumeAtBid)、外盤量 (volumeAtAsk)。
+    - 寫入：dict 更新為 O(1)；新價位只標記價位索引需重排，不在成交時排序
+    - POC：各價位的量只增不減，每筆成交比較一次即可維持
+    - 價位索引：讀取時才排序 (價位數量很少，且新價位出現的頻率遠低於成交)
+
+    即時頻道的執行緒以 add_trade 寫入時，其他執行緒應先以 snapshot() 取得副本再讀取。
+    """
+
+    def __init__(self, symbol=""):
+        self.symbol = symbol
+        self.lock = threading.Lock()
+        self.levels = {}  # tick -> [總量, 內盤量, 外盤量]
+        self._sorted = []  # 已排序的價位，None 表示需重排
+        self._poc = None  # 成交量最大的 tick
+        self.pending = None  # 等待初始資料時暫存的成交
+        self.total_volume = 0
+        self.total_value = 0.0
+        self.last_price = None
+        self.last_time = 0
+
+    def __len__(self):
+        return len(self.levels)
+
+    def _add(self, tick, volume, at_bid, at_ask):
+        level = self.levels.get(tick)
+        if level is None:
+            level = [0, 0, 0]
+            self.levels[tick] = level
+            self._sorted = None
+
+        level[0] += volume
+        level[1] += at_bid
+        level[2] += at_ask
+
+        # 量相同時取較高價位，與排序後取最大值的結果一致
+        poc = self._poc
+        if poc is None or (level[0], tick) > (self.levels[poc][0], poc):
+            self._poc = tick
+
+        self.total_volume += volume
+        self.total_value += tick_to_price(tick) * volume
+
+    def _ticks(self):
+        if self._sorted is None:
+            self._sorted = sorted(self.levels)
+        return self._sorted
+
+    def _apply_trade(self, trade):
+        # 即時頻道可能重送同一筆，以時間戳去重
+        timestamp = trade.get("time", 0)
+        if timestamp and timestamp < self.last_time:
+            return
+
+        size = trade["size"]
+        side = classify_trade_side(trade)
+        self._add(
+            price_to_tick(trade["price"]),
+            size,
+            size if side == "bid" else 0,
+            size if side == "ask" else 0,
+        )
+        self.last_price = trade["price"]
+        if timestamp:
+            self.last_time = timestamp
+
+    def add_trade(self, trade):
+        """加入一筆成交 (trades 資料或即時 trades 頻道的 data)"""
+        price = trade.get("price", 0)
+        size = trade.get("size", 0)
+        if not price or size <= 0:
+            return
+
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(trade)
+                return
+            self._apply_trade(trade)
+
+    def add_trades(self, trades_data):
+        """批次加入 reststock.intraday.trades 的結果 (API 由新到舊排列)"""
+        if not trades_data or not trades_data.get("data"):
+            return
+        for trade in reversed(trades_data["data"]):
+            self.add_trade(trade)
+
+    def buffer(self):
+        """開始暫存成交，直到 seed() 載入初始資料
+
+        先訂閱即時成交再查詢 volumes，訂閱前後之間的成交才不會遺漏。
+        """
+        with self.lock:
+            if self.pending is None:
+                self.pending = []
+
+    def seed(self, volumes_data):
+        """載入 reststock.intraday.volumes 的結果，再補上暫存的成交
+
+        暫存成交的累計量 (volume 欄位) 未超過初始資料總量者，已包含在初始資料中。
+        """
+        with self.lock:
+            if volumes_data and volumes_data.get("data"):
+                for item in volumes_data["data"]:
+                    price = item.get("price", 0)
+                    volume = item.get("volume", 0)
+                    if price and volume > 0:
+                        self._add(
+                            price_to_tick(price),
+                            volume,
+                            item.get("volumeAtBid", 0),
+                            item.get("volumeAtAsk", 0),
+                        )
+            seeded = self.total_volume
+            pending, self.pending = self.pending or [], None
+            for trade in pending:
+                total = trade.get("volume")
+                if total is None or total > seeded:
+                    self._apply_trade(trade)
+
+    @classmethod
+    def from_volumes(cls, volumes_data, symbol=""):
+        """由 reststock.intraday.volumes 的結果建立初始分價量表"""
+        profile = cls(symbol)
+        profile.seed(volumes_data)
+        return profile
+
+    def is_stale(self, last_trade_time, tolerance=STALE_TOLERANCE):
+        """與報價的最後成交時間 (微秒) 比較，落後超過 tolerance 秒表示串流已中斷"""
+        if not last_trade_time:
+            return False
+        return self.last_time < last_trade_time - tolerance * 1_000_000
+
+    def snapshot(self):
+        """目前狀態的副本 (跨執行緒讀取用)"""
+        copy = PriceVolumeProfile(self.symbol)
+        with self.lock:
+            copy.levels = {tick: list(level) for tick, level in self.levels.items()}
+            copy._sorted = None if self._sorted is None else list(self._sorted)
+            copy._poc = self._poc
+            copy.total_volume = self.total_volume
+            copy.total_value = self.total_value
+            copy.last_price = self.last_price
+            copy.last_time = self.last_time
+        return copy
+
+    def _row(self, tick):
+        volume, at_bid, at_ask = self.levels[tick]
+        return {
+            "price": tick_to_price(tick),
+            "volume": volume,
+            "volumeAtBid": at_bid,
+            "volumeAtAsk": at_ask,
+        }
+
+    def level(self, price):
+        """查詢單一價位，O(1)"""
+        tick = price_to_tick(price)
+        return self._row(tick) if tick in self.levels else None
+
+    def top_by_price(self, k=5, highest=True):
+        """價格最高 (或最低) 的 K 檔"""
+        ticks = self._ticks()
+        ticks = ticks[-k:][::-1] if highest else ticks[:k]
+        return [self._row(t) for t in ticks]
+
+    def top_by_volume(self, k=5):
+        """成交量最大的 K 檔 (O(n log k))"""
+        levels = self.levels
+        ticks = heapq.nlargest(k, levels, key=lambda t: (levels[t][0], t))
+        return [self._row(t) for t in ticks]
+
+    def point_of_control(self):
+        """POC：成交量最大的價位"""
+        if self._poc is None:
+            return None
+        return tick_to_price(self._poc)
+
+    def vwap(self):
+        """由分價量表計算的 VWAP"""
+        if self.total_volume <= 0:
+            return None
+        return self.total_value / self.total_volume
+
+    def value_area(self, ratio=0.7):
+        """價值區 (Value Area)：由 POC 向上下擴展，直到涵蓋 ratio 比例的成交量
+
+        Returns:
+            (低價, 高價, 涵蓋量) 或 None
+        """
+        if self._poc is None:
+            return None
+
+        target = self.total_volume * ratio
+        ticks = self._ticks()
+        lo = hi = bisect.bisect_left(ticks, self._poc)
+        covered = self.levels[self._poc][0]
+
+        while covered < target and (lo > 0 or hi < len(ticks) - 1):
+            below = self.levels[ticks[lo - 1]][0] if lo > 0 else -1
+            above = self.levels[ticks[hi + 1]][0] if hi < len(ticks) - 1 else -1
+            # 每次擴展量較大的一側
+            if above >= below:
+                hi += 1
+                covered += above
+            else:
+                lo -= 1
+                covered += below
+
+        return tick_to_price(ticks[lo]), tick_to_price(ticks[hi]), covered
+
+
+def trade_message_handler(profiles, on_trade=None):
+    """即時成交頻道的訊息處理：更新 profiles 中該檔的分價量表，再呼叫 on_trade(symbol, trade)"""
+
+    def handle_message(message):
+        try:
+            msg = json.loads(message) if isinstance(message, str) else message
+        except ValueError:
+            return
+        if msg.get("event") != "data" or msg.get("channel") != "trades":
+            return
+        data = msg.get("data", {})
+        symbol = data.get("symbol")
+        profile = profiles.get(symbol)
+        if profile is None:
+            return
+        profile.add_trade(data)
+        if on_trade is not None:
+            on_trade(symbol, data)
+
+    return handle_message
+
+
+def attach_trade_stream(sdk, symbols, profiles=None, on_trade=None):
+    """訂閱即時成交頻道，持續更新各股的分價量表
+
+    Args:
+        sdk: 已登入且執行過 init_realtime() 的 SDK
+        symbols: 要訂閱的股票代碼清單 (之後可再以回傳的 client 訂閱)
+        profiles: 既有的 {symbol: PriceVolumeProfile}，可先以 from_volumes 建立
+        on_trade: 分價量表更新後呼叫的 on_trade(symbol, trade)
+
+    Returns:
+        (websocket client, profiles)
+    """
+    if profiles is None:
+        profiles = {}
+    for symbol in symbols:
+        profiles.setdefault(symbol, PriceVolumeProfile(symbol))
+
+    stock_ws = sdk.marketdata.websocket_client.stock
+    stock_ws.on("message", trade_message_handler(profiles, on_trade))
+    stock_ws.connect()
+    for symbol in symbols:
+        stock_ws.subscribe({"channel": "trades", "symbol": symbol})
+
+    return stock_ws, profiles
@@ -0,0 +1,449 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from security_master import lookup_name
+
+# 各來源延遲與錯誤率的統計檔 (跨次執行沿用，短命的查詢工具也能依歷史選路)
+STATS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "quote_provider_stats.json"
+)
+
+# 預設啟用的來源 (依序為初始優先順序)
+DEFAULT_PROVIDERS = os.getenv("QUOTE_PROVIDERS", "twstock,broker,cache")
+
+# 是否需要盤中即時價格；不需要時本地快取已有最新盤後日K就直接使用，不連線
+INTRADAY = os.getenv("QUOTE_INTRADAY", "0") == "1"
+
+EWMA_ALPHA = 0.3  # 新樣本權重
+ERROR_PENALTY = 5  # 錯誤率對分數的放大倍數
+FAILURE_THRESHOLD = 3  # 連續失敗幾次後暫停使用
+COOLDOWN = 60  # 暫停秒數
+
+# 來源回覆「查無此股票」的訊息 (代號錯誤、下市)，屬於正常回應而非來源異常
+NO_DATA_MESSAGES = ("empty query", "not found", "404")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_no_data(message):
+    """來源的錯誤訊息是否表示查無此股票"""
+    message = str(message).lower()
+    return any(text in message for text in NO_DATA_MESSAGES)
+
+
+def parse_realtime_quote(stock_id, data):
+    """將 twstock.realtime 的單檔資料轉成報價格式，資料不完整時回傳 None"""
+    realtime = data.get("realtime") or {}
+    info = data.get("info") or {}
+
+    close = _to_float(realtime.get("latest_trade_price"))
+    if close is None:
+        # 最近一盤沒有成交時以最佳買價代替
+        bids = realtime.get("best_bid_price") or []
+        close = _to_float(bids[0]) if bids else None
+    open_price = _to_float(realtime.get("open"))
+    high = _to_float(realtime.get("high"))
+    low = _to_float(realtime.get("low"))
+    if None in (close, open_price, high, low):
+        return None
+
+    try:
+        date = datetime.strptime(info.get("time", ""), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        date = datetime.now()
+
+    return {
+        "id": stock_id,
+        "name": lookup_name(stock_id, info.get("name") or "未知"),
+        "date": date,
+        "open": open_price,
+        "high": high,
+        "low": low,
+        "close": close,
+        # 即時資料的累計成交量單位為張，換算成股數與歷史資料一致
+        "capacity": (_to_float(realtime.get("accumulate_trade_volume")) or 0) * 1000,
+    }
+
+
+class TwstockProvider:
+    """證交所即時報價 (twstock.realtime)"""
+
+    name = "twstock"
+    fallback = False
+
+    def connect(self):
+        pass
+
+    def get(self, stock_id):
+        import twstock
+
+        data = twstock.realtime.get(stock_id)
+        if not data:
+            raise ConnectionError("無回應")
+        if not data.get("success"):
+            message = data.get("rtmessage", "查詢失敗")
+            if is_no_data(message):
+                return None
+            raise ConnectionError(message)
+        # 暫停交易等沒有價格的資料由 parse_realtime_quote 回傳 None
+        return parse_realtime_quote(stock_id, data)
+
+    def close(self):
+        pass
+
+
+class BrokerProvider:
+    """富邦行情 API (reststock.intraday.quote)
+
+    可傳入呼叫端已登入的 sdk 共用同一個連線 (不會重複登入，關閉時也不登出)；
+    未傳入時第一次使用才登入。
+    """
+
+    name = "broker"
+    fallback = False
+
+    def __init__(self, sdk=None):
+        self.sdk = sdk
+        self.owns_session = sdk is None
+        self.reststock = None
+        self.lock = threading.Lock()
+
+    def use_session(self, sdk):
+        """改用呼叫端已登入的 sdk (已自行登入時不變更)"""
+        with self.lock:
+            if self.sdk is None:
+                self.sdk = sdk
+                self.owns_session = False
+                self.reststock = None
+
+    def connect(self):
+        with self.lock:
+            if self.reststock is None:
+                if self.sdk is None:
+                    from login_helper import login
+
+                    self.sdk, _ = login()
+                    self.owns_session = True
+                self.sdk.init_realtime()
+                self.reststock = self.sdk.marketdata.rest_client.stock
+
+    def get(self, stock_id):
+        try:
+            quote = self.reststock.intraday.quote(symbol=stock_id)
+        except Exception as e:
+            if is_no_data(e):
+                return None
+            raise
+        if not quote or quote.get("statusCode") == 404:
+            return None
+        close = quote.get("lastPrice") or quote.get("closePrice")
+        if not close:
+            return None
+
+        try:
+            date = datetime.strptime(quote.get("date", ""), "%Y-%m-%d")
+        except ValueError:
+            date = datetime.now()
+        return {
+            "id": stock_id,
+            "name": lookup_name(stock_id, quote.get("name") or "未知"),
+            "date": date,
+            "open": quote.get("openPrice") or close,
+            "high": quote.get("highPrice") or close,
+            "low": quote.get("lowPrice") or close,
+            "close": close,
+            # tradeVolume 單位為張
+            "capacity": (quote.get("total") or {}).get("tradeVolume", 0) * 1000,
+        }
+
+    def close(self):
+        with self.lock:
+            if self.sdk is not None and self.owns_session:
+                try:
+                    self.sdk.logout()
+                except Exception:
+                    pass
+            self.sdk = None
+            self.reststock = None
+
+
+class CachedProvider:
+    """本地日K快取 (ohlc_cache)，盤中為前一交易日收盤
+
+    peek() 只讀已是最新盤後資料的快取 (不需要即時價格時優先使用)；
+    get() 會在快取過期時重新抓取日K，只在即時來源都失敗時使用。
+    """
+
+    name = "cache"
+    fallback = True
+
+    def connect(self):
+        pass
+
+    def peek(self, stock_id):
+        from ohlc_cache import peek_latest
+
+        return self._to_quote(stock_id, peek_latest(stock_id))
+
+    def get(self, stock_id):
+        from ohlc_cache import NoDataError, get_latest
+
+        try:
+            latest = get_latest(stock_id)
+        except NoDataError:
+            return None
+        return self._to_quote(stock_id, latest)
+
+    @staticmethod
+    def _to_quote(stock_id, latest):
+        if not latest:
+            return None
+        return {
+            "id": stock_id,
+            "name": lookup_name(stock_id),
+            "date": latest.date,
+            "open": latest.open,
+            "high": latest.high,
+            "low": latest.low,
+            "close": latest.close,
+            "capacity": latest.capacity,
+        }
+
+    def close(self):
+        pass
+
+
+PROVIDERS = {
+    "twstock": TwstockProvider,
+    "broker": BrokerProvider,
+    "cache": CachedProvider,
+}
+
+
+class QuoteRouter:
+    """依實測延遲與錯誤率選擇報價來源，失敗時自動改用下一個來源
+
+    分數 = EWMA 延遲 x (1 + ERROR_PENALTY x EWMA 錯誤率)，分數低者優先；
+    尚無樣本的來源分數為 0，會先被嘗試一次以取得量測值。
+    連續失敗 FAILURE_THRESHOLD 次的來源暫停 COOLDOWN 秒 (全部暫停時仍會嘗試)。
+    只有例外 (連線失敗、逾時) 算錯誤；來源回傳 None (查無此股票、暫停交易) 是正常回應。
+    fallback 來源 (本地快取) 不參與競速，永遠排在即時來源之後；
+    不需要即時價格時，先以 peek() 取用已是最新盤後資料的快取，不連線。
+    set_concurrency() 可限制每個來源同時進行的請求數。
+    """
+
+    def __init__(self, providers, stats_path=STATS_PATH):
+        self.providers = providers
+        self.stats_path = stats_path
+        self.lock = threading.Lock()
+        self.slots = {}  # 來源名稱 -> 同時請求數限制
+        self.stats = {
+            p.name: {"latency": None, "error_rate": 0.0, "failures": 0, "down_until": 0.0,
+                     "requests": 0, "errors": 0}
+            for p in providers
+        }
+        self._load_stats()
+
+    def _load_stats(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, stats in self.stats.items():
+            if name in saved:
+                stats["latency"] = saved[name].get("latency")
+                stats["error_rate"] = saved[name].get("error_rate", 0.0)
+
+    def save_stats(self):
+        if not self.stats_path:
+            return
+        with self.lock:
+            payload = {
+                name: {"latency": s["latency"], "error_rate": s["error_rate"]}
+                for name, s in self.stats.items()
+            }
+        try:
+            tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            print(f"⚠️ 無法儲存報價來源統計：{e}")
+
+    def set_concurrency(self, limit):
+        """每個來源同時進行的請求數上限，None 或 0 為不限制"""
+        slots = {}
+        if limit:
+            slots = {p.name: threading.BoundedSemaphore(limit) for p in self.providers}
+        with self.lock:
+            self.slots = slots
+
+    def peek(self, stock_id):
+        """不連線的本地報價 (最新盤後日K)，沒有時回傳 None"""
+        for provider in self.providers:
+            peek = getattr(provider, "peek", None)
+            if peek is None:
+                continue
+            try:
+                quote = peek(stock_id)
+            except Exception:
+                continue
+            if quote:
+                quote["source"] = provider.name
+                return quote
+        return None
+
+    def _score(self, name):
+        stats = self.stats[name]
+        if stats["latency"] is None:
+            return 0.0
+        return stats["latency"] * (1 + ERROR_PENALTY * stats["error_rate"])
+
+    def ranked(self):
+        """依分數排序的來源，fallback 與暫停中的排在最後"""
+        now = time.monotonic()
+        with self.lock:
+            return sorted(
+                self.providers,
+                key=lambda p: (
+                    p.fallback,
+                    self.stats[p.name]["down_until"] > now,
+                    self._score(p.name),
+                ),
+            )
+
+    def _record(self, name, elapsed, error):
+        with self.lock:
+            stats = self.stats[name]
+            stats["requests"] += 1
+            stats["error_rate"] = (1 - EWMA_ALPHA) * stats["error_rate"] + EWMA_ALPHA * (
+                1.0 if error else 0.0
+            )
+            if error:
+                stats["errors"] += 1
+                stats["failures"] += 1
+                if stats["failures"] >= FAILURE_THRESHOLD:
+                    stats["down_until"] = time.monotonic() + COOLDOWN
+            else:
+                stats["failures"] = 0
+                stats["down_until"] = 0.0
+                # 只以成功的請求量測延遲，逾時類錯誤由錯誤率反映
+                if stats["latency"] is None:
+                    stats["latency"] = elapsed
+                else:
+                    stats["latency"] = (1 - EWMA_ALPHA) * stats["latency"] + EWMA_ALPHA * elapsed
+
+    def get(self, stock_id, intraday=INTRADAY):
+        """依序嘗試各來源直到取得報價，結果含 source 欄位
+
+        intraday 為 False 時先使用已是最新盤後資料的本地快取。
+        所有來源都查無資料時回傳 None；都發生錯誤時拋出最後一個例外。
+        """
+        if not intraday:
+            quote = self.peek(stock_id)
+            if quote:
+                return quote
+
+        last_error = None
+        for provider in self.ranked():
+            try:
+                # 建立連線 (券商登入) 不計入延遲
+                provider.connect()
+            except Exception as e:
+                self._record(provider.name, 0.0, True)
+                last_error = e
+                continue
+
+            slot = self.slots.get(provider.name)
+            if slot is not None:
+                slot.acquire()
+            start = time.perf_counter()
+            try:
+                quote = provider.get(stock_id)
+            except Exception as e:
+                self._record(provider.name, time.perf_counter() - start, True)
+                last_error = e
+                continue
+            finally:
+                if slot is not None:
+                    slot.release()
+            # 查無資料也是正常回應，不計入錯誤率，改問下一個來源
+            self._record(provider.name, time.perf_counter() - start, False)
+            if quote:
+                quote["source"] = provider.name
+                return quote
+
+        if last_error is not None:
+            raise last_error
+        return None
+
+    def summary(self):
+        """各來源統計文字"""
+        lines = []
+        with self.lock:
+            for provider in self.providers:
+                s = self.stats[provider.name]
+                latency = f"{s['latency'] * 1000:.0f}ms" if s["latency"] is not None else "-"
+                lines.append(
+                    f"{provider.name}: 延遲 {latency} | 錯誤率 {s['error_rate']:.0%} | "
+                    f"請求 {s['requests']} 次 (失敗 {s['errors']})"
+                )
+        return "\n".join(lines)
+
+    def close(self):
+        self.save_stats()
+        for provider in self.providers:
+            provider.close()
+
+
+def build_router(names=DEFAULT_PROVIDERS, sdk=None):
+    """依名稱清單 (逗號分隔) 建立路由器，sdk 指定時券商來源共用該連線"""
+    providers = []
+    for name in names.split(","):
+        name = name.strip()
+        if name == "broker":
+            providers.append(BrokerProvider(sdk))
+        elif name in PROVIDERS:
+            providers.append(PROVIDERS[name]())
+    return QuoteRouter(providers)
+
+
+# 程序內共用的路由器
+_shared_router = None
+_shared_lock = threading.Lock()
+
+
+def get_router(sdk=None):
+    """取得程序內共用的路由器 (第一次呼叫時建立)
+
+    已登入的程式可傳入 sdk，券商來源改用該連線而不另外登入。
+    """
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = build_router(sdk=sdk)
+        elif sdk is not None:
+            for provider in _shared_router.providers:
+                if isinstance(provider, BrokerProvider):
+                    provider.use_session(sdk)
+        return _shared_router
+
+
+def close_router():
+    """儲存統計並關閉共用路由器 (券商來源自行登入時會登出)"""
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is not None:
+            _shared_router.close()
+            _shared_router = None
@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """執行緒安全的 Token Bucket 限速器
+
+    rate: 每秒補充的額度 (0 或 None 表示不限速)
+    burst: 桶子容量，允許短時間內的突發請求數
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate or 0
+        self.capacity = burst if burst else max(1, int(self.rate or 1))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0  # 累計等待秒數 (統計用)
+
+    def acquire(self, tokens=1):
+        """取得額度，不足時阻塞等待"""
+        if not self.rate:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.waited += waited
+                    return waited
+
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
@@ -0,0 +1,330 @@
+import ast
+import json
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+# 規則可使用的欄位
+# SNAPSHOT_FIELDS 可由 snapshot/quotes 直接算出，第一階段即可整批預篩
+SNAPSHOT_FIELDS = {"volume", "price", "change_pct", "price_range", "momentum"}
+QUOTE_FIELDS = {"vwap_dev", "breakthrough", "order_signal"}
+CANDLE_FIELDS = {"vol_ratio"}
+FIELDS = SNAPSHOT_FIELDS | QUOTE_FIELDS | CANDLE_FIELDS
+
+# BOUND_FIELDS 為第二階段取得即時報價後就不再變動的欄位 (只剩 K 線欄位未知)，
+# 用來在查詢 K 線前計算該檔分數上限；快照欄位在第二階段會重算，不能用來估上限
+BOUND_FIELDS = SNAPSHOT_FIELDS | QUOTE_FIELDS
+
+# 預設規則 (與原本 analyze_single_stock 寫死的門檻相同)
+DEFAULT_RULES = {
+    "required": [
+        {"when": "volume >= 2000", "label": "量{volume:,.0f}張"},
+        {"when": "price_range >= 2.0", "label": "波動{price_range:.1f}%"},
+    ],
+    "bonus": [
+        {"when": "vol_ratio >= 2.0", "weight": 1, "label": "量比{vol_ratio:.1f}"},
+        {"when": "momentum >= 1.5", "weight": 1, "label": "動能{momentum:.1f}%"},
+        {"when": "vwap_dev >= 0.7", "weight": 1, "label": "VWAP{vwap_dev:.1f}%"},
+    ],
+    "extra": [
+        {"when": "breakthrough", "weight": 1, "label": "突破"},
+        {"when": "order_signal", "weight": 1, "label": "掛單訊號"},
+    ],
+}
+
+_COMPARE_OPS = {
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+class RuleError(ValueError):
+    """規則語法錯誤"""
+
+
+def _compile_node(node, fields):
+    """將條件式 AST 編譯為 columns -> ndarray 的函數，並記錄用到的欄位"""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, fields)
+
+    if isinstance(node, ast.Name):
+        if node.id not in FIELDS:
+            raise RuleError(f"未知欄位 '{node.id}'，可用欄位：{', '.join(sorted(FIELDS))}")
+        fields.add(node.id)
+        name = node.id
+        return lambda cols: cols[name]
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        value = node.value
+        return lambda cols: value
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, fields)
+        if isinstance(node.op, ast.Not):
+            return lambda cols: np.logical_not(operand(cols))
+        if isinstance(node.op, ast.USub):
+            return lambda cols: -operand(cols)
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        op = _BIN_OPS[type(node.op)]
+        left = _compile_node(node.left, fields)
+        right = _compile_node(node.right, fields)
+        return lambda cols: op(left(cols), right(cols))
+
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(v, fields) for v in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return lambda cols: combine.reduce([p(cols) for p in parts])
+
+    if isinstance(node, ast.Compare):
+        # 支援連續比較，例如 30 < rsi < 70
+        terms = [_compile_node(node.left, fields)] + [
+            _compile_node(c, fields) for c in node.comparators
+        ]
+        ops = []
+        for op in node.ops:
+            if type(op) not in _COMPARE_OPS:
+                raise RuleError(f"不支援的比較運算子：{type(op).__name__}")
+            ops.append(_COMPARE_OPS[type(op)])
+
+        def compare(cols):
+            result = None
+            for i, op in enumerate(ops):
+                part = op(terms[i](cols), terms[i + 1](cols))
+                result = part if result is None else np.logical_and(result, part)
+            return result
+
+        return compare
+
+    raise RuleError(f"不支援的語法：{ast.dump(node)}")
+
+
+class Clause:
+    """單一條件子句"""
+
+    def __init__(self, spec, kind):
+        if isinstance(spec, str):
+            spec = {"when": spec}
+        self.expr = spec.get("when", "").strip()
+        if not self.expr:
+            raise RuleError(f"{kind} 子句缺少 when 條件")
+        self.kind = kind
+        self.weight = float(spec.get("weight", 1))
+        self.label = spec.get("label", self.expr)
+
+        try:
+            tree = ast.parse(self.expr, mode="eval")
+        except SyntaxError as e:
+            raise RuleError(f"條件式語法錯誤 '{self.expr}'：{e.msg}")
+        self.fields = set()
+        self._fn = _compile_node(tree, self.fields)
+
+    def evaluate(self, cols, size):
+        """回傳長度為 size 的布林陣列"""
+        mask = np.asarray(self._fn(cols), dtype=bool)
+        if mask.ndim == 0:
+            mask = np.full(size, bool(mask))
+        return mask
+
+    def format_label(self, row):
+        try:
+            return self.label.format(**row)
+        except (KeyError, ValueError, IndexError):
+            return self.label
+
+
+class RuleSet:
+    """篩選規則集：required 全部通過才合格，bonus/extra 依權重加分
+
+    所有子句對整個候選表一次計算 (NumPy 向量運算)，
+    分數為布林矩陣乘上權重向量，條件數量多寡對成本影響很小。
+    """
+
+    def __init__(self, spec, source="內建預設"):
+        self.source = source
+        self.required = [Clause(c, "required") for c in spec.get("required", [])]
+        self.bonus = [Clause(c, "bonus") for c in spec.get("bonus", [])]
+        self.extra = [Clause(c, "extra") for c in spec.get("extra", [])]
+        self.fields = set()
+        for clause in self.required + self.bonus + self.extra:
+            self.fields |= clause.fields
+
+    def uses(self, field):
+        """是否有任何子句用到指定欄位 (用來決定是否需要額外 API 呼叫)"""
+        return field in self.fields
+
+    @property
+    def max_bonus(self):
+        return sum(c.weight for c in self.bonus)
+
+    @property
+    def max_extra(self):
+        return sum(c.weight for c in self.extra)
+
+    @staticmethod
+    def _columns(frame):
+        return {
+            name: frame[name].to_numpy() if name in frame else np.zeros(len(frame))
+            for name in FIELDS
+        }
+
+    @staticmethod
+    def _masks(clauses, cols, size):
+        if not clauses:
+            return np.zeros((size, 0), dtype=bool)
+        return np.column_stack([c.evaluate(cols, size) for c in clauses])
+
+    def prefilter(self, frame):
+        """只用快照欄位可判斷的必要條件做預篩，回傳布林陣列"""
+        if not isinstance(frame, pd.DataFrame):
+            frame = pd.DataFrame(frame)
+        size = len(frame)
+        clauses = [c for c in self.required if c.fields <= SNAPSHOT_FIELDS]
+        if size == 0 or not clauses:
+            return np.ones(size, dtype=bool)
+        return self._masks(clauses, self._columns(frame), size).all(axis=1)
+
+    def _partial_scores(self, cols, size, fields):
+        """只用 fields 內欄位的子句直接計算，其餘子句以 max(權重, 0) 計
+
+        已知欄位的必要條件不通過時為 -inf (不會進入排名)。
+        """
+        scores = np.zeros(size)
+        failed = np.zeros(size, dtype=bool)
+        for clause in self.required + self.bonus + self.extra:
+            if clause.fields <= fields:
+                hit = clause.evaluate(cols, size)
+                scores += hit * clause.weight
+                if clause.kind == "required":
+                    failed |= ~hit
+            else:
+                scores += max(clause.weight, 0)
+        return np.where(failed, -np.inf, scores)
+
+    def estimate_scores(self, frame):
+        """以快照欄位估計的分數，只用來決定第二階段的處理順序 (不保證為上限)"""
+        if not isinstance(frame, pd.DataFrame):
+            frame = pd.DataFrame(frame)
+        return self._partial_scores(self._columns(frame), len(frame), SNAPSHOT_FIELDS)
+
+    def upper_bound_one(self, metrics):
+        """已取得即時報價 (BOUND_FIELDS) 的單檔，查詢 K 線後可能得到的最高總分"""
+        cols = {
+            name: np.array([metrics.get(name, 0) or 0]) for name in BOUND_FIELDS
+        }
+        return float(self._partial_scores(cols, 1, BOUND_FIELDS)[0])
+
+    def score_one(self, metrics):
+        """單檔評分 (串流排名用)，未通過必要條件回傳 None"""
+        cols = {
+            name: np.array([metrics.get(name, 0) or 0]) for name in self.fields
+        }
+        scores, _ = self._score(cols, 1)
+        if not scores["passed"][0]:
+            return None
+        return {key: float(values[0]) for key, values in scores.items()}
+
+    def _score(self, cols, size):
+        masks = {
+            "required": self._masks(self.required, cols, size),
+            "bonus": self._masks(self.bonus, cols, size),
+            "extra": self._masks(self.extra, cols, size),
+        }
+        weights = {
+            kind: np.array([c.weight for c in clauses], dtype=float)
+            for kind, clauses in (
+                ("required", self.required),
+                ("bonus", self.bonus),
+                ("extra", self.extra),
+            )
+        }
+
+        scores = {
+            "passed": masks["required"].all(axis=1),
+            "base_score": masks["required"] @ weights["required"],
+            "bonus_score": masks["bonus"] @ weights["bonus"],
+            "extra_score": masks["extra"] @ weights["extra"],
+        }
+        scores["total_score"] = (
+            scores["base_score"] + scores["bonus_score"] + scores["extra_score"]
+        )
+        return scores, masks
+
+    def evaluate(self, frame):
+        """對整個候選表計算所有子句
+
+        Returns:
+            新增 passed/base_score/bonus_score/extra_score/total_score 欄位的 DataFrame，
+            以及各子句的布林矩陣 {"required"/"bonus"/"extra": ndarray}
+        """
+        scores, masks = self._score(self._columns(frame), len(frame))
+        scored = frame.copy()
+        for key, values in scores.items():
+            scored[key] = values
+        return scored, masks
+
+    def describe(self):
+        """條件說明文字 (供畫面顯示)"""
+        lines = []
+        for clause in self.required:
+            lines.append(f"{clause.expr} (必要)")
+        for clause in self.bonus:
+            lines.append(f"{clause.expr} (加分 {clause.weight:g})")
+        for clause in self.extra:
+            lines.append(f"{clause.expr} (額外 {clause.weight:g})")
+        return lines
+
+
+def load_rules(path="screen_rules.json"):
+    """讀取規則檔，不存在時使用內建預設規則"""
+    if not path or not os.path.exists(path):
+        return RuleSet(DEFAULT_RULES)
+
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    return RuleSet(spec, source=path)
+
+
+def score_metrics(rules, metrics):
+    """對多檔股票的指標一次評分，回傳通過必要條件的結果清單"""
+    if not metrics:
+        return []
+
+    frame = pd.DataFrame(metrics)
+    scored, masks = rules.evaluate(frame)
+
+    results = []
+    for i in np.flatnonzero(scored["passed"].to_numpy()):
+        row = scored.iloc[i].to_dict()
+        row["required_pass"] = [
+            c.format_label(row) for c in rules.required
+        ]
+        row["bonus_pass"] = [
+            c.format_label(row)
+            for c, hit in zip(rules.bonus, masks["bonus"][i])
+            if hit
+        ]
+        row["bonus_hits"] = [bool(hit) for hit in masks["bonus"][i]]
+        row["extra_pass"] = [
+            c.format_label(row)
+            for c, hit in zip(rules.extra, masks["extra"][i])
+            if hit
+        ]
+        row["all_conditions"] = row["required_pass"] + row["bonus_pass"]
+        for key in ("base_score", "bonus_score", "extra_score", "total_score"):
+            score = row[key]
+            row[key] = int(score) if float(score).is_integer() else score
+        results.append(row)
+    return results
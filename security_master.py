@@ -0,0 +1,212 @@
+import gzip
+import json
+import os
+import time
+from datetime import date
+
+# 本地商品主檔 (每日更新一次)
+MASTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "security_master.json.gz")
+
+FIELDS = [
+    "symbol",
+    "name",
+    "market",
+    "category",  # COMMONSTOCK / ETF / OTHER
+    "security_type",  # ticker API 原始 securityType
+    "industry",
+    "lot_size",
+    "reference_price",
+    "limit_up",
+    "limit_down",
+]
+
+MARKETS = ("TSE", "OTC")
+
+# intraday.tickers 的交易所參數
+EXCHANGES = {"TSE": "TWSE", "OTC": "TPEx"}
+
+
+class SecurityMaster:
+    """商品主檔，以 dict 索引提供 O(1) 查詢"""
+
+    def __init__(self, rows, as_of=""):
+        self.as_of = as_of
+        self.records = {row["symbol"]: row for row in rows}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, symbol):
+        return symbol in self.records
+
+    def get(self, symbol):
+        return self.records.get(symbol)
+
+    def name(self, symbol, default="未知"):
+        record = self.records.get(symbol)
+        return record["name"] if record else default
+
+    def is_common_stock(self, symbol):
+        """是否為普通股 (排除 ETF/ETN/債券/特別股等)，不在主檔中回傳 None"""
+        record = self.records.get(symbol)
+        if record is None:
+            return None
+        return record["category"] == "COMMONSTOCK"
+
+    def is_fresh(self):
+        """是否為今日建立的主檔"""
+        return self.as_of == date.today().isoformat()
+
+    def save(self, path=MASTER_PATH):
+        """以欄位清單 + 資料列的精簡格式寫入 gzip JSON"""
+        payload = {
+            "as_of": self.as_of,
+            "fields": FIELDS,
+            "rows": [[record.get(f) for f in FIELDS] for record in self.records.values()],
+        }
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+def load_security_master(path=MASTER_PATH):
+    """讀取本地商品主檔，不存在或格式錯誤時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        fields = payload["fields"]
+        rows = [dict(zip(fields, row)) for row in payload["rows"]]
+        return SecurityMaster(rows, payload.get("as_of", ""))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"讀取商品主檔失敗: {e}")
+        return None
+
+
+def _classify(symbol, common_symbols):
+    if symbol in common_symbols:
+        return "COMMONSTOCK"
+    if symbol.startswith("00"):
+        return "ETF"
+    return "OTHER"
+
+
+def build_security_master(reststock, markets=MARKETS):
+    """由行情 API 建立商品主檔
+
+    每個市場以 snapshot 取得普通股與全部股票清單 (各 1 次)，
+    再以 intraday.tickers 一次取得該市場的股票明細，不逐檔查詢；
+    整批結果未提供的欄位 (產業別、漲跌停價等) 留空，由使用端自行推算。
+    """
+    start = time.time()
+    listing = {}
+    common_symbols = set()
+    details = {}
+
+    for market in markets:
+        for snapshot_type in ("COMMONSTOCK", "ALLBUT0999"):
+            snapshot = reststock.snapshot.quotes(market=market, type=snapshot_type)
+            for stock in (snapshot or {}).get("data", []):
+                symbol = stock.get("symbol")
+                if not symbol:
+                    continue
+                listing.setdefault(symbol, {"name": stock.get("name", ""), "market": market})
+                if snapshot_type == "COMMONSTOCK":
+                    common_symbols.add(symbol)
+
+        tickers = reststock.intraday.tickers(
+            type="EQUITY", exchange=EXCHANGES[market], market=market
+        )
+        for ticker in (tickers or {}).get("data", []):
+            symbol = ticker.get("symbol")
+            if not symbol:
+                continue
+            details[symbol] = ticker
+            listing.setdefault(symbol, {"name": ticker.get("name", ""), "market": market})
+
+    rows = []
+    for symbol, info in listing.items():
+        ticker = details.get(symbol, {})
+        rows.append(
+            {
+                "symbol": symbol,
+                "name": ticker.get("name") or info["name"],
+                "market": info["market"],
+                "category": _classify(symbol, common_symbols),
+                "security_type": ticker.get("securityType"),
+                "industry": ticker.get("industry"),
+                "lot_size": ticker.get("boardLot") or 1000,
+                "reference_price": ticker.get("referencePrice"),
+                "limit_up": ticker.get("limitUpPrice"),
+                "limit_down": ticker.get("limitDownPrice"),
+            }
+        )
+
+    print(f"商品主檔建立完成: {len(rows)} 檔，耗時 {time.time() - start:.1f} 秒")
+    return SecurityMaster(rows, date.today().isoformat())
+
+
+def ensure_security_master(reststock, path=MASTER_PATH):
+    """取得今日商品主檔，過期時以 reststock 重新建立；更新失敗則沿用舊檔"""
+    master = load_security_master(path)
+    if master is not None and master.is_fresh():
+        return master
+
+    try:
+        print("商品主檔不存在或已過期，重新建立中...")
+        fresh = build_security_master(reststock)
+        if len(fresh) > 0:
+            fresh.save(path)
+            return fresh
+    except Exception as e:
+        print(f"更新商品主檔失敗: {e}")
+    return master
+
+
+# 供查詢工具使用的單例 (只讀取一次)
+_shared_master = None
+_shared_loaded = False
+
+
+def get_shared_master():
+    """取得程序內共用的商品主檔 (不會觸發 API 更新)"""
+    global _shared_master, _shared_loaded
+    if not _shared_loaded:
+        _shared_master = load_security_master()
+        _shared_loaded = True
+    return _shared_master
+
+
+def lookup_name(symbol, default="未知"):
+    """查詢股票中文名稱：優先使用本地主檔，找不到才查 twstock.codes"""
+    master = get_shared_master()
+    if master is not None and symbol in master:
+        return master.name(symbol)
+
+    try:
+        import twstock
+
+        return twstock.codes[symbol].name if symbol in twstock.codes else default
+    except (ImportError, KeyError, AttributeError):
+        return default
+
+
+def main():
+    """手動更新商品主檔"""
+    from login_helper import login
+
+    sdk, account = login()
+    try:
+        sdk.init_realtime()
+        reststock = sdk.marketdata.rest_client.stock
+        master = build_security_master(reststock)
+        master.save()
+        print(f"已寫入 {MASTER_PATH}")
+    finally:
+        sdk.logout()
+
+
+if __name__ == "__main__":
+    main()
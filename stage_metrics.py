@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 各階段耗時統計的輸出檔
+METRICS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "stage_metrics.json"
+)
+
+
+def percentile(sorted_values, pct):
+    """已排序數列的百分位數 (nearest-rank)，空數列回傳 0"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class StageMetrics:
+    """各階段耗時的滾動統計 (每階段保留最近 window 筆)
+
+    可在多個線程中同時記錄，例如登入、各項 API 查詢、指標計算、報告產生與上傳。
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}  # stage -> deque[秒數]
+        self.counts = {}  # stage -> 累計次數
+        self.errors = {}  # stage -> 累計失敗次數
+        self.started_at = time.time()
+
+    def record(self, stage, seconds, error=False):
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            if error:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    @contextmanager
+    def timer(self, stage):
+        """計時區塊，發生例外時也會記錄並標記為失敗"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, error)
+
+    def summary(self):
+        """{stage: {count, errors, p50, p95, p99, max}}，秒數取自最近 window 筆"""
+        with self.lock:
+            snapshot = {stage: sorted(values) for stage, values in self.samples.items()}
+            counts = dict(self.counts)
+            errors = dict(self.errors)
+
+        return {
+            stage: {
+                "count": counts.get(stage, 0),
+                "errors": errors.get(stage, 0),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else 0.0,
+            }
+            for stage, values in sorted(snapshot.items())
+        }
+
+    def render(self):
+        """文字表格 (毫秒)"""
+        summary = self.summary()
+        if not summary:
+            return "尚無統計資料"
+        lines = [f"{'階段':<16}{'次數':>6}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}"]
+        for stage, s in summary.items():
+            errors = f" ({s['errors']} 失敗)" if s["errors"] else ""
+            lines.append(
+                f"{stage:<16}{s['count']:>6}"
+                f"{s['p50'] * 1000:>8.0f}{s['p95'] * 1000:>8.0f}"
+                f"{s['p99'] * 1000:>8.0f}{s['max'] * 1000:>8.0f}{errors}"
+            )
+        return "\n".join(lines)
+
+    def dump(self, path=METRICS_PATH):
+        """寫入 JSON 檔 (含原始樣本，方便事後分析)"""
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        payload = {
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "dumped_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "window": self.window,
+            "summary": self.summary(),
+            "samples": samples,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+# 程序內共用的統計實例
+metrics = StageMetrics(int(os.getenv("STAGE_METRICS_WINDOW", "500")))
+
+
+def stage_timer(stage):
+    """以共用統計實例計時"""
+    return metrics.timer(stage)
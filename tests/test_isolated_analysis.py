@@ -0,0 +1,165 @@
+import random
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def _install_sdk_stubs():
+    """測試環境沒有券商 SDK 時，只提供 login_helper 匯入所需的名稱"""
+    try:
+        import login_helper  # noqa: F401
+        return
+    except ImportError:
+        pass
+    dotenv = types.ModuleType("dotenv")
+    dotenv.load_dotenv = lambda *args, **kwargs: None
+    fubon_neo = types.ModuleType("fubon_neo")
+    fubon_sdk = types.ModuleType("fubon_neo.sdk")
+    fubon_sdk.FubonSDK = object
+    fubon_neo.sdk = fubon_sdk
+    sys.modules.setdefault("dotenv", dotenv)
+    sys.modules.setdefault("fubon_neo", fubon_neo)
+    sys.modules.setdefault("fubon_neo.sdk", fubon_sdk)
+
+
+_install_sdk_stubs()
+
+import GaN  # noqa: E402
+
+SYMBOLS = [f"{2300 + i}" for i in range(12)]
+LINES_PER_REQUEST = 20
+
+
+def _jitter():
+    time.sleep(random.uniform(0, 0.002))
+
+
+class FakeIntraday:
+    def __init__(self, base):
+        self.base = base
+
+    def ticker(self, symbol):
+        _jitter()
+        return {"symbol": symbol, "name": f"N{symbol}", "referencePrice": self.base}
+
+    def quote(self, symbol):
+        _jitter()
+        price = self.base + 1
+        return {
+            "symbol": symbol,
+            "name": f"N{symbol}",
+            "lastPrice": price,
+            "closePrice": price,
+            "openPrice": self.base,
+            "highPrice": price + 1,
+            "lowPrice": self.base - 1,
+            "referencePrice": self.base,
+            "change": 1,
+            "changePercent": 1.0,
+            "avgPrice": self.base + 0.5,
+            "total": {"tradeVolume": 1000, "tradeValue": 1000 * price},
+            "bids": [{"price": price - 0.5, "size": 10}],
+            "asks": [{"price": price + 0.5, "size": 12}],
+        }
+
+    def trades(self, symbol, limit=50):
+        _jitter()
+        return {"data": [{"price": self.base + 1, "size": 5, "time": 1}]}
+
+    def volumes(self, symbol):
+        _jitter()
+        return {"data": [{"price": self.base + 1, "volume": 5}]}
+
+    def candles(self, symbol, timeframe="1"):
+        _jitter()
+        return {"data": [{"close": self.base + 1, "volume": 5}]}
+
+
+class FakeHistorical:
+    def __init__(self, base):
+        self.base = base
+
+    def candles(self, **params):
+        _jitter()
+        return {
+            "data": [
+                {
+                    "date": f"2026-01-{day:02d}",
+                    "open": self.base + day % 3,
+                    "high": self.base + day % 3 + 1,
+                    "low": self.base + day % 3 - 1,
+                    "close": self.base + day % 5,
+                    "volume": 1000,
+                }
+                for day in range(1, 31)
+            ]
+        }
+
+
+class FakeSDK:
+    """每次登入建立獨立連線，價格依登入順序不同，方便檢查結果是否混用"""
+
+    def __init__(self, base):
+        rest = types.SimpleNamespace(
+            intraday=FakeIntraday(base), historical=FakeHistorical(base)
+        )
+        self.marketdata = types.SimpleNamespace(rest_client=types.SimpleNamespace(stock=rest))
+
+    def init_realtime(self):
+        _jitter()
+
+    def logout(self):
+        return True
+
+
+@pytest.fixture
+def fake_sessions(monkeypatch):
+    counter = iter(range(10, 10_000, 10))
+    lock = threading.Lock()
+
+    def fake_login():
+        with lock:
+            base = next(counter)
+        return FakeSDK(base), None
+
+    real_collect = GaN.collect_analysis
+
+    def tagged_collect(reststock, symbol, log=print, **kwargs):
+        # 分析過程中穿插輸出帶股票代號的訊息
+        for i in range(LINES_PER_REQUEST):
+            log(f"[{symbol}] step {i}")
+            _jitter()
+        return real_collect(reststock, symbol, log, **kwargs)
+
+    monkeypatch.setattr(GaN, "login", fake_login)
+    monkeypatch.setattr(GaN, "collect_analysis", tagged_collect)
+
+
+def test_concurrent_isolated_analyses_never_mix(fake_sessions, capsys):
+    sinks = {symbol: [] for symbol in SYMBOLS}
+
+    def run(symbol):
+        return symbol, GaN.run_isolated_analysis(symbol, log=sinks[symbol].append)
+
+    with ThreadPoolExecutor(max_workers=len(SYMBOLS)) as executor:
+        results = dict(executor.map(run, SYMBOLS * 3))
+
+    for symbol in SYMBOLS:
+        tagged = [line for line in sinks[symbol] if line.startswith("[")]
+        assert tagged, f"{symbol} 沒有收到任何訊息"
+        assert all(line.startswith(f"[{symbol}]") for line in tagged)
+        assert len(tagged) == LINES_PER_REQUEST * 3
+        for other in SYMBOLS:
+            if other != symbol:
+                assert not any(f"[{other}]" in line for line in sinks[symbol])
+
+        result = results[symbol]
+        assert result is not None
+        assert result["symbol"] == symbol
+        assert result["name"] == f"N{symbol}"
+
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,58 @@
+import os
+import sys
+import types
+from datetime import datetime
+
+import pytest
+
+import ohlc_cache
+
+NOW = datetime(2026, 10, 19, 15, 0)
+ROW = (datetime(2026, 9, 30), 1000, 600000, 600, 610, 590, 605, 5, 10)
+
+
+@pytest.fixture
+def fetched(monkeypatch, tmp_path):
+    """以假的 twstock 回傳 fetched["rows"]，快取寫到暫存目錄"""
+    fetched = {"rows": [], "calls": 0}
+
+    class Stock:
+        def __init__(self, symbol, initial_fetch=True):
+            pass
+
+        def fetch(self, year, month):
+            fetched["calls"] += 1
+            return list(fetched["rows"])
+
+    monkeypatch.setitem(sys.modules, "twstock", types.SimpleNamespace(Stock=Stock))
+    monkeypatch.setattr(ohlc_cache, "CACHE_DIR", str(tmp_path))
+    return fetched
+
+
+def test_empty_fetch_is_not_cached(fetched):
+    with pytest.raises(ohlc_cache.NoDataError):
+        ohlc_cache.get_month("2330", 2026, 9, NOW)
+    assert not os.path.exists(ohlc_cache._month_path("2330", 2026, 9))
+
+    # 限流解除後重新抓取
+    fetched["rows"] = [ROW]
+    assert ohlc_cache.get_month("2330", 2026, 9, NOW)[-1].close == 605
+    assert fetched["calls"] == 2
+
+
+def test_empty_fetch_keeps_stale_rows(fetched):
+    stale = [ohlc_cache.DailyBar(*ROW)]
+    path = ohlc_cache._month_path("2330", 2026, 10)
+    ohlc_cache._save(path, stale, datetime(2026, 10, 16, 15, 0))
+
+    assert ohlc_cache.get_month("2330", 2026, 10, NOW) == stale
+    # 舊資料不會被空資料蓋掉
+    assert ohlc_cache._load(path)[0] == stale
+
+
+def test_previously_cached_empty_month_is_refetched(fetched):
+    path = ohlc_cache._month_path("2330", 2026, 9)
+    ohlc_cache._save(path, [], datetime(2026, 10, 1, 15, 0))
+
+    fetched["rows"] = [ROW]
+    assert ohlc_cache.get_month("2330", 2026, 9, NOW)[-1].close == 605
@@ -0,0 +1,33 @@
+from order_journal import OrderJournal, batch_digest, batch_id
+
+
+def write_csv(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_journal_stores_full_digest(tmp_path):
+    digest = batch_digest(write_csv(tmp_path / "a.csv", "2330,1000,600\n"), "20261019")
+    journal = OrderJournal(batch_id(digest), digest, directory=str(tmp_path / "journal"))
+    journal.record("intent", 2, user_def="X", code="2330")
+    journal.record("ack", 2, user_def="X", code="2330")
+    journal.close()
+
+    resumed = OrderJournal(batch_id(digest), digest, directory=str(tmp_path / "journal"))
+    assert resumed.stored_digest() == digest
+    assert resumed.matches()
+    assert list(resumed.states()) == [2]
+    assert resumed.states()[2]["event"] == "ack"
+
+
+def test_colliding_batch_id_does_not_match(tmp_path):
+    directory = str(tmp_path / "journal")
+    first = batch_digest(write_csv(tmp_path / "a.csv", "2330,1000,600\n"), "20261019")
+    journal = OrderJournal("ABCD", first, directory=directory)
+    journal.record("intent", 2, user_def="X", code="2330")
+    journal.close()
+
+    # 另一份 CSV 的短代號相同 (模擬 16 bits 碰撞)，完整摘要不同
+    other = batch_digest(write_csv(tmp_path / "b.csv", "2317,1000,100\n"), "20261019")
+    assert other != first
+    assert not OrderJournal("ABCD", other, directory=directory).matches()
@@ -0,0 +1,53 @@
+from datetime import date, datetime, timedelta
+
+import pretrade
+
+
+class FakeSnapshot:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def quotes(self, market, type):
+        return self.payload if market == "TSE" else {"data": []}
+
+
+class FakeRest:
+    def __init__(self, payload):
+        self.snapshot = FakeSnapshot(payload)
+
+
+def micros(day):
+    return int(datetime.combine(day, datetime.min.time()).timestamp() * 1_000_000) + 1
+
+
+def load(monkeypatch, payload):
+    monkeypatch.setattr(pretrade, "get_shared_master", lambda: None)
+    return pretrade.load_references(FakeRest(payload))
+
+
+def test_previous_session_close_is_todays_reference(monkeypatch):
+    yesterday = date.today() - timedelta(days=1)
+    stock = {"symbol": "2330", "closePrice": 600, "change": 10, "lastUpdated": micros(yesterday)}
+    table = load(monkeypatch, {"date": yesterday.isoformat(), "data": [stock]})
+    assert table["2330"]["reference"] == 600
+    assert table["2330"]["limit_up"] == 660
+
+
+def test_today_session_uses_close_minus_change(monkeypatch):
+    stock = {"symbol": "2330", "closePrice": 600, "change": 10, "lastUpdated": micros(date.today())}
+    table = load(monkeypatch, {"date": date.today().isoformat(), "data": [stock]})
+    assert table["2330"]["reference"] == 590
+
+
+def test_unknown_session_is_skipped(monkeypatch):
+    table = load(monkeypatch, {"data": [{"symbol": "2330", "closePrice": 600, "change": 10}]})
+    assert "2330" not in table
+
+
+def test_etf_without_published_limits_skips_limit_check(monkeypatch):
+    stock = {"symbol": "00631L", "closePrice": 20, "change": 0, "lastUpdated": micros(date.today())}
+    table = load(monkeypatch, {"date": date.today().isoformat(), "data": [stock]})
+    assert table["00631L"]["limit_up"] is None
+
+    result = pretrade.validate_prices(["00631L"], [30.0], table)[0]
+    assert result["error"] is None
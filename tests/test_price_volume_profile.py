@@ -0,0 +1,47 @@
+from price_volume_profile import PriceVolumeProfile
+
+VOLUMES = {
+    "data": [
+        {"price": 100.5, "volume": 30, "volumeAtBid": 10, "volumeAtAsk": 20},
+        {"price": 100.0, "volume": 50, "volumeAtBid": 25, "volumeAtAsk": 25},
+        {"price": 99.5, "volume": 20, "volumeAtBid": 20, "volumeAtAsk": 0},
+    ]
+}
+
+
+def test_poc_and_sorted_levels_after_trades():
+    profile = PriceVolumeProfile.from_volumes(VOLUMES, "2330")
+    assert profile.point_of_control() == 100.0
+
+    profile.add_trade({"price": 101.0, "size": 5, "time": 1})
+    profile.add_trade({"price": 100.5, "size": 25, "time": 2})
+
+    assert profile.point_of_control() == 100.5
+    assert [r["price"] for r in profile.top_by_price(4)] == [101.0, 100.5, 100.0, 99.5]
+    assert [r["price"] for r in profile.top_by_volume(2)] == [100.5, 100.0]
+    assert profile.value_area(0.7)[:2] == (100.0, 100.5)
+
+
+def test_buffered_trades_replayed_after_seed():
+    profile = PriceVolumeProfile("2330")
+    profile.buffer()
+    # 訂閱後、volumes 回傳前的成交：累計量 100 已包含在初始資料中，105 則否
+    profile.add_trade({"price": 100.0, "size": 10, "volume": 100, "time": 1})
+    profile.add_trade({"price": 101.0, "size": 5, "volume": 105, "time": 2})
+    assert len(profile) == 0
+
+    profile.seed(VOLUMES)
+
+    assert profile.total_volume == 105
+    assert profile.level(101.0)["volume"] == 5
+    profile.add_trade({"price": 99.5, "size": 1, "volume": 106, "time": 3})
+    assert profile.total_volume == 106
+
+
+def test_stale_when_behind_quote():
+    profile = PriceVolumeProfile.from_volumes(VOLUMES, "2330")
+    profile.add_trade({"price": 100.0, "size": 1, "time": 1_000_000})
+
+    assert not profile.is_stale(None)
+    assert not profile.is_stale(1_000_000 + 5 * 1_000_000)
+    assert profile.is_stale(1_000_000 + 60 * 1_000_000)
@@ -0,0 +1,140 @@
+import threading
+import time
+
+from quote_provider import BrokerProvider, QuoteRouter
+
+
+class FakeProvider:
+    fallback = False
+
+    def __init__(self, name, answer):
+        self.name = name
+        self.answer = answer
+
+    def connect(self):
+        pass
+
+    def get(self, stock_id):
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return dict(self.answer, id=stock_id) if self.answer else None
+
+    def close(self):
+        pass
+
+
+class FakeQuoteApi:
+    def __init__(self, error=None):
+        self.error = error
+
+    def quote(self, symbol):
+        if self.error:
+            raise self.error
+        return {"lastPrice": 100, "date": "2026-10-19", "total": {"tradeVolume": 5}}
+
+
+class FakeSDK:
+    def __init__(self, error=None):
+        self.logouts = 0
+        self.realtime = 0
+        stock = type("Stock", (), {"intraday": FakeQuoteApi(error)})()
+        rest = type("Rest", (), {"stock": stock})()
+        self.marketdata = type("MarketData", (), {"rest_client": rest})()
+
+    def init_realtime(self):
+        self.realtime += 1
+
+    def logout(self):
+        self.logouts += 1
+        return True
+
+
+def test_no_data_is_not_an_error():
+    router = QuoteRouter([FakeProvider("empty", None)], stats_path=None)
+    for _ in range(5):
+        assert router.get("9999") is None
+    stats = router.stats["empty"]
+    assert stats["errors"] == 0
+    assert stats["error_rate"] == 0.0
+    assert stats["down_until"] == 0.0
+
+
+def test_transport_failures_count_and_fall_through():
+    router = QuoteRouter(
+        [FakeProvider("down", ConnectionError("timeout")), FakeProvider("up", {"close": 10})],
+        stats_path=None,
+    )
+    quote = router.get("2330")
+    assert quote["source"] == "up"
+    assert router.stats["down"]["errors"] == 1
+    assert router.stats["up"]["errors"] == 0
+
+
+def test_broker_not_found_is_no_data():
+    sdk = FakeSDK(error=Exception("Resource Not Found (404)"))
+    router = QuoteRouter([BrokerProvider(sdk)], stats_path=None)
+    assert router.get("9999") is None
+    assert router.stats["broker"]["errors"] == 0
+
+
+def test_broker_reuses_existing_session():
+    sdk = FakeSDK()
+    provider = BrokerProvider(sdk)
+    router = QuoteRouter([provider], stats_path=None)
+    assert router.get("2330")["close"] == 100
+    router.close()
+    assert sdk.realtime == 1
+    assert sdk.logouts == 0
+
+
+class FakeCache(FakeProvider):
+    fallback = True
+
+    def __init__(self, cached):
+        super().__init__("cache", None)
+        self.cached = cached
+
+    def peek(self, stock_id):
+        return dict(self.cached, id=stock_id) if self.cached else None
+
+
+def test_fresh_cache_served_before_live_sources():
+    live = FakeProvider("live", ConnectionError("should not be called"))
+    router = QuoteRouter([live, FakeCache({"close": 9})], stats_path=None)
+
+    quote = router.get("2330", intraday=False)
+
+    assert quote["source"] == "cache"
+    assert router.stats["live"]["requests"] == 0
+
+
+def test_intraday_skips_cache_peek():
+    router = QuoteRouter(
+        [FakeProvider("live", {"close": 10}), FakeCache({"close": 9})], stats_path=None
+    )
+    assert router.get("2330", intraday=True)["source"] == "live"
+
+
+def test_concurrency_limited_per_provider():
+    running = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class SlowProvider(FakeProvider):
+        def get(self, stock_id):
+            with lock:
+                running["now"] += 1
+                running["peak"] = max(running["peak"], running["now"])
+            time.sleep(0.02)
+            with lock:
+                running["now"] -= 1
+            return {"id": stock_id, "close": 1}
+
+    router = QuoteRouter([SlowProvider("live", None)], stats_path=None)
+    router.set_concurrency(2)
+    threads = [threading.Thread(target=router.get, args=(str(i), True)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert running["peak"] == 2
@@ -0,0 +1,91 @@
+import numpy as np
+
+from screen_rules import DEFAULT_RULES, RuleSet
+
+
+def _quote_metrics(rng):
+    """模擬第二階段取得即時報價後的指標 (尚未查詢 K 線)"""
+    return {
+        "volume": rng.uniform(1000, 20000),
+        "price": rng.uniform(10, 500),
+        "change_pct": rng.uniform(-10, 10),
+        "price_range": rng.uniform(0, 10),
+        "momentum": rng.uniform(0, 5),
+        "vwap_dev": rng.uniform(0, 2),
+        "breakthrough": bool(rng.integers(0, 2)),
+        "order_signal": bool(rng.integers(0, 2)),
+    }
+
+
+def _with_candles(metrics, rng):
+    return dict(metrics, vol_ratio=rng.uniform(0, 4))
+
+
+def test_bound_from_quote_never_below_final_score():
+    rules = RuleSet(
+        {
+            "required": DEFAULT_RULES["required"],
+            "bonus": DEFAULT_RULES["bonus"]
+            + [
+                {"when": "change_pct >= 3", "weight": 2},
+                {"when": "price < 50", "weight": -0.5},
+                {"when": "vol_ratio < 1", "weight": -3},
+            ],
+            "extra": DEFAULT_RULES["extra"],
+        }
+    )
+    rng = np.random.default_rng(0)
+
+    scored = 0
+    for _ in range(500):
+        metrics = _quote_metrics(rng)
+        bound = rules.upper_bound_one(metrics)
+        score = rules.score_one(_with_candles(metrics, rng))
+        if score is None:
+            continue
+        scored += 1
+        assert score["total_score"] <= bound
+
+    assert scored > 0
+
+
+def test_unknown_negative_weight_clause_does_not_lower_bound():
+    rules = RuleSet({"bonus": [{"when": "vol_ratio < 1", "weight": -3}, "volume > 0"]})
+    metrics = {"volume": 100}
+
+    bound = rules.upper_bound_one(metrics)
+    score = rules.score_one(dict(metrics, vol_ratio=2))
+
+    assert score["total_score"] == 1
+    assert bound >= 1
+
+
+def test_bound_prunes_weak_candidates():
+    rules = RuleSet(DEFAULT_RULES)
+    rng = np.random.default_rng(1)
+    bounds = [rules.upper_bound_one(_quote_metrics(rng)) for _ in range(200)]
+
+    max_score = sum(
+        c.weight for c in rules.required + rules.bonus + rules.extra
+    )
+    # 只有 K 線欄位未知，通過必要條件的股票上限也多半低於滿分，提早結束才有作用
+    finite = [b for b in bounds if np.isfinite(b)]
+    assert finite and min(finite) < max_score
+    assert any(np.isneginf(bounds))
+
+
+def test_failed_required_clause_has_no_bound():
+    rules = RuleSet(DEFAULT_RULES)
+    metrics = {"volume": 100, "price_range": 5}
+
+    assert rules.upper_bound_one(metrics) == float("-inf")
+
+
+def test_estimate_scores_use_snapshot_fields():
+    rules = RuleSet(DEFAULT_RULES)
+    low = {"volume": 5000, "price": 100, "change_pct": 1, "price_range": 3, "momentum": 0.5}
+    high = dict(low, momentum=2.0)
+
+    estimate = rules.estimate_scores([low, high])
+
+    assert estimate[1] - estimate[0] == 1
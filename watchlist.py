@@ -0,0 +1,393 @@
+import re
+import threading
+import time
+
+from login_helper import login
+from price_volume_profile import PriceVolumeProfile, attach_trade_stream
+from GaN import trade_profiles
+
+CONDITION_HELP = (
+    "條件格式：\n"
+    "• price>600 / price<550  價格突破/跌破\n"
+    "• vwap  股價穿越 VWAP\n"
+    "• rsi>70 / rsi<30  RSI 超過/低於\n"
+    "• kd  KD 黃金/死亡交叉"
+)
+
+_THRESHOLD_PATTERN = re.compile(r"^(price|rsi)\s*([<>])\s*([0-9]+(?:\.[0-9]+)?)$")
+
+
+def parse_condition(text):
+    """解析監控條件文字
+
+    Returns:
+        {"kind": price/rsi/vwap/kd, "op": ">"/"<"/None, "value": 數值或 None, "text": 正規化文字}
+    """
+    text = text.strip().lower().replace(" ", "")
+    if text in ("vwap", "kd"):
+        return {"kind": text, "op": None, "value": None, "text": text}
+
+    match = _THRESHOLD_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"無法辨識的條件 '{text}'\n{CONDITION_HELP}")
+    kind, op, value = match.group(1), match.group(2), float(match.group(3))
+    return {"kind": kind, "op": op, "value": value, "text": f"{kind}{op}{value:g}"}
+
+
+def _sign(value):
+    return 1 if value > 0 else -1 if value < 0 else 0
+
+
+RSI_PERIOD = 14
+KD_PERIOD = 9
+
+
+def _rsi_base(closes, period=RSI_PERIOD):
+    """歷史收盤的 RSI 平滑平均 (與 GaN.calculate_rsi 相同算法)
+
+    Returns:
+        (avg_gain, avg_loss, saturated)；資料不足以在加入今日後遞推時回傳 None。
+        saturated 表示起始平均跌幅為 0，calculate_rsi 此時固定回傳 100。
+    """
+    if len(closes) < period + 1:
+        return None
+    changes = [closes[i] - closes[i - 1] for i in range(1, len(closes))]
+    gains = [max(c, 0) for c in changes]
+    losses = [max(-c, 0) for c in changes]
+    avg_gain = sum(gains[:period]) / period
+    avg_loss = sum(losses[:period]) / period
+    saturated = avg_loss == 0
+    for i in range(period, len(changes)):
+        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+    return avg_gain, avg_loss, saturated
+
+
+def _kd_base(highs, lows, closes, period=KD_PERIOD):
+    """歷史日K的 K/D 值與最近 period-1 日高低 (與 GaN.calculate_kd 相同算法)
+
+    Returns:
+        (k, d, window_high, window_low)；資料不足時回傳 None
+    """
+    if len(closes) < period - 1:
+        return None
+    k_value = d_value = 50
+    for i in range(period - 1, len(closes)):
+        period_high = max(highs[i - period + 1 : i + 1])
+        period_low = min(lows[i - period + 1 : i + 1])
+        if period_high == period_low:
+            rsv = 50
+        else:
+            rsv = (closes[i] - period_low) / (period_high - period_low) * 100
+        k_value = (2 / 3) * k_value + (1 / 3) * rsv
+        d_value = (2 / 3) * d_value + (1 / 3) * k_value
+    window = period - 1
+    if window == 0:
+        return k_value, d_value, None, None
+    return k_value, d_value, max(highs[-window:]), min(lows[-window:])
+
+
+class SymbolState:
+    """單一股票的即時狀態：分價量表 (VWAP)、當日高低與日K歷史
+
+    RSI/KD 的歷史部分在建立時算好，每筆成交只以今日價格遞推一步 (O(1))。
+    lock 保護該檔的狀態與條件，不同股票的成交可同時處理。
+    """
+
+    def __init__(self, symbol, profile, history):
+        self.symbol = symbol
+        self.profile = profile
+        self.lock = threading.Lock()
+        closes, highs, lows = history
+        self.prev_close = closes[-1] if closes else None
+        self.rsi_base = _rsi_base(closes)
+        self.kd_base = _kd_base(highs, lows, closes)
+        self.last_price = None
+        self.day_high = None
+        self.day_low = None
+
+    def update(self, price):
+        self.last_price = price
+        self.day_high = price if self.day_high is None else max(self.day_high, price)
+        self.day_low = price if self.day_low is None else min(self.day_low, price)
+
+    def indicators(self):
+        """以即時價格取代今日收盤計算指標"""
+        values = {"price": self.last_price, "vwap": self.profile.vwap()}
+        if self.last_price is None or self.prev_close is None:
+            return values
+
+        if self.rsi_base is not None:
+            avg_gain, avg_loss, saturated = self.rsi_base
+            change = self.last_price - self.prev_close
+            avg_gain = (avg_gain * (RSI_PERIOD - 1) + max(change, 0)) / RSI_PERIOD
+            avg_loss = (avg_loss * (RSI_PERIOD - 1) + max(-change, 0)) / RSI_PERIOD
+            if saturated or avg_loss == 0:
+                values["rsi"] = 100
+            else:
+                values["rsi"] = 100 - (100 / (1 + avg_gain / avg_loss))
+
+        if self.kd_base is not None:
+            k_prev, d_prev, window_high, window_low = self.kd_base
+            period_high = self.day_high if window_high is None else max(window_high, self.day_high)
+            period_low = self.day_low if window_low is None else min(window_low, self.day_low)
+            if period_high == period_low:
+                rsv = 50
+            else:
+                rsv = (self.last_price - period_low) / (period_high - period_low) * 100
+            values["k"] = (2 / 3) * k_prev + (1 / 3) * rsv
+            values["d"] = (2 / 3) * d_prev + (1 / 3) * values["k"]
+        return values
+
+
+class Watchlist:
+    """串流監控：每檔股票只訂閱一次即時成交，所有聊天室的條件共用同一份狀態
+
+    條件採邊緣觸發，只有從不成立變為成立 (或交叉方向改變) 時才推播。
+    notify(chat_id, text) 會在 websocket 執行緒中被呼叫。
+    監控中股票的分價量表登記在 GaN.trade_profiles，同一程序內的分析可直接使用。
+
+    lock 只保護監控清單與狀態索引 (不在持有時做任何 I/O)；
+    各檔的指標與條件由 SymbolState.lock 保護，不同股票的成交互不阻塞；
+    load_lock 讓新增監控依序進行 (新增不頻繁)，同一檔只訂閱一次。
+    """
+
+    def __init__(self, notify, max_per_chat=20):
+        self.notify = notify
+        self.max_per_chat = max_per_chat
+        self.lock = threading.RLock()
+        self.session_lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.watches = {}  # symbol -> [watch]
+        self.states = {}  # symbol -> SymbolState
+        self.sdk = None
+        self.reststock = None
+        self.stock_ws = None
+
+    def _ensure_session(self):
+        with self.session_lock:
+            if self.sdk is not None:
+                return
+            sdk, _ = login()
+            sdk.init_realtime()
+            self.reststock = sdk.marketdata.rest_client.stock
+            self.stock_ws, _ = attach_trade_stream(sdk, [], trade_profiles, self.on_trade)
+            self.sdk = sdk
+
+    def _load_history(self, symbol):
+        """取得日K歷史 (不含今日)，作為 RSI/KD 的基礎"""
+        today = time.strftime("%Y-%m-%d")
+        from_date = time.strftime(
+            "%Y-%m-%d", time.localtime(time.time() - 60 * 24 * 3600)
+        )
+        data = self.reststock.historical.candles(
+            **{"symbol": symbol, "from": from_date, "to": today, "timeframe": "D"}
+        )
+        candles = [
+            c
+            for c in (data or {}).get("data", [])
+            if c.get("date") != today and c.get("close", 0) > 0
+        ]
+        return (
+            [c["close"] for c in candles],
+            [c.get("high", c["close"]) for c in candles],
+            [c.get("low", c["close"]) for c in candles],
+        )
+
+    def _load_symbol(self, symbol):
+        """第一次監控某檔時：先訂閱即時成交 (暫存)，再以 REST 建立初始狀態 (不持有 lock)
+
+        先訂閱再查詢 volumes，兩者之間的成交由分價量表暫存後補上，不會遺漏。
+        """
+        profile = PriceVolumeProfile(symbol)
+        profile.buffer()
+        trade_profiles[symbol] = profile
+        self.stock_ws.subscribe({"channel": "trades", "symbol": symbol})
+        try:
+            profile.seed(self.reststock.intraday.volumes(symbol=symbol))
+            state = SymbolState(symbol, profile, self._load_history(symbol))
+            quote = self.reststock.intraday.quote(symbol=symbol)
+        except Exception:
+            trade_profiles.pop(symbol, None)
+            self._unsubscribe(symbol)
+            raise
+        if quote:
+            price = quote.get("lastPrice") or quote.get("closePrice")
+            if price:
+                state.update(price)
+                state.day_high = quote.get("highPrice") or price
+                state.day_low = quote.get("lowPrice") or price
+        return state
+
+    def _unsubscribe(self, symbol):
+        try:
+            self.stock_ws.unsubscribe({"channel": "trades", "symbol": symbol})
+        except Exception:
+            pass
+
+    def _check_limits(self, chat_id, symbol, condition):
+        for watch in self.watches.get(symbol, []):
+            if watch["chat_id"] == chat_id and watch["text"] == condition["text"]:
+                raise ValueError(f"{symbol} {condition['text']} 已在監控中")
+        if len(self.list(chat_id)) >= self.max_per_chat:
+            raise ValueError(f"每個聊天室最多監控 {self.max_per_chat} 個條件")
+
+    def add(self, chat_id, symbol, condition_text):
+        """新增監控，回傳 watch (會阻塞於登入與初始資料查詢，但不影響成交處理)"""
+        condition = parse_condition(condition_text)
+
+        # 新增監控依序進行，同一檔不會重複訂閱；成交處理只用 lock，不受影響
+        with self.load_lock:
+            with self.lock:
+                self._check_limits(chat_id, symbol, condition)
+
+            # 登入與初始資料查詢在 lock 外進行
+            self._ensure_session()
+            new_state = None
+            while True:
+                with self.lock:
+                    state = self.states.get(symbol)
+                    if state is None and new_state is not None:
+                        state = new_state
+                        self.states[symbol] = state
+                    if state is not None:
+                        watch = dict(condition, chat_id=chat_id, symbol=symbol, state=None)
+                        with state.lock:
+                            # 以目前狀態初始化，避免新增當下就推播
+                            watch["state"] = self._condition_state(watch, state.indicators())
+                        self.watches.setdefault(symbol, []).append(watch)
+                        return watch
+                # 第一次監控，或查詢期間該檔已被移除
+                new_state = self._load_symbol(symbol)
+
+    def remove(self, chat_id, symbol, condition_text=None):
+        """移除監控，未指定條件時移除該檔全部條件，回傳移除數量"""
+        text = parse_condition(condition_text)["text"] if condition_text else None
+        with self.lock:
+            watches = self.watches.get(symbol, [])
+            kept = [
+                w
+                for w in watches
+                if w["chat_id"] != chat_id or (text is not None and w["text"] != text)
+            ]
+            removed = len(watches) - len(kept)
+            unsubscribe = False
+            if kept:
+                self.watches[symbol] = kept
+            elif symbol in self.watches:
+                del self.watches[symbol]
+                self.states.pop(symbol, None)
+                trade_profiles.pop(symbol, None)
+                unsubscribe = True
+
+        if unsubscribe:
+            self._unsubscribe(symbol)
+        return removed
+
+    def list(self, chat_id):
+        with self.lock:
+            return [
+                w
+                for watches in self.watches.values()
+                for w in watches
+                if w["chat_id"] == chat_id
+            ]
+
+    def on_trade(self, symbol, trade):
+        """處理一筆即時成交 (分價量表已由串流更新)，只評估該檔的條件"""
+        price = trade.get("price")
+        if not price:
+            return
+        with self.lock:
+            state = self.states.get(symbol)
+            watches = list(self.watches.get(symbol, []))
+        if state is None:
+            return
+
+        # 指標遞推與條件評估只鎖該檔
+        fired = []
+        with state.lock:
+            state.update(price)
+            values = state.indicators()
+            for watch in watches:
+                message = self._evaluate(watch, values)
+                if message:
+                    fired.append((watch["chat_id"], message))
+
+        # 推播在鎖外進行，避免阻塞其他成交
+        for chat_id, message in fired:
+            try:
+                self.notify(chat_id, message)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _condition_state(watch, values):
+        """條件目前狀態：門檻型為 True/False，交叉型為正負號，資料不足為 None"""
+        kind = watch["kind"]
+        if kind in ("price", "rsi"):
+            value = values.get(kind)
+            if value is None:
+                return None
+            return value > watch["value"] if watch["op"] == ">" else value < watch["value"]
+        if kind == "vwap":
+            if values.get("price") is None or values.get("vwap") is None:
+                return None
+            return _sign(values["price"] - values["vwap"])
+        if kind == "kd":
+            if values.get("k") is None:
+                return None
+            return _sign(values["k"] - values["d"])
+        return None
+
+    def _evaluate(self, watch, values):
+        """狀態改變時回傳推播訊息"""
+        previous = watch["state"]
+        current = self._condition_state(watch, values)
+        if current is None or (watch["op"] is None and current == 0):
+            return None
+        watch["state"] = current
+
+        symbol = watch["symbol"]
+        price = values.get("price")
+        kind = watch["kind"]
+
+        if kind in ("price", "rsi"):
+            if current and previous is False:
+                value = price if kind == "price" else values["rsi"]
+                return f"🔔 {symbol} {watch['text']} 觸發 (目前 {value:.2f}，價格 {price})"
+            return None
+
+        # 交叉型：正負號改變才推播 (剛好相等時維持原狀態)
+        if previous in (None, 0) or current == previous:
+            return None
+        if kind == "vwap":
+            direction = "站上" if current > 0 else "跌破"
+            return f"🔔 {symbol} 股價{direction} VWAP (價格 {price}，VWAP {values['vwap']:.2f})"
+        cross = "黃金交叉" if current > 0 else "死亡交叉"
+        return f"🔔 {symbol} KD {cross} (K:{values['k']:.1f} D:{values['d']:.1f}，價格 {price})"
+
+    def close(self):
+        """取消訂閱、關閉連線並登出"""
+        with self.load_lock:
+            with self.lock:
+                symbols = list(self.states)
+                for symbol in symbols:
+                    trade_profiles.pop(symbol, None)
+                self.watches.clear()
+                self.states.clear()
+        with self.session_lock:
+            if self.stock_ws is not None:
+                for symbol in symbols:
+                    self._unsubscribe(symbol)
+                try:
+                    self.stock_ws.disconnect()
+                except Exception:
+                    pass
+            self.stock_ws = None
+            if self.sdk is not None:
+                try:
+                    self.sdk.logout()
+                except Exception:
+                    pass
+            self.sdk = None